@@ -0,0 +1,133 @@
+"""
+経営分析（/api/analytics/*）の集計
+
+年ごとに出来高・原価をそれぞれ1回のGROUP BYで取得し、
+月別売上・粗利率推移・顧客別・担当者別・目標対比をまとめて計算する。
+計算結果は年単位で response_cache（名前空間 "analytics"）に保持し、
+原価・出来高・工事の更新時に破棄する。
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Project, MonthlyProgress, ProjectCostRollup
+from cache import response_cache
+
+SNAPSHOT_TTL = 600
+
+
+def get_snapshot(db: Session, year: int) -> dict:
+    """指定年の集計（保持していなければ計算する）"""
+    return response_cache.get_or_set(
+        ("analytics", year), lambda: build_snapshot(db, year), ttl=SNAPSHOT_TTL
+    )
+
+
+def build_snapshot(db: Session, year: int) -> dict:
+    """
+    出来高（指定年1月以降）と原価集計を工事×年月で1回ずつ取得し、1パスで各系列を作る
+
+    - 月別の売上・原価（指定年）
+    - 工事別の売上（指定年）・原価（全期間）
+    - 年月別の売上（指定年1月以降。目標対比の期首以降合計に使う）
+    """
+    months = [f"{year}-{m:02d}" for m in range(1, 13)]
+    first_month, last_month = months[0], months[-1]
+
+    monthly_sales = dict.fromkeys(months, 0)
+    monthly_cost = dict.fromkeys(months, 0)
+    project_sales = {}
+    project_cost = {}
+    sales_since = {}
+
+    progress_rows = db.query(
+        MonthlyProgress.project_id,
+        MonthlyProgress.year_month,
+        func.sum(MonthlyProgress.progress_amount),
+    ).filter(
+        MonthlyProgress.year_month >= first_month
+    ).group_by(MonthlyProgress.project_id, MonthlyProgress.year_month).all()
+
+    for project_id, year_month, amount in progress_rows:
+        amount = amount or 0
+        sales_since[year_month] = sales_since.get(year_month, 0) + amount
+        if year_month <= last_month:
+            monthly_sales[year_month] = monthly_sales.get(year_month, 0) + amount
+            project_sales[project_id] = project_sales.get(project_id, 0) + amount
+
+    cost_rows = db.query(
+        ProjectCostRollup.project_id,
+        ProjectCostRollup.year_month,
+        func.sum(ProjectCostRollup.amount),
+    ).group_by(ProjectCostRollup.project_id, ProjectCostRollup.year_month).all()
+
+    for project_id, year_month, amount in cost_rows:
+        amount = amount or 0
+        project_cost[project_id] = project_cost.get(project_id, 0) + amount
+        if year_month in monthly_cost:
+            monthly_cost[year_month] += amount
+
+    projects = db.query(
+        Project.id, Project.client, Project.site_person, Project.sales_person
+    ).all()
+
+    # 顧客別・担当者別（売上のない工事も0件として含める）
+    client_sales = {}
+    person_profit = {}
+    for p in projects:
+        sales = project_sales.get(p.id, 0)
+        cost = project_cost.get(p.id, 0)
+
+        client = p.client or "その他"
+        client_sales[client] = client_sales.get(client, 0) + sales
+
+        person = p.site_person or p.sales_person or "未割当"
+        if person not in person_profit:
+            person_profit[person] = {"sales": 0, "cost": 0, "profit": 0}
+        person_profit[person]["sales"] += sales
+        person_profit[person]["cost"] += cost
+        person_profit[person]["profit"] += sales - cost
+
+    monthly = []
+    for year_month in months:
+        sales = monthly_sales[year_month]
+        cost = monthly_cost[year_month]
+        profit = sales - cost
+        monthly.append({
+            "month": year_month,
+            "sales": sales,
+            "cost": cost,
+            "profit": profit,
+            "profit_rate": round(profit / sales * 100, 1) if sales > 0 else 0,
+        })
+
+    return {
+        "year": year,
+        "monthly": monthly,
+        "client_breakdown": [
+            {"client": k, "sales": v}
+            for k, v in sorted(client_sales.items(), key=lambda x: -x[1])
+        ],
+        "person_ranking": [
+            {"person": k, **v}
+            for k, v in sorted(person_profit.items(), key=lambda x: -x[1]["profit"])
+        ],
+        "sales_since": sales_since,
+    }
+
+
+def monthly_sales(snapshot: dict) -> list:
+    return [
+        {"month": m["month"], "sales": m["sales"], "cost": m["cost"], "profit": m["profit"]}
+        for m in snapshot["monthly"]
+    ]
+
+
+def profit_trend(snapshot: dict) -> list:
+    return [
+        {"month": m["month"], "profit": m["profit"], "profit_rate": m["profit_rate"]}
+        for m in snapshot["monthly"]
+    ]
+
+
+def sales_since(snapshot: dict, year_month: str) -> int:
+    """year_month 以降の出来高合計（snapshot の年の1月以降であること）"""
+    return sum(v for k, v in snapshot["sales_since"].items() if k >= year_month)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+主要APIのベンチマーク（性能劣化の検知用）
+
+一時ディレクトリの SQLite に generate_test_data で大規模データを作り、アプリをプロセス内で起動して
+（TestClient）重いAPIを計測する。ケースごとに以下を記録し、基準（JSON）と比べて劣化していれば
+終了コード 1 で終わる。
+
+- 応答時間の p50 / p95（--repeat 回。応答キャッシュは毎回消して実処理を計測する。
+  大量データを読み込んだ後は GC の停止が数十ミリ秒あり結果がぶれるため、毎回の前に gc.collect() する）
+- 1リクエストあたりのSQL文の数（sql_stats で計測。データが同じなら毎回同じ値になる）
+- ピークメモリ（tracemalloc。別に1回だけ実行して計測する）
+
+プロセスプールで実行する処理（複数見積のzip出力の各Excel作成など）のSQL・メモリは含まない。
+
+    python benchmark.py                                  # 計測して benchmark_baseline.json と比較
+    python benchmark.py --update-baseline                # 計測結果を基準として保存
+    python benchmark.py --projects 5000 --costs 2000000 --workers 500 --years 3 --baseline large.json
+    python benchmark.py --only analytics                 # 名前に analytics を含むケースだけ
+
+基準はマシンによって変わるため、比較は同じマシン・同じデータ量の結果どうしで行う。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from dateutil.relativedelta import relativedelta
+
+BASELINE_FILE = "benchmark_baseline.json"
+
+
+def parse_args(argv=None):
+    # models を読み込むと DB に接続するため、DATABASE_URL を切り替えてから読み込む
+    from generate_test_data import add_size_arguments
+
+    parser = argparse.ArgumentParser(description="主要APIのベンチマーク")
+    add_size_arguments(parser)
+    # 数分で終わる規模を既定にする。基準日を固定して毎回同じデータにする
+    parser.set_defaults(projects=500, workers=100, years=2, costs=200000, end_date=date(2025, 3, 31))
+    parser.add_argument("--repeat", type=int, default=10, help="ケースごとの計測回数（別に1回ウォームアップ）")
+    parser.add_argument("--only", default=None, help="名前にこの文字列を含むケースだけ実行")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基準のJSONファイル")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果を基準として保存する")
+    parser.add_argument("--output", default=None, help="計測結果を保存するJSONファイル")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="p50 の許容増加率")
+    parser.add_argument("--p95-threshold", type=float, default=0.5, help="p95 の許容増加率（p50 よりぶれやすい）")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="ピークメモリの許容増加率")
+    parser.add_argument("--min-time-ms", type=float, default=10.0,
+                        help="これ未満の時間の増加は誤差として扱う（ミリ秒）")
+    return parser.parse_args(argv)
+
+
+# 基準と比べる条件（違えば比較しない）
+DATA_KEYS = ["projects", "workers", "years", "costs", "payables", "messages", "photos",
+             "expenses", "quotes", "attendance_rate", "end_date", "seed"]
+
+
+def data_settings(args) -> dict:
+    return {key: str(getattr(args, key)) for key in DATA_KEYS}
+
+
+def build_cases(args, client) -> list:
+    """(名前, メソッド, URL, requests の引数) の一覧"""
+    end = args.end_date
+    year_month = end.strftime("%Y-%m")
+    first_month = (end.replace(day=1) - relativedelta(months=11)).strftime("%Y-%m")
+    year = end.year
+
+    # Excel の出力・取込は、生成データの工事を出力したファイルを使う
+    project_id = client.get("/api/projects").json()[0]["id"]
+    project_ids = [p["id"] for p in client.get("/api/projects").json()[:20]]
+    workbook = client.post(f"/api/projects/{project_id}/export-estimate").content
+
+    def upload():
+        return {"files": {"file": ("estimate.xlsx", workbook)}}
+
+    return [
+        ("projects", "GET", "/api/projects", {}),
+        ("dashboard", "GET", "/api/dashboard", {}),
+        ("analytics/monthly-sales", "GET", f"/api/analytics/monthly-sales?year={year}", {}),
+        ("analytics/client-breakdown", "GET", f"/api/analytics/client-breakdown?year={year}", {}),
+        ("analytics/person-ranking", "GET", f"/api/analytics/person-ranking?year={year}", {}),
+        ("analytics/target-vs-actual", "GET", "/api/analytics/target-vs-actual", {}),
+        ("analytics/profit-trend", "GET", f"/api/analytics/profit-trend?year={year}", {}),
+        ("cashflow", "GET", f"/api/cashflow/?year_month={year_month}", {}),
+        ("attendances/summary", "GET", f"/api/attendances/summary?month={year_month}", {}),
+        ("attendances/summary-12months", "GET",
+         f"/api/attendances/summary?start_month={first_month}&end_month={year_month}", {}),
+        ("quotes", "GET", "/api/quotes", {}),
+        ("quotes-page", "GET", "/api/quotes?limit=50&include_items=false", {}),
+        ("export/yayoi", "GET", f"/api/export/yayoi?year_month={year_month}", {}),
+        ("export/freee", "GET", f"/api/export/freee?year_month={year_month}", {}),
+        ("export/moneyforward", "GET", f"/api/export/moneyforward?year_month={year_month}", {}),
+        ("excel/export-estimate", "POST", f"/api/projects/{project_id}/export-estimate", {}),
+        ("excel/export-estimates-zip", "POST", "/api/projects/export-estimates", {"json": {"project_ids": project_ids}}),
+        ("excel/import-estimate", "POST", "/api/projects/import-estimate?dry_run=true", upload),
+    ]
+
+
+def percentile(values: list, p: float) -> float:
+    """線形補間のパーセンタイル（p は 0〜100）"""
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def run_case(client, case, repeat: int) -> dict:
+    from cache import response_cache
+    import sql_stats
+
+    name, method, url, options = case
+
+    def request():
+        response_cache.clear()
+        kwargs = options() if callable(options) else options
+        response = client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name}: {response.status_code} {response.text[:200]}")
+        return response
+
+    request()  # ウォームアップ
+    sql_stats.reset()
+    times = []
+    size = 0
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        size = len(request().content)
+        times.append((time.perf_counter() - started) * 1000)
+    routes = sql_stats.snapshot()
+
+    tracemalloc.start()
+    request()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(times, 50), 2),
+        "p95_ms": round(percentile(times, 95), 2),
+        "mean_ms": round(statistics.mean(times), 2),
+        "statements": max((r["max_statements"] for r in routes), default=0),
+        "n_plus_one": sum(r["n_plus_one_requests"] for r in routes),
+        "peak_memory_kb": round(peak / 1024),
+        "response_bytes": size,
+    }
+
+
+def compare(results: dict, baseline: dict, args) -> list:
+    """基準より劣化した項目の説明の一覧"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key, threshold in (("p50_ms", args.time_threshold), ("p95_ms", args.p95_threshold)):
+            limit = base[key] * (1 + threshold)
+            if current[key] > limit and current[key] - base[key] > args.min_time_ms:
+                regressions.append(f"{name}: {key} {base[key]} -> {current[key]}")
+        # SQL の数は同じデータなら一定なので、1文でも増えたら劣化とみなす
+        if current["statements"] > base["statements"]:
+            regressions.append(f"{name}: statements {base['statements']} -> {current['statements']}")
+        if current["n_plus_one"] > base.get("n_plus_one", 0):
+            regressions.append(f"{name}: N+1 {base.get('n_plus_one', 0)} -> {current['n_plus_one']}")
+        if current["peak_memory_kb"] > base["peak_memory_kb"] * (1 + args.memory_threshold):
+            regressions.append(f"{name}: peak_memory_kb {base['peak_memory_kb']} -> {current['peak_memory_kb']}")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    print(f"{'ケース':<32}{'p50(ms)':>10}{'p95(ms)':>10}{'基準p95':>10}{'SQL':>6}{'メモリ(KB)':>12}")
+    for name, r in results.items():
+        base = baseline.get(name, {})
+        print(f"{name:<34}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{base.get('p95_ms', '-'):>10}"
+              f"{r['statements']:>6}{r['peak_memory_kb']:>12,}")
+
+
+def main(argv=None) -> int:
+    workdir = tempfile.mkdtemp(prefix="sanyu-bench-")
+    # database / main の読み込み前に接続先などを切り替える
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["PDF_CACHE_DIR"] = os.path.join(workdir, "pdf_cache")
+    os.environ["SQL_STATS"] = "1"
+    try:
+        args = parse_args(argv)
+        from database import Base, SessionLocal, engine
+        import generate_test_data
+        import migrations
+
+        Base.metadata.create_all(bind=engine)
+        migrations.upgrade(engine)
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            generate_test_data.generate(db, args)
+        print(f"テストデータ作成 {time.perf_counter() - started:.1f}秒\n")
+
+        from fastapi.testclient import TestClient
+        from main import app
+
+        results = {}
+        with TestClient(app) as client:
+            for case in build_cases(args, client):
+                if args.only and args.only not in case[0]:
+                    continue
+                results[case[0]] = run_case(client, case, args.repeat)
+                print(f"{case[0]}: p95 {results[case[0]]['p95_ms']}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "data": data_settings(args),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    print_table(results, (baseline or {}).get("results", {}))
+
+    if baseline is None:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基準を保存しました: {args.baseline}")
+        return 0
+
+    if baseline.get("data") != report["data"]:
+        print(f"\n基準とデータの条件が違うため比較できません: {baseline.get('data')}")
+        return 2
+
+    regressions = compare(results, baseline["results"], args)
+    if regressions:
+        print(f"\n基準より劣化しています（{len(regressions)}件）:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n劣化はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
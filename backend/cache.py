@@ -0,0 +1,87 @@
+"""
+プロセス内のレスポンスキャッシュ（TTL + LRU）
+
+ホーム画面が定期的に取得するダッシュボード・件数系APIの結果を保持し、
+同じ内容の問い合わせが多数の端末から来ても SQLite に毎回問い合わせないようにする。
+
+キーは (名前空間, 引数...) のタプル。書き込み側のAPIは名前空間単位で破棄する。
+ワーカープロセスごとのキャッシュなので、他プロセスからの更新は TTL 経過で反映される。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """有効期限つきのLRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (期限, 値)
+        self._generations = {}  # 名前空間 -> 破棄回数
+        self._epoch = 0  # clear() の回数
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: tuple, value, ttl: float = None, token=None):
+        """保存。token（version() の戻り値）を渡すと、その後に破棄された場合は保存しない"""
+        with self._lock:
+            if token is not None and token != self._version(key[0]):
+                return
+            self._store(key, value, ttl)
+
+    def version(self, namespace: str):
+        """名前空間の現在の版（非同期で値を作る場合に set() の token として使う）"""
+        with self._lock:
+            return self._version(namespace)
+
+    def _version(self, namespace):
+        return (self._epoch, self._generations.get(namespace, 0))
+
+    def _store(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_set(self, key: tuple, compute, ttl: float = None):
+        """キャッシュがあれば返し、なければ compute() の結果を保存して返す"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                return entry[1]
+            generation = self._version(key[0])
+
+        value = compute()
+
+        with self._lock:
+            # 計算中に破棄された場合は古い結果を保存しない
+            if self._version(key[0]) == generation:
+                self._store(key, value, ttl)
+        return value
+
+    def invalidate(self, *namespaces: str):
+        """指定した名前空間のキーをすべて破棄"""
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [k for k in self._data if k[0] in namespaces]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+
+response_cache = TTLCache(maxsize=512, ttl=30)
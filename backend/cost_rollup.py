@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+原価集計テーブル（project_cost_rollups）の更新・再構築
+
+costs への登録・削除時に工事別・費目別・月別の合計を差分更新する。
+集計がずれた場合はコマンドで確認・再構築できる。
+
+    python cost_rollup.py verify    # costs との差分を表示（差分があれば終了コード1）
+    python cost_rollup.py rebuild   # costs から全件作り直す
+"""
+import sys
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from database import upsert_insert, year_month as sql_year_month
+from models import Cost, ProjectCostRollup
+
+
+def _year_month(d):
+    return d.strftime("%Y-%m")
+
+
+def _key_filter(project_id, category, year_month):
+    return (
+        ProjectCostRollup.project_id == project_id,
+        ProjectCostRollup.category == category,
+        ProjectCostRollup.year_month == year_month,
+    )
+
+
+def apply_cost(db: Session, cost: Cost, sign: int = 1):
+    """原価1件分を集計に加算（sign=-1で減算）。コミットは呼び出し側で行う"""
+    if not cost.date:
+        return
+    year_month = _year_month(cost.date)
+    amount = (cost.amount or 0) * sign
+
+    if sign > 0:
+        # 同じ工事・費目・月に同時に登録されても一意制約違反にならないよう、追加と加算を1文で行う
+        stmt = upsert_insert(db.get_bind(), ProjectCostRollup).values(
+            project_id=cost.project_id,
+            category=cost.category,
+            year_month=year_month,
+            amount=amount,
+            cost_count=1,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["project_id", "category", "year_month"],
+            set_={
+                "amount": ProjectCostRollup.amount + stmt.excluded.amount,
+                "cost_count": ProjectCostRollup.cost_count + 1,
+                "updated_at": func.now(),
+            },
+        ))
+        return
+
+    key = _key_filter(cost.project_id, cost.category, year_month)
+    db.query(ProjectCostRollup).filter(*key).update({
+        ProjectCostRollup.amount: ProjectCostRollup.amount + amount,
+        ProjectCostRollup.cost_count: ProjectCostRollup.cost_count + sign,
+    }, synchronize_session=False)
+    # 原価が0件になった集計行は削除
+    db.query(ProjectCostRollup).filter(
+        *key, ProjectCostRollup.cost_count <= 0
+    ).delete(synchronize_session=False)
+
+
+def remove_project(db: Session, project_id: int):
+    """工事削除時に集計行をまとめて削除"""
+    db.query(ProjectCostRollup).filter(
+        ProjectCostRollup.project_id == project_id
+    ).delete(synchronize_session=False)
+
+
+def _aggregate_costs():
+    """costs を工事・費目・月で集計するSELECT"""
+    year_month = sql_year_month(Cost.date)
+    return select(
+        Cost.project_id,
+        Cost.category,
+        year_month.label("year_month"),
+        func.coalesce(func.sum(Cost.amount), 0).label("amount"),
+        func.count(Cost.id).label("cost_count"),
+    ).where(Cost.date.isnot(None)).group_by(Cost.project_id, Cost.category, year_month)
+
+
+def rebuild(db: Session) -> int:
+    """集計テーブルを costs から作り直す。作成した行数を返す"""
+    db.query(ProjectCostRollup).delete(synchronize_session=False)
+    db.execute(insert(ProjectCostRollup).from_select(
+        ["project_id", "category", "year_month", "amount", "cost_count"],
+        _aggregate_costs()
+    ))
+    db.commit()
+    return db.query(ProjectCostRollup).count()
+
+
+def verify(db: Session) -> list:
+    """costs の集計と集計テーブルの差分を返す（差分なしなら空リスト）"""
+    expected = {
+        (r.project_id, r.category, r.year_month): (r.amount, r.cost_count)
+        for r in db.execute(_aggregate_costs())
+    }
+    actual = {
+        (r.project_id, r.category, r.year_month): (r.amount or 0, r.cost_count or 0)
+        for r in db.query(ProjectCostRollup).all()
+    }
+    drifts = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1] or "", k[2])):
+        exp = expected.get(key, (0, 0))
+        act = actual.get(key, (0, 0))
+        if exp != act:
+            drifts.append({
+                "project_id": key[0], "category": key[1], "year_month": key[2],
+                "expected_amount": exp[0], "actual_amount": act[0],
+                "expected_count": exp[1], "actual_count": act[1],
+            })
+    return drifts
+
+
+def ensure_built(db: Session):
+    """集計テーブルが空で原価が存在する場合（導入直後など）に初期構築する"""
+    if db.query(ProjectCostRollup.id).first() is None and db.query(Cost.id).first() is not None:
+        rebuild(db)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine, Base
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if command == "rebuild":
+            count = rebuild(db)
+            print(f"原価集計を再構築しました（{count}行）")
+        elif command == "verify":
+            drifts = verify(db)
+            for d in drifts:
+                print(f"差分: {d}")
+            if drifts:
+                print(f"原価集計に {len(drifts)}件 の差分があります（rebuild で修正できます）")
+                sys.exit(1)
+            print("原価集計は costs と一致しています")
+        else:
+            print(f"不明なコマンド: {command}（verify / rebuild）")
+            sys.exit(2)
+    finally:
+        db.close()
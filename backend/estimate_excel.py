@@ -0,0 +1,352 @@
+"""
+見積書Excelの作成（御見積書・内訳明細書・施工条件書）
+
+書式（フォント・塗り・罫線・配置）はモジュール読込時に1回だけ作り、
+ワークブックごとに書式IDを1回登録したらあとはセルに割り当てるだけにする。
+シートは上から1行ずつ書くため、明細が多い場合は write_only モード（行を書いた端から
+ファイルに出力する）でも同じ内容を作れる。出力はファイルではなくメモリ（BytesIO）に行う。
+"""
+from copy import copy
+from io import BytesIO
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+# 明細行の合計がこれを超える場合は write_only モードで作成する
+WRITE_ONLY_THRESHOLD = 2000
+
+CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class CellStyle:
+    """セルの書式一式（値を持たないので、同じ書式のセルすべてで共有する）"""
+    __slots__ = ("font", "fill", "border", "alignment", "number_format")
+
+    def __init__(self, font=None, fill=None, border=None, alignment=None, number_format=None):
+        self.font = font
+        self.fill = fill
+        self.border = border
+        self.alignment = alignment
+        self.number_format = number_format
+
+    def apply(self, cell):
+        if self.font is not None:
+            cell.font = self.font
+        if self.fill is not None:
+            cell.fill = self.fill
+        if self.border is not None:
+            cell.border = self.border
+        if self.alignment is not None:
+            cell.alignment = self.alignment
+        if self.number_format is not None:
+            cell.number_format = self.number_format
+
+
+# ---------- 書式 ----------
+
+THIN = Side(style='thin', color='000000')
+BORDER_ALL = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+BLACK_FILL = PatternFill('solid', fgColor='000000')
+YELLOW_FILL = PatternFill('solid', fgColor='FFFF99')
+RED_FONT = Font(size=10, color='FF0000')
+CENTER = Alignment(horizontal='center')
+RIGHT = Alignment(horizontal='right')
+MIDDLE = Alignment(horizontal='center', vertical='center')
+YEN = '#,##0'
+
+PLAIN = CellStyle()
+BOLD_11 = CellStyle(font=Font(size=11, bold=True))
+TEXT_RIGHT = CellStyle(alignment=RIGHT)
+SMALL = CellStyle(font=Font(size=9))
+GRAND_LABEL = CellStyle(font=Font(size=12, bold=True))
+GRAND_AMOUNT = CellStyle(font=Font(size=14, bold=True), alignment=RIGHT)
+
+COVER_TITLE = CellStyle(font=Font(size=16, bold=True, color='FFFFFF'), fill=BLACK_FILL, alignment=MIDDLE)
+SHEET_TITLE = CellStyle(font=Font(size=14, bold=True, color='FFFFFF'), fill=BLACK_FILL, alignment=MIDDLE)
+COVER_HEADER = CellStyle(font=Font(size=9, color='FFFFFF', bold=True), fill=BLACK_FILL, border=BORDER_ALL, alignment=MIDDLE)
+DETAIL_HEADER = CellStyle(font=Font(size=9, bold=True), fill=YELLOW_FILL, border=BORDER_ALL, alignment=MIDDLE)
+WORK_TYPE_TITLE = CellStyle(font=Font(size=10, bold=True), fill=YELLOW_FILL, border=BORDER_ALL)
+
+BOX = CellStyle(border=BORDER_ALL)
+BOX_CENTER = CellStyle(border=BORDER_ALL, alignment=CENTER)
+BOX_RIGHT = CellStyle(border=BORDER_ALL, alignment=RIGHT)
+BOX_YEN = CellStyle(border=BORDER_ALL, alignment=RIGHT, number_format=YEN)
+BOX_YEN_RED = CellStyle(font=RED_FONT, border=BORDER_ALL, alignment=RIGHT, number_format=YEN)
+BOX_WRAP = CellStyle(border=BORDER_ALL, alignment=Alignment(wrap_text=True))
+BOX_BOLD = CellStyle(font=Font(bold=True), border=BORDER_ALL)
+BOX_YEN_BOLD = CellStyle(font=Font(bold=True), border=BORDER_ALL, alignment=RIGHT, number_format=YEN)
+BOX_BOLD_10 = CellStyle(font=Font(size=10, bold=True), border=BORDER_ALL)
+BOX_YEN_BOLD_10 = CellStyle(font=Font(size=10, bold=True), border=BORDER_ALL, alignment=RIGHT, number_format=YEN)
+
+EMPTY_BOX = ("", BOX)
+
+
+class _SheetWriter:
+    """
+    シートを上から1行ずつ書く（通常のワークシートと write_only のワークシートの両方に対応）
+
+    書式はワークブックで1回だけ登録し、2回目以降は登録済みの書式ID（StyleArray）を
+    セルにコピーする（Font 等をセルごとに設定すると毎回ハッシュ計算と検索が走るため）。
+    """
+
+    def __init__(self, ws, style_ids: dict, write_only: bool):
+        self.ws = ws
+        self.style_ids = style_ids
+        self.write_only = write_only
+        self.row_no = 0
+
+    def widths(self, widths: dict):
+        for col, width in widths.items():
+            self.ws.column_dimensions[col].width = width
+
+    def skip(self, count: int = 1):
+        for _ in range(count):
+            self.row(())
+
+    def row(self, cells, merge=(), height=None):
+        """
+        次の行を書く
+
+        cells: 列順の (値, CellStyle)。None の列は書かない。値が None なら書式だけ設定する。
+        merge: 結合する列範囲（例: ("B", "E")）
+        """
+        self.row_no += 1
+        r = self.row_no
+        if height is not None:
+            self.ws.row_dimensions[r].height = height
+        refs = [f"{start}{r}:{end}{r}" for start, end in merge]
+
+        if self.write_only:
+            for ref in refs:
+                self.ws.merged_cells.add(ref)
+            self.ws.append([self._write_only_cell(spec) for spec in cells])
+            return
+
+        for ref in refs:
+            self.ws.merge_cells(ref)
+        for col, spec in enumerate(cells, 1):
+            if spec is None:
+                continue
+            value, style = spec
+            cell = self.ws.cell(row=r, column=col)
+            if value is not None:
+                cell.value = value
+            self._style(cell, style)
+
+    def _write_only_cell(self, spec):
+        if spec is None:
+            return None
+        value, style = spec
+        cell = WriteOnlyCell(self.ws, value=value)
+        self._style(cell, style)
+        return cell
+
+    def _style(self, cell, style: CellStyle):
+        if style is PLAIN:
+            return
+        style_array = self.style_ids.get(style)
+        if style_array is None:
+            style.apply(cell)
+            self.style_ids[style] = copy(cell._style)
+        else:
+            cell._style = copy(style_array)
+
+
+# ---------- シート ----------
+
+def create_cover_sheet(sheet: _SheetWriter, data):
+    """御見積書（表紙）シート作成"""
+    sheet.widths({'A': 10, 'B': 12, 'C': 18, 'D': 10, 'E': 6, 'F': 6, 'G': 12, 'H': 10, 'I': 12})
+    company = data['company_info']
+    info = data['estimate_info']
+
+    sheet.row([("御 見 積 書", COVER_TITLE)], merge=[("A", "I")], height=30)
+    sheet.row([(f"{info['to_company']}　御中", BOLD_11), None, None, None, None, None, (company['name'], BOLD_11)],
+              merge=[("A", "E")])
+    for value in (company['postal'], company['address'], f"{company['tel']}  {company['fax']}"):
+        sheet.row([None] * 6 + [(value, PLAIN)])
+    sheet.skip()
+
+    for label, value in [("【工 事 名】", info.get('project_name', '')),
+                         ("【工事場所】", info.get('project_location', '')),
+                         ("【工　　期】", info.get('period', '')),
+                         ("【支払条件】", info.get('payment_terms', '')),
+                         ("【受渡条件】", info.get('delivery_terms', '')),
+                         ("【担 当 者】", info.get('contact', ''))]:
+        sheet.row([(label, PLAIN), (value, PLAIN)], merge=[("B", "E")])
+    sheet.skip()
+
+    for text in ("毎度、格別の御引立を賜り有難うございます。",
+                 "御依頼を戴きました本件に付き、誠心誠意検討を加え御見積申し上げましたので",
+                 "是非御下命賜ります様、お願い申し上げます。"):
+        sheet.row([(text, PLAIN)], merge=[("A", "H")])
+    sheet.skip()
+
+    subtotal = info.get('subtotal', 0)
+    tax_rate = info.get('tax_rate', 0.10)
+    tax = int(subtotal * tax_rate)
+    total = subtotal + tax
+
+    sheet.row([None, None, ("小 計 金 額", PLAIN), None, None, (f"¥{subtotal:,}", TEXT_RIGHT)])
+    sheet.row([None, None, (f"消費税({int(tax_rate*100)}%)", PLAIN), None, None, (f"¥{tax:,}", TEXT_RIGHT)])
+    sheet.row([None, None, ("合 計 金 額", GRAND_LABEL), None, None, (f"¥{total:,}", GRAND_AMOUNT)],
+              merge=[("C", "D"), ("F", "G")])
+    sheet.skip()
+
+    headers = ["No.", "名　称", "仕様・規格・寸法", "設計", "数量", "単位", "金額", "単価", "備考"]
+    sheet.row([(h, COVER_HEADER) for h in headers])
+
+    for idx, wt in enumerate(data['work_types'], 1):
+        sheet.row([
+            (idx, BOX_CENTER),
+            (wt['name'], BOX),
+            (wt.get('spec', '') or "内訳書別添え", BOX),
+            EMPTY_BOX,
+            (wt.get('quantity', 1), BOX_CENTER),
+            (wt.get('unit', '式'), BOX_CENTER),
+            (wt.get('amount', 0), BOX_YEN),
+            EMPTY_BOX,
+            EMPTY_BOX,
+        ])
+
+    for _ in range(2):
+        sheet.row([EMPTY_BOX] * 9)
+
+    sheet.row([
+        EMPTY_BOX,
+        ("合　計（税抜）", BOX_BOLD),
+        (None, BOX), (None, BOX), (None, BOX), (None, BOX),
+        (subtotal, BOX_YEN_BOLD),
+        EMPTY_BOX,
+        EMPTY_BOX,
+    ], merge=[("B", "F")])
+
+
+def _summary_row(sheet, name, note, unit, unit_price, amount, amount_style=BOX_YEN, note_cell=EMPTY_BOX):
+    """内訳明細書の集計行（機械回送費・諸経費など。数量は1.0）"""
+    sheet.row([
+        (name, BOX),
+        (note, BOX),
+        (1.0, BOX),
+        (unit, BOX_CENTER),
+        (unit_price, BOX_YEN) if unit_price != "" else EMPTY_BOX,
+        (amount, amount_style),
+        note_cell,
+    ])
+
+
+def create_breakdown_sheet(sheet: _SheetWriter, work_type, sheet_num, company_info):
+    """内訳明細書シート作成"""
+    sheet.widths({'A': 18, 'B': 22, 'C': 8, 'D': 6, 'E': 10, 'F': 12, 'G': 18})
+
+    sheet.row([("内 訳 明 細 書", SHEET_TITLE)], merge=[("A", "G")], height=25)
+    sheet.skip()
+
+    headers = ["名　称", "規　格", "数量", "単位", "単価", "金額", "備　考"]
+    sheet.row([(h, DETAIL_HEADER) for h in headers])
+    sheet.row([(work_type['name'], WORK_TYPE_TITLE)] + [(None, BOX)] * 6, merge=[("A", "G")])
+
+    category = work_type.get('category', '')
+    sheet.row([(category, SMALL)] if category else [])
+
+    direct_cost = 0
+    for item in work_type.get('items', []):
+        qty = item.get('quantity', 0)
+        unit_price = item.get('unit_price', 0)
+        amount = item.get('amount', 0)
+        sheet.row([
+            (item.get('name', ''), BOX),
+            (item.get('spec', ''), BOX),
+            (qty if qty else '', BOX_RIGHT),
+            (item.get('unit', ''), BOX_CENTER),
+            (unit_price if unit_price else '', BOX_YEN),
+            (amount if amount else '', BOX_YEN),
+            (item.get('note', ''), BOX),
+        ])
+        direct_cost += amount
+
+    for _ in range(2):
+        sheet.row([EMPTY_BOX] * 7)
+
+    summary = work_type.get('summary', {})
+
+    # 直接工事費
+    _summary_row(sheet, "直接工事費", "", "式", "", summary.get('direct_cost', direct_cost))
+
+    # 機械回送費
+    transport = summary.get('transport_cost', 0)
+    if transport:
+        _summary_row(sheet, "機械回送費", summary.get('transport_note', ''), "往復", transport, transport)
+
+    # 諸経費
+    overhead = summary.get('overhead', 0)
+    if overhead:
+        _summary_row(sheet, "諸　経　費", summary.get('overhead_note', ''), "式", overhead, overhead)
+
+    # 値引き
+    discount = summary.get('discount', 0)
+    if discount:
+        _summary_row(sheet, "値 引 き", "", "式", abs(discount), discount, amount_style=BOX_YEN_RED)
+
+    # 法定福利費
+    welfare = summary.get('welfare_base', 0)
+    welfare_rate = summary.get('welfare_rate', 0.15938)
+    if welfare:
+        _summary_row(sheet, "法定福利費", "事業主負担分", "式", welfare, welfare,
+                     note_cell=(f"社会保険料率\n〜{welfare_rate*100:.3f}%", BOX_WRAP))
+
+    # 小計
+    subtotal = summary.get('subtotal', work_type.get('amount', 0))
+    sheet.row([("小　計", BOX_BOLD_10)] + [EMPTY_BOX] * 4 + [(subtotal, BOX_YEN_BOLD_10), EMPTY_BOX])
+
+
+def create_condition_sheet(sheet: _SheetWriter, conditions, company_info):
+    """施工条件書シート作成"""
+    sheet.widths({'A': 4, 'B': 90})
+
+    sheet.row([("施 工 条 件 書", SHEET_TITLE)], merge=[("A", "B")], height=25)
+    sheet.skip()
+
+    for i, cond in enumerate(conditions, 1):
+        sheet.row([(i, TEXT_RIGHT), (cond, PLAIN)], height=18)
+
+    sheet.skip(2)
+    sheet.row([None, (company_info['name'], TEXT_RIGHT)])
+
+
+def detail_rows(data) -> int:
+    return sum(len(wt.get('items', [])) for wt in data['work_types'])
+
+
+def create_estimate_excel_v2(data, output, write_only: bool = None):
+    """
+    見積書Excelを作成して output（パスまたはファイルオブジェクト）に保存
+
+    write_only を省略した場合は明細行数が WRITE_ONLY_THRESHOLD を超えるときだけ write_only モードにする。
+    """
+    if write_only is None:
+        write_only = detail_rows(data) > WRITE_ONLY_THRESHOLD
+    wb = Workbook(write_only=write_only)
+    if not write_only:
+        wb.remove(wb.active)
+    style_ids = {}
+
+    def add_sheet(title):
+        return _SheetWriter(wb.create_sheet(title), style_ids, write_only)
+
+    create_cover_sheet(add_sheet("御見積書"), data)
+
+    for idx, wt in enumerate(data['work_types'], 1):
+        create_breakdown_sheet(add_sheet(f"内訳明細書{idx}"), wt, idx, data['company_info'])
+
+    create_condition_sheet(add_sheet("施工条件書"), data.get('conditions', []), data['company_info'])
+
+    wb.save(output)
+    return output
+
+
+def estimate_excel_bytes(data, write_only: bool = None) -> bytes:
+    """見積書Excelをメモリ上で作成してバイト列で返す"""
+    buffer = BytesIO()
+    create_estimate_excel_v2(data, buffer, write_only)
+    return buffer.getvalue()
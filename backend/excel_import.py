@@ -0,0 +1,552 @@
+"""
+Excel取込（予算明細・工事一括登録・見積書）の解析
+
+ワークブックは read_only モードで開き、シートを行ごとに順に読む（全セルをメモリに展開しない）。
+空行・集計行の判定や数値の読み取りはここにまとめ、各取込APIは解析結果をDBに登録するだけにする。
+解析は同期処理のため、APIからは run_in_threadpool で呼ぶ。
+
+各 parse_* は {..., "errors": [{"sheet", "row", "message"}]} を返す。
+読めなかったシート・行は errors に記録して残りの取込を続ける。
+progress を渡すと、シートを読み終えるたびに progress(読込済シート数, シート数, 読込行数) を呼ぶ。
+
+save_* / create_* は解析結果をセッションに追加（flush）するだけで、commit は呼び出し側で1回だけ行う。
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from openpyxl import load_workbook
+from sqlalchemy import insert
+from models import Project, BudgetDetail, ProjectWorkType, WorkTypeDetail
+
+
+class ExcelImportError(Exception):
+    """ファイルとして開けない（Excel形式でない・壊れている）"""
+    pass
+
+
+# 予算明細取込（/api/budget-details/upload）で読み飛ばす行・単位とみなす文字列
+BUDGET_SKIP_WORDS = ['直接工事費', '諸経費', '機械回送費', '小計', '合計', '端数調整', '法定福利費', '労働災害', '内訳', '名称', '規格', '数量', '単位', '単価', '金額', '備考']
+BUDGET_UNITS = {'m2', 'ｍ2', 'm3', 'ｍ3', '式', '日', '日/式', '往復', 't', 'L', '人工', '台', '個', '本', 'kg', 'm', 'ｍ'}
+
+# 工事一括登録（/api/projects/upload-excel）で読み飛ばす行・単位とみなす文字列
+PROJECT_SKIP_WORDS = ['直接工事費', '諸経費', '機械回送費', '小計', '合計', '端数調整', '法定福利費', '労働災害', '内訳明細書', '施工条件', '本見積', '御見積']
+PROJECT_UNITS = {'m2', 'm3', '式', '日', '往復', 't', 'L', '人工', '台'}
+
+# 見積書取込（/api/projects/import-estimate）
+ESTIMATE_SHEET = "御見積書"
+ESTIMATE_INFO_ROWS = 30          # 宛先・工事名などを探す範囲
+ESTIMATE_TABLE_ROWS = (10, 100)  # 工種テーブルを探す範囲
+DETAIL_MAX_ROW = 300
+DETAIL_HEADERS = ["名称", "名　称", "品名"]
+DETAIL_SKIP_WORDS = ["小計", "小　計", "合計", "合　計"]
+
+
+@contextmanager
+def open_workbook(source):
+    """
+    アップロードされたファイル（バイト列またはファイルオブジェクト）を read_only で開く
+
+    シートの dimension が実際と異なるファイルでも途中で切れないよう、行数・列数は実データから読む。
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    elif hasattr(source, "seek"):
+        source.seek(0)
+    try:
+        wb = load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise ExcelImportError(f"Excelファイルを読み込めません: {e}")
+    try:
+        for ws in wb.worksheets:
+            ws.reset_dimensions()
+        yield wb
+    finally:
+        wb.close()
+
+
+class _Progress:
+    """読み込んだシート数・行数を数えて progress に通知する"""
+
+    def __init__(self, callback, sheets_total: int):
+        self.callback = callback
+        self.sheets_total = sheets_total
+        self.sheets_done = 0
+        self.rows = 0
+        self._notify()
+
+    def rows_of(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def sheet_done(self):
+        self.sheets_done += 1
+        self._notify()
+
+    def _notify(self):
+        if self.callback:
+            self.callback(self.sheets_done, self.sheets_total, self.rows)
+
+
+# ---------- 行の判定 ----------
+
+def is_blank(values) -> bool:
+    return not values or all(v is None for v in values)
+
+
+def contains_any(text: str, words) -> bool:
+    return any(w in text for w in words)
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def value_at(row, index: int):
+    """行の index 列目の値（列がなければ None。セル・値どちらの行にも使える）"""
+    if index >= len(row):
+        return None
+    cell = row[index]
+    return getattr(cell, "value", cell)
+
+
+def text_at(row, index: int) -> str:
+    value = value_at(row, index)
+    return str(value).strip() if value else ""
+
+
+def to_number(value, convert):
+    """数値に変換（できなければ None）"""
+    try:
+        return convert(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _error(sheet: str, row: int, message: str) -> dict:
+    return {"sheet": sheet, "row": row, "message": message}
+
+
+# ---------- 予算明細 ----------
+
+def budget_row(values, vendor: str, category: str):
+    """予算明細の1行を解析（明細でなければ None）"""
+    name = None
+    spec = ""
+    qty = 0
+    unit = "式"
+    price = 0
+    amount = 0
+    note = ""
+
+    for cell in values:
+        if cell is None:
+            continue
+        cell_str = str(cell).strip()
+
+        # 集計行・見出し行
+        if contains_any(cell_str, BUDGET_SKIP_WORDS):
+            return None
+
+        if is_number(cell):
+            if name and qty == 0 and cell > 0:
+                qty = float(cell)
+            elif name and qty > 0 and price == 0 and cell > 100:
+                price = int(cell)
+            elif name and price > 0 and amount == 0:
+                amount = int(cell)
+        elif isinstance(cell, str) and cell_str:
+            if name is None:
+                name = cell_str
+            elif not spec:
+                spec = cell_str
+            elif cell in BUDGET_UNITS:
+                unit = cell_str
+            else:
+                note = cell_str
+
+    if not name or not (qty > 0 or amount > 0):
+        return None
+    return {
+        "category": category,
+        "work_type": name,
+        "vendor": vendor,
+        "description": f"{spec}（{note}）" if note else spec,
+        "quantity": qty,
+        "unit": unit.replace('/式', '').replace('日/式', '日'),
+        "unit_price": price,
+        "amount": amount if amount > 0 else int(qty * price)
+    }
+
+
+def parse_budget_workbook(source, vendor: str = "", category: str = "外注費", progress=None) -> dict:
+    """全シートの2行目以降から予算明細を読み取る {"items", "errors"}"""
+    items = []
+    errors = []
+    with open_workbook(source) as wb:
+        tracker = _Progress(progress, len(wb.worksheets))
+        for ws in wb.worksheets:
+            row_no = 1
+            try:
+                for row_no, values in enumerate(tracker.rows_of(ws.iter_rows(min_row=2, values_only=True)), 2):
+                    if is_blank(values):
+                        continue
+                    item = budget_row(values, vendor, category)
+                    if item:
+                        items.append(item)
+            except Exception as e:
+                errors.append(_error(ws.title, row_no, f"シートを読み込めません: {e}"))
+            tracker.sheet_done()
+    return {"items": items, "errors": errors}
+
+
+# ---------- 工事一括登録 ----------
+
+def project_row(values, vendor: str, category: str):
+    """工事一括登録の明細1行を解析（0以外の数値が2つ以上ある行のみ。明細でなければ None）"""
+    if len([c for c in values if is_number(c) and c != 0]) < 2:
+        return None
+
+    name, spec, qty, unit, price, amount = "", "", 0, "式", 0, 0
+    for c in values:
+        if c is None:
+            continue
+        if is_number(c) and c != 0:
+            if qty == 0 and c < 100000:
+                qty = float(c)
+            elif price == 0 and c >= 100:
+                price = int(c)
+            elif amount == 0:
+                amount = int(c)
+        elif isinstance(c, str) and c.strip():
+            cs = c.strip()
+            if cs in PROJECT_UNITS:
+                unit = cs
+            elif not name and len(cs) > 2:
+                name = cs
+            elif name and not spec:
+                spec = cs
+
+    if not name or not (qty > 0 or amount > 0):
+        return None
+    if amount == 0:
+        amount = int(qty * price)
+    return {"category": category, "work_type": name, "vendor": vendor, "description": spec,
+            "quantity": qty, "unit": unit, "unit_price": price, "amount": amount}
+
+
+def parse_project_workbook(source, vendor: str = "", category: str = "外注費", progress=None) -> dict:
+    """工事名・発注者と予算明細を読み取る {"project_name", "client", "items", "errors"}（条件書シートは除く）"""
+    project_name = ""
+    client = ""
+    items = []
+    errors = []
+    with open_workbook(source) as wb:
+        tracker = _Progress(progress, len(wb.worksheets))
+        for ws in wb.worksheets:
+            if '条件書' in ws.title:
+                tracker.sheet_done()
+                continue
+            row_no = 0
+            try:
+                for row_no, values in enumerate(tracker.rows_of(ws.iter_rows(values_only=True)), 1):
+                    if not values:
+                        continue
+                    row_text = " ".join(str(c).strip() if c else "" for c in values)
+
+                    if '工事名' in row_text:
+                        for c in values:
+                            if c and '工事名' not in str(c) and len(str(c)) > 5:
+                                project_name = str(c).strip()
+                                break
+
+                    if not client:
+                        for c in values:
+                            if c and '御中' in str(c):
+                                client = str(c).replace('御中', '').strip()
+
+                    if contains_any(row_text, PROJECT_SKIP_WORDS):
+                        continue
+
+                    item = project_row(values, vendor, category)
+                    if item:
+                        items.append(item)
+            except Exception as e:
+                errors.append(_error(ws.title, row_no, f"シートを読み込めません: {e}"))
+            tracker.sheet_done()
+    return {"project_name": project_name, "client": client, "items": items, "errors": errors}
+
+
+# ---------- 見積書 ----------
+
+def _label_value(values, index: int) -> str:
+    """見出しセルの右4セル以内で最初に値のあるセル"""
+    for c in range(index + 1, index + 5):
+        value = value_at(values, c)
+        if value:
+            return str(value).strip()
+    return ""
+
+
+def _scan_estimate_sheet(rows, result: dict):
+    """御見積書シートの行（値）を1回読み、上部の基本情報と工種テーブルを取り出す"""
+    in_table = False
+    seq_counter = 1
+    table_from = ESTIMATE_TABLE_ROWS[0]
+
+    for row_no, values in enumerate(rows, 1):
+        if row_no <= ESTIMATE_INFO_ROWS:
+            for i, value in enumerate(values):
+                val = str(value) if value else ""
+                label = val.replace(" ", "").replace("　", "")
+                if "御中" in val:
+                    result["client"] = val.replace("御中", "").replace("　", " ").strip()
+                if "工事名" in label:
+                    result["project_name"] = _label_value(values, i) or result["project_name"]
+                if "工事場所" in val.replace(" ", ""):
+                    result["location"] = _label_value(values, i) or result["location"]
+                if "工期" in label:
+                    result["period"] = _label_value(values, i) or result["period"]
+
+        if row_no < table_from:
+            continue
+
+        first_val = value_at(values, 0)
+
+        # ヘッダー行（No.）以降がテーブル
+        if first_val and str(first_val).strip().lower() in ["no.", "no", "番号"]:
+            in_table = True
+            continue
+        if not in_table:
+            continue
+
+        # 最初のセルが数値（No.）ならその次が工種名、そうでなければ最初のセルが工種名
+        try:
+            no = int(first_val)
+            name = text_at(values, 1)
+        except (ValueError, TypeError):
+            name = str(first_val).strip() if first_val else ""
+            no = seq_counter
+
+        # 合計行でテーブル終了
+        if not name or "合計" in name:
+            if "合計" in str(first_val or ""):
+                in_table = False
+            continue
+
+        # 金額（1000以上の数値のうち最も右のもの）
+        amount = 0
+        for val in values[1:]:
+            if is_number(val) and val >= 1000:
+                amount = int(val)
+
+        if amount > 0:
+            result["work_types"].append({
+                "seq": no, "name": name, "spec": "", "quantity": 1, "unit": "式", "amount": amount
+            })
+            seq_counter += 1
+
+
+def _is_work_type_heading(cell) -> bool:
+    """工種名の行（黄色系の背景）"""
+    fill = getattr(cell, "fill", None)
+    if not fill or not hasattr(fill, "fgColor"):
+        return False
+    color = fill.fgColor
+    return bool(color and color.rgb and 'FFFF' in str(color.rgb))
+
+
+def _scan_detail_sheet(title: str, rows, errors: list):
+    """内訳明細書シートの行（セル）から (工種名, 明細リスト) を取り出す"""
+    current_work_type = ""
+    details = []
+
+    for row_no, row in enumerate(rows, 1):
+        first_val = text_at(row, 0)
+
+        if row and _is_work_type_heading(row[0]) and first_val and first_val not in ["名称", "名　称"]:
+            current_work_type = first_val
+            continue
+
+        # 空行・ヘッダー行・合計/小計行（直接工事費・諸経費・法定福利費は取り込む）
+        if not first_val or first_val in DETAIL_HEADERS or contains_any(first_val, DETAIL_SKIP_WORDS):
+            continue
+
+        invalid = []
+        raw = {}
+        for key, index, convert in (("quantity", 2, float), ("unit_price", 4, int), ("amount", 5, int)):
+            value = value_at(row, index)
+            raw[key] = to_number(value, convert) if value else 0
+            if raw[key] is None:
+                invalid.append(str(value))
+                raw[key] = 0
+
+        if raw["quantity"] > 0 or raw["amount"] > 0:
+            details.append({
+                "name": first_val,
+                "spec": text_at(row, 1),
+                "quantity": raw["quantity"],
+                "unit": text_at(row, 3),
+                "unit_price": raw["unit_price"],
+                "amount": raw["amount"]
+            })
+        elif invalid:
+            errors.append(_error(title, row_no, f"「{first_val}」の数量・金額を読み取れません（{', '.join(invalid)}）"))
+
+    # 工種名の行がなければシート名から
+    if not current_work_type:
+        current_work_type = title.replace("内訳明細書", "").strip() or "明細"
+    return current_work_type, details
+
+
+def _match_details(name: str, all_details: dict, single: bool) -> list:
+    """工種名に対応する明細（完全一致 → 部分一致 → 工種が1つなら最初の明細）"""
+    details = all_details.get(name, [])
+    if not details:
+        for key in all_details:
+            if name in key or key in name:
+                details = all_details[key]
+                break
+    if not details and single and all_details:
+        details = next(iter(all_details.values()))
+    return details
+
+
+def parse_estimate_workbook(source, progress=None) -> dict:
+    """
+    見積書（御見積書シート＋内訳明細書シート）を読み取る
+
+    {"project_name", "client", "location", "period",
+     "work_types": [{seq, name, spec, quantity, unit, amount, details: [...]}], "errors"}
+    """
+    result = {"project_name": "", "client": "", "location": "", "period": "", "work_types": []}
+    errors = []
+    all_details = {}  # 工種名 -> 明細リスト
+
+    with open_workbook(source) as wb:
+        tracker = _Progress(progress, len(wb.worksheets))
+        for ws in wb.worksheets:
+            try:
+                if ws.title == ESTIMATE_SHEET:
+                    rows = ws.iter_rows(min_row=1, max_row=ESTIMATE_TABLE_ROWS[1], values_only=True)
+                    _scan_estimate_sheet(tracker.rows_of(rows), result)
+                elif "内訳" in ws.title or "明細" in ws.title:
+                    rows = ws.iter_rows(min_row=1, max_row=DETAIL_MAX_ROW)
+                    work_type, details = _scan_detail_sheet(ws.title, tracker.rows_of(rows), errors)
+                    if details:
+                        all_details[work_type] = details
+            except Exception as e:
+                errors.append(_error(ws.title, None, f"シートを読み込めません: {e}"))
+            tracker.sheet_done()
+
+    work_types = result["work_types"]
+    # 工種が見つからなければ内訳明細書の工種名から作成（合計はせず最初の明細の金額を使う）
+    if not work_types:
+        for idx, (name, details) in enumerate(all_details.items(), 1):
+            first = details[0]
+            work_types.append({
+                "seq": idx, "name": name, "spec": "", "quantity": 1, "unit": "式",
+                "amount": first.get("amount", 0) or first.get("unit_price", 0)
+            })
+
+    for wt in work_types:
+        wt["details"] = _match_details(wt["name"], all_details, len(work_types) == 1)
+
+    result["errors"] = errors
+    return result
+
+
+# ---------- 登録 ----------
+
+def save_budget_items(db, project_id: int, parsed: dict) -> dict:
+    """予算明細を工事に追加 {"count", "items"}"""
+    items = [{"project_id": project_id, **item} for item in parsed["items"]]
+    db.add_all([BudgetDetail(**item) for item in items])
+    db.flush()
+    return {"count": len(items), "items": items}
+
+
+def create_project_from_workbook(db, parsed: dict, filename: str) -> dict:
+    """工事一括登録：工事と予算明細を作成 {"project_id", "name", "count", "total"}"""
+    items = parsed["items"]
+    total = sum(item.get("amount", 0) for item in items)
+    project = Project(
+        code=str(1000 + db.query(Project).count() + 1),
+        name=parsed["project_name"] or (filename or "").replace('.xlsx', ''),
+        client=parsed["client"], status="見積中", order_type="一次請", prefecture="",
+        probability="見込み有", order_amount=0, budget_amount=total, tax_rate=0.1,
+        period="", sales_person="", site_person=""
+    )
+    db.add(project)
+    db.flush()
+    db.add_all([BudgetDetail(project_id=project.id, **item) for item in items])
+    db.flush()
+    return {"project_id": project.id, "name": project.name, "count": len(items), "total": total}
+
+
+def create_project_from_estimate(db, parsed: dict) -> dict:
+    """
+    見積書取込：案件・工種・明細を作成（工種の予算金額は明細から再計算せず見積の金額を使う）
+
+    工種・明細はそれぞれ1回の一括INSERTで登録する。工種IDは RETURNING で受け取る。
+    """
+    project_name = parsed["project_name"] or f"取込案件_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    project = Project(
+        name=project_name,
+        client=parsed["client"],
+        address=parsed["location"],
+        status="見積中"
+    )
+    db.add(project)
+    db.flush()
+
+    work_type_ids = []
+    if parsed["work_types"]:
+        work_type_ids = db.scalars(
+            insert(ProjectWorkType).returning(ProjectWorkType.id, sort_by_parameter_order=True),
+            [
+                {
+                    "project_id": project.id,
+                    "seq": wt.get("seq", 1),
+                    "name": wt["name"],
+                    "spec": wt.get("spec", ""),
+                    "quantity": wt.get("quantity", 1),
+                    "unit": wt.get("unit", "式"),
+                    "budget_amount": wt.get("amount", 0),
+                    "estimate_amount": wt.get("amount", 0),
+                    "rate": 1.0,
+                }
+                for wt in parsed["work_types"]
+            ]
+        ).all()
+
+    details = [
+        {
+            "work_type_id": work_type_id,
+            "seq": idx,
+            "name": d.get("name", ""),
+            "spec": d.get("spec", ""),
+            "budget_quantity": d.get("quantity", 0),
+            "unit": d.get("unit", ""),
+            "budget_unit_price": d.get("unit_price", 0),
+            "budget_amount": d.get("amount", 0),
+            "cost_category": "経費",  # デフォルト
+        }
+        for work_type_id, wt in zip(work_type_ids, parsed["work_types"])
+        for idx, d in enumerate(wt["details"], 1)
+    ]
+    if details:
+        db.execute(insert(WorkTypeDetail), details)
+    total_details = len(details)
+
+    work_types_count = len(parsed["work_types"])
+    return {
+        "success": True,
+        "project_id": project.id,
+        "project_name": project_name,
+        "client": parsed["client"],
+        "location": parsed["location"],
+        "work_types_count": work_types_count,
+        "details_count": total_details,
+        "message": f"案件「{project_name}」を作成しました。工種{work_types_count}件、明細{total_details}件を取り込みました。"
+    }
@@ -0,0 +1,113 @@
+"""
+会計ソフト向け原価CSVの出力（弥生 / freee / マネーフォワード）
+
+原価を全件メモリに読み込まず、DBカーソルから一定件数ずつ取り出して
+CSVを分割して返す。複数年分の出力でもメモリ使用量は一定。
+"""
+import codecs
+import csv
+from io import StringIO
+from sqlalchemy import select
+from database import SessionLocal
+from models import Cost
+
+# DBから一度に取り出す件数と、1回に返すCSVの行数
+FETCH_SIZE = 1000
+CHUNK_ROWS = 500
+
+# 指定できる文字コード（shift_jis は Windows の拡張文字を含む cp932 で出力）
+ENCODINGS = {
+    "utf-8": ("utf-8", "UTF-8"),
+    "utf-8-sig": ("utf-8-sig", "UTF-8"),
+    "shift_jis": ("cp932", "Shift_JIS"),
+}
+
+YAYOI_ACCOUNTS = {
+    "労務費": "労務費",
+    "材料費": "材料費",
+    "外注費": "外注費",
+    "経費": "諸経費"
+}
+
+
+def _yayoi_row(cost):
+    account = YAYOI_ACCOUNTS.get(cost.category, "諸経費")
+    return [
+        cost.date.strftime("%Y/%m/%d") if cost.date else "",
+        account,
+        cost.amount or 0,
+        "未払金",
+        cost.amount or 0,
+        f"{cost.vendor or ''} {cost.description or ''}"
+    ]
+
+
+def _freee_row(cost):
+    return [
+        cost.date.strftime("%Y-%m-%d") if cost.date else "",
+        cost.category or "",
+        "課税仕入10%",
+        cost.amount or 0,
+        cost.vendor or "",
+        cost.work_type or "",
+        cost.description or ""
+    ]
+
+
+def _moneyforward_row(cost):
+    return [
+        cost.date.strftime("%Y/%m/%d") if cost.date else "",
+        cost.category or "",
+        cost.work_type or "",
+        cost.amount or 0,
+        "未払金",
+        cost.vendor or "",
+        cost.amount or 0,
+        cost.description or ""
+    ]
+
+
+# 形式名 -> (ヘッダー, 行の変換)
+FORMATS = {
+    "yayoi": (["日付", "借方科目", "借方金額", "貸方科目", "貸方金額", "摘要"], _yayoi_row),
+    "freee": (["取引日", "勘定科目", "税区分", "金額", "取引先", "品目", "メモ"], _freee_row),
+    "moneyforward": (
+        ["日付", "借方勘定科目", "借方補助科目", "借方金額", "貸方勘定科目", "貸方補助科目", "貸方金額", "摘要"],
+        _moneyforward_row
+    ),
+}
+
+
+def content_type(encoding: str) -> str:
+    return f"text/csv; charset={ENCODINGS[encoding][1]}"
+
+
+def stream_costs_csv(fmt: str, start_date, end_date, encoding: str = "utf-8"):
+    """
+    start_date 以上 end_date 未満の原価をCSVのバイト列で少しずつ返すジェネレータ
+
+    レスポンス送信中に読み出すため、リクエストのセッションではなく専用のセッションを使う。
+    """
+    header, to_row = FORMATS[fmt]
+    codec = ENCODINGS[encoding][0]
+    stmt = select(
+        Cost.date, Cost.category, Cost.work_type, Cost.vendor, Cost.description, Cost.amount
+    ).where(
+        Cost.date >= start_date, Cost.date < end_date
+    ).order_by(Cost.date, Cost.id).execution_options(yield_per=FETCH_SIZE)
+
+    # 分割したCSVを続けて1つの文字列として符号化する（utf-8-sig の BOM は先頭に1回だけ付く）
+    encoder = codecs.getincrementalencoder(codec)(errors="replace")
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    rows = 0
+    with SessionLocal() as db:
+        for cost in db.execute(stmt):
+            writer.writerow(to_row(cost))
+            rows += 1
+            if rows % CHUNK_ROWS == 0:
+                yield encoder.encode(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+    yield encoder.encode(buffer.getvalue(), final=True)
@@ -1,45 +1,44 @@
 #!/usr/bin/env python3
 """
 サンユウテック テストデータ生成スクリプト
-- 作業員 50人
-- 工事 20現場
-- 工種・予算・原価・配置データ
+
+件数を引数で指定して本番規模のデータを作る（負荷試験・実行計画の確認用）。
+行は CHUNK_SIZE 件ずつ一括INSERTし、乱数は --seed で固定するので、
+同じ引数・同じ基準日なら同じデータになる。生成対象のテーブルは削除してから作り直す。
+
+    python generate_test_data.py                      # 作業員50人・工事20現場・1年分
+    python generate_test_data.py --projects 5000 --costs 2000000 --workers 500 --years 3
+    python generate_test_data.py --database-url sqlite:///./load.db --end-date 2025-03-31
+
+作成するデータ: 工事・工種/明細・工程・作業員・勤怠/配置/日報（平日）・原価・出来高・請求・
+入金予定・支払予定・メッセージ・工事写真・経費・見積書。最後に原価集計（project_cost_rollups）を再構築する。
 """
+import argparse
 import random
+import time
 from datetime import date, datetime, timedelta
-from database import engine, get_db, Base
+from itertools import islice
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from models import (
-    Project, Cost, Worker, Assignment, Schedule,
-    ProjectWorkType, WorkTypeDetail, Expense, ExpenseReceipt, ExpenseCategory
+    Project, Cost, Worker, Assignment, Schedule, Attendance, DailyReport,
+    ProjectWorkType, WorkTypeDetail, Expense, ExpenseReceipt, ExpenseCategory,
+    MonthlyProgress, Billing, Receivable, Payable, Message, SitePhoto, ProjectCostRollup,
+    QuoteDocument, QuoteItem
 )
+import cost_rollup
+
+# 1回のINSERTにまとめる行数
+CHUNK_SIZE = 10000
+
+# 削除順（参照している側から）
+TABLES = [
+    ProjectCostRollup, Receivable, Payable, Billing, MonthlyProgress, Message, SitePhoto,
+    DailyReport, Attendance, Assignment, Schedule, WorkTypeDetail, ProjectWorkType, Cost,
+    ExpenseReceipt, Expense, ExpenseCategory, QuoteItem, QuoteDocument, Worker, Project,
+]
 
-# データベース接続
-Base.metadata.create_all(bind=engine)
-db = next(get_db())
-
-print("=" * 50)
-print("テストデータ生成開始")
-print("=" * 50)
-
-# 既存データを削除
-print("\n既存データを削除中...")
-db.query(Assignment).delete()
-db.query(Schedule).delete()
-db.query(WorkTypeDetail).delete()
-db.query(ProjectWorkType).delete()
-db.query(Cost).delete()
-db.query(ExpenseReceipt).delete()
-db.query(Expense).delete()
-db.query(ExpenseCategory).delete()
-db.query(Worker).delete()
-db.query(Project).delete()
-db.commit()
-print("削除完了")
-
-# ========== 経費カテゴリマスタ ==========
-print("\n経費カテゴリを生成中...")
-expense_category_data = [
+EXPENSE_CATEGORIES = [
     ("ガソリン", "⛽", 1, True),
     ("軽油", "🛢️", 2, True),
     ("駐車場代", "🅿️", 3, False),
@@ -49,59 +48,23 @@ expense_category_data = [
     ("事務用品", "📎", 7, False),
     ("その他", "📋", 8, False),
 ]
-expense_categories = []
-for cat_name, icon, order, is_fuel in expense_category_data:
-    cat = ExpenseCategory(
-        name=cat_name,
-        icon=icon,
-        sort_order=order,
-        is_fuel=is_fuel,
-        is_active=True
-    )
-    db.add(cat)
-    expense_categories.append(cat)
-db.commit()
-print(f"経費カテゴリ {len(expense_categories)}件 を登録しました")
-
-# ========== 作業員データ ==========
-print("\n作業員データを生成中...")
-
-last_names = ["田中", "山田", "佐藤", "鈴木", "高橋", "伊藤", "渡辺", "中村", "小林", "加藤",
+
+LAST_NAMES = ["田中", "山田", "佐藤", "鈴木", "高橋", "伊藤", "渡辺", "中村", "小林", "加藤",
               "吉田", "山本", "松本", "井上", "木村", "林", "斎藤", "清水", "山口", "森",
               "池田", "橋本", "阿部", "石川", "山崎", "中島", "前田", "藤田", "小川", "後藤"]
-first_names = ["太郎", "一郎", "健一", "和也", "大輔", "誠", "浩", "剛", "翔太", "拓也",
+FIRST_NAMES = ["太郎", "一郎", "健一", "和也", "大輔", "誠", "浩", "剛", "翔太", "拓也",
                "修", "隆", "秀樹", "正", "明", "勇", "進", "博", "茂", "豊"]
 
-teams = ["舗装班", "高速班", "土工班", "管理班"]
-employment_types = ["社員", "契約", "外注"]
-daily_rates = [
+TEAMS = ["舗装班", "高速班", "土工班", "管理班"]
+EMPLOYMENT_TYPES = ["社員", "契約", "外注"]
+DAILY_RATES = [
     (13000, 15000),  # 一般作業員
     (14000, 17000),  # 舗装工
     (18000, 22000),  # 重機オペレーター
     (20000, 25000),  # 現場監督
 ]
 
-workers = []
-for i in range(50):
-    rate_range = random.choice(daily_rates)
-    worker = Worker(
-        name=f"{random.choice(last_names)} {random.choice(first_names)}",
-        team=random.choice(teams),
-        employment_type=random.choice(employment_types),
-        daily_rate=random.randint(rate_range[0], rate_range[1]),
-        phone=f"090-{random.randint(1000,9999)}-{random.randint(1000,9999)}",
-        is_active=True
-    )
-    db.add(worker)
-    workers.append(worker)
-
-db.commit()
-print(f"作業員 {len(workers)}人 を登録しました")
-
-# ========== 工事データ ==========
-print("\n工事データを生成中...")
-
-project_templates = [
+PROJECT_TEMPLATES = [
     ("県道〇〇線舗装補修工事", "福岡県", 45000000, 55000000),
     ("市道△△線道路改良工事", "〇〇市", 25000000, 35000000),
     ("国道×××号線維持修繕工事", "国土交通省九州地方整備局", 80000000, 120000000),
@@ -114,66 +77,11 @@ project_templates = [
     ("農道舗装工事", "〇〇市農政課", 10000000, 18000000),
 ]
 
-areas = ["福岡市東区", "福岡市博多区", "福岡市中央区", "北九州市小倉北区", "久留米市",
+AREAS = ["福岡市東区", "福岡市博多区", "福岡市中央区", "北九州市小倉北区", "久留米市",
          "飯塚市", "大牟田市", "春日市", "筑紫野市", "太宰府市", "糸島市", "宗像市",
          "古賀市", "福津市", "宮若市", "嘉麻市", "朝倉市", "みやま市", "糟屋郡", "遠賀郡"]
 
-statuses_distribution = ["施工中"] * 15 + ["見込み有"] * 3 + ["完了"] * 2
-
-projects = []
-total_order = 0
-
-for i in range(20):
-    template = project_templates[i % len(project_templates)]
-    area = random.choice(areas)
-
-    # 工事名に地域を組み込む
-    project_name = template[0].replace("〇〇", area.replace("市", "").replace("区", "").replace("郡", ""))
-    client = template[1].replace("〇〇", area.split("市")[0] if "市" in area else area[:2])
-
-    min_amount = template[2]
-    max_amount = template[3]
-    order_amount = random.randint(min_amount, max_amount)
-    budget_rate = random.uniform(0.75, 0.85)
-    budget_amount = int(order_amount * budget_rate)
-
-    # 工期設定
-    start_month = random.randint(1, 12)
-    start_year = random.choice([2024, 2025])
-    duration_months = random.randint(2, 8)
-    start_date = date(start_year, start_month, 1)
-    end_date = start_date + timedelta(days=duration_months * 30)
-
-    status = statuses_distribution[i]
-
-    project = Project(
-        code=f"P{2024 + (i // 10)}{str(i % 12 + 1).zfill(2)}-{str(i + 1).zfill(3)}",
-        name=project_name,
-        client=client,
-        status=status,
-        order_type="一次請" if random.random() > 0.3 else "JV",
-        prefecture="福岡県",
-        probability="確定" if status != "見込み有" else random.choice(["A", "B", "C"]),
-        order_amount=order_amount,
-        budget_amount=budget_amount,
-        tax_rate=0.1,
-        start_date=start_date,
-        end_date=end_date,
-        sales_person=random.choice(["山田部長", "田中課長", "佐藤主任"]),
-        site_person=random.choice([w.name for w in workers if w.team == "管理班"][:5]) if any(w.team == "管理班" for w in workers) else workers[0].name if workers else "担当者未定",
-        address=f"福岡県{area}{random.randint(1, 10)}丁目{random.randint(1, 30)}-{random.randint(1, 20)}"
-    )
-    db.add(project)
-    projects.append(project)
-    total_order += order_amount
-
-db.commit()
-print(f"工事 {len(projects)}件 を登録しました（総受注額: {total_order:,}円）")
-
-# ========== 工種データ ==========
-print("\n工種データを生成中...")
-
-work_type_templates = [
+WORK_TYPE_TEMPLATES = [
     ("舗装工", [
         ("アスファルト舗装", "㎡", 3500, 5500, "材料費"),
         ("路盤工", "㎡", 1500, 2500, "材料費"),
@@ -203,226 +111,588 @@ work_type_templates = [
     ]),
 ]
 
-work_type_count = 0
-detail_count = 0
-for project in projects:
-    # 各工事に3〜5工種を追加
-    num_work_types = random.randint(3, 5)
-    selected_types = random.sample(work_type_templates, num_work_types)
-
-    seq = 1
-    for wt_template in selected_types:
-        work_type = ProjectWorkType(
-            project_id=project.id,
-            seq=seq,
-            name=wt_template[0],
-            unit="式",
-            quantity=1,
-            budget_unit_price=0,
-            budget_amount=0
-        )
-        db.add(work_type)
-        db.flush()
-
-        # 明細を追加
-        total_budget = 0
-        detail_seq = 1
-        for detail_template in wt_template[1]:
-            quantity = random.randint(50, 500)
-            unit_price = random.randint(detail_template[2], detail_template[3])
-            amount = int(quantity * unit_price)
-            total_budget += amount
-
-            detail = WorkTypeDetail(
-                work_type_id=work_type.id,
-                seq=detail_seq,
-                name=detail_template[0],
-                unit=detail_template[1],
-                cost_category=detail_template[4],
-                budget_quantity=quantity,
-                budget_unit_price=unit_price,
-                budget_amount=amount
-            )
-            db.add(detail)
-            detail_seq += 1
-            detail_count += 1
-
-        work_type.budget_amount = total_budget
-        work_type.budget_unit_price = total_budget
-        work_type_count += 1
-        seq += 1
-
-db.commit()
-print(f"工種 {work_type_count}件、明細 {detail_count}件 を登録しました")
-
-# ========== 原価データ ==========
-print("\n原価データを生成中...")
-
-cost_categories = [
-    ("材料費", 0.35, 0.45),
-    ("労務費", 0.20, 0.30),
-    ("外注費", 0.15, 0.25),
-    ("機械費", 0.05, 0.10),
-    ("経費", 0.03, 0.08),
-]
-
-vendors = {
+# (費目, 原価に占める割合)
+COST_CATEGORIES = [("材料費", 0.40), ("労務費", 0.25), ("外注費", 0.20), ("機械費", 0.08), ("経費", 0.07)]
+VENDORS = {
     "材料費": ["福岡建材", "九州アスファルト", "博多砂利", "筑紫セメント", "太陽建材"],
     "労務費": ["直営", "サンユウテック"],
     "外注費": ["山田建設", "九州舗装", "福岡土木", "北九州工業", "筑後建設"],
     "機械費": ["九州リース", "福岡機械", "レンタル太郎"],
     "経費": ["直接経費", "現場経費"],
 }
-
-cost_count = 0
-for project in projects:
-    if project.status == "見込み有":
-        continue  # 見込み案件は原価なし
-
-    # 予算の70-95%を原価として計上（完了案件は95%、施工中は70-85%）
-    if project.status == "完了":
-        cost_rate = random.uniform(0.90, 0.98)
-    else:
-        cost_rate = random.uniform(0.50, 0.75)
-
-    target_cost = int(project.budget_amount * cost_rate)
-    remaining_cost = target_cost
-
-    for cat_name, min_rate, max_rate in cost_categories:
-        cat_amount = int(target_cost * random.uniform(min_rate, max_rate))
-        if cat_amount > remaining_cost:
-            cat_amount = remaining_cost
-
-        if cat_amount <= 0:
-            continue
-
-        # 複数回に分けて計上
-        num_entries = random.randint(2, 5)
-        for _ in range(num_entries):
-            entry_amount = cat_amount // num_entries
-            if entry_amount <= 0:
+# 支払予定を作る費目
+PAYABLE_CATEGORIES = ["材料費", "外注費", "機械費"]
+
+MESSAGES = ["本日の作業完了しました", "明日は8時集合です", "資材が到着しました", "雨天のため作業中止です",
+            "検査日程が決まりました", "写真をアップしました", "安全確認をお願いします", "了解しました"]
+PHOTO_CATEGORIES = ["着工前", "施工中", "完成"]
+
+
+def chunks(rows, size: int = CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(db: Session, model, rows) -> int:
+    """rows（dict のイテラブル）を CHUNK_SIZE 件ずつ一括INSERT。件数を返す"""
+    count = 0
+    for chunk in chunks(rows):
+        db.execute(insert(model.__table__), chunk)
+        count += len(chunk)
+    return count
+
+
+def month_starts(start: date, end: date):
+    d = date(start.year, start.month, 1)
+    while d <= end:
+        yield d
+        d = date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def weekdays(start: date, end: date):
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            yield d
+        d += timedelta(days=1)
+
+
+class Generator:
+    """引数の件数でデータを作る（乱数は self.rng だけを使う）"""
+
+    def __init__(self, db: Session, args):
+        self.db = db
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.end = args.end_date
+        self.start = self.end - timedelta(days=365 * args.years)
+        self.counts = {}
+
+    def log(self, name: str, count: int):
+        self.counts[name] = count
+        print(f"{name} {count:,}件 を登録しました")
+
+    def run(self):
+        self.clear()
+        self.expense_categories()
+        self.workers()
+        self.projects()
+        self.work_types()
+        self.schedules()
+        self.costs()
+        self.progress()
+        self.payables()
+        self.daily_work()
+        self.messages()
+        self.photos()
+        self.expenses()
+        self.quotes()
+        count = cost_rollup.rebuild(self.db)
+        self.log("原価集計", count)
+        return self.counts
+
+    def clear(self):
+        print("既存データを削除中...")
+        for model in TABLES:
+            self.db.execute(delete(model))
+        self.db.commit()
+
+    # ---------- マスタ ----------
+
+    def expense_categories(self):
+        count = bulk_insert(self.db, ExpenseCategory, (
+            {"name": name, "icon": icon, "sort_order": order, "is_fuel": is_fuel, "is_active": True}
+            for name, icon, order, is_fuel in EXPENSE_CATEGORIES
+        ))
+        self.db.commit()
+        self.category_ids = {
+            name: (cid, is_fuel) for cid, name, is_fuel in
+            self.db.execute(select(ExpenseCategory.id, ExpenseCategory.name, ExpenseCategory.is_fuel))
+        }
+        self.log("経費カテゴリ", count)
+
+    def workers(self):
+        rng = self.rng
+
+        def rows():
+            for _ in range(self.args.workers):
+                low, high = rng.choice(DAILY_RATES)
+                yield {
+                    "name": f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+                    "team": rng.choice(TEAMS),
+                    "employment_type": rng.choice(EMPLOYMENT_TYPES),
+                    "daily_rate": rng.randint(low, high),
+                    "phone": f"090-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+                    "is_active": True,
+                }
+
+        count = bulk_insert(self.db, Worker, rows())
+        self.db.commit()
+        self.worker_rows = self.db.execute(
+            select(Worker.id, Worker.name, Worker.team).order_by(Worker.id)
+        ).all()
+        self.log("作業員", count)
+
+    # ---------- 工事 ----------
+
+    def projects(self):
+        rng = self.rng
+        span_days = (self.end - self.start).days
+        managers = [w.name for w in self.worker_rows if w.team == "管理班"][:5] or ["担当者未定"]
+
+        def rows():
+            for i in range(self.args.projects):
+                name, client, min_amount, max_amount = PROJECT_TEMPLATES[i % len(PROJECT_TEMPLATES)]
+                area = rng.choice(AREAS)
+                # 期間内に着工し、一部は基準日以降に着工する見込み案件にする
+                start_date = self.start + timedelta(days=rng.randint(0, span_days + 60))
+                end_date = start_date + timedelta(days=rng.randint(2, 8) * 30)
+                if start_date > self.end:
+                    status = "見込み有"
+                elif end_date < self.end:
+                    status = "完了"
+                else:
+                    status = "施工中"
+                order_amount = rng.randint(min_amount, max_amount)
+                yield {
+                    "code": f"P{start_date.year}{start_date.month:02d}-{i + 1:05d}",
+                    "name": name.replace("〇〇", area.replace("市", "").replace("区", "").replace("郡", "")),
+                    "client": client.replace("〇〇", area.split("市")[0] if "市" in area else area[:2]),
+                    "status": status,
+                    "order_type": "一次請" if rng.random() > 0.3 else "JV",
+                    "prefecture": "福岡県",
+                    "probability": "確定" if status != "見込み有" else rng.choice(["A", "B", "C"]),
+                    "order_amount": order_amount,
+                    "budget_amount": int(order_amount * rng.uniform(0.75, 0.85)),
+                    "tax_rate": 0.1,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "sales_person": rng.choice(["山田部長", "田中課長", "佐藤主任"]),
+                    "site_person": rng.choice(managers),
+                    "address": f"福岡県{area}{rng.randint(1, 10)}丁目{rng.randint(1, 30)}-{rng.randint(1, 20)}",
+                    "latitude": round(33.3 + rng.random() * 0.7, 5),
+                    "longitude": round(130.2 + rng.random() * 0.8, 5),
+                }
+
+        count = bulk_insert(self.db, Project, rows())
+        self.db.commit()
+        self.project_rows = self.db.execute(select(
+            Project.id, Project.name, Project.client, Project.status, Project.order_amount,
+            Project.budget_amount, Project.start_date, Project.end_date
+        ).order_by(Project.id)).all()
+        # 着工済み（原価・日報などを作る工事）
+        self.started = [p for p in self.project_rows if p.status != "見込み有"]
+        self.log("工事", count)
+
+    def work_types(self):
+        rng = self.rng
+        plans = []  # (工事ID, 表示順, 工種テンプレート, 明細の数量・単価)
+
+        def work_type_rows():
+            for p in self.project_rows:
+                for seq, (name, details) in enumerate(rng.sample(WORK_TYPE_TEMPLATES, rng.randint(3, 5)), 1):
+                    values = [(rng.randint(50, 500), rng.randint(d[2], d[3])) for d in details]
+                    total = sum(q * price for q, price in values)
+                    plans.append((p.id, seq, details, values))
+                    yield {
+                        "project_id": p.id, "seq": seq, "name": name, "unit": "式", "quantity": 1,
+                        "budget_unit_price": total, "budget_amount": total,
+                    }
+
+        count = bulk_insert(self.db, ProjectWorkType, work_type_rows())
+        self.db.flush()
+        ids = {
+            (project_id, seq): wid for wid, project_id, seq in
+            self.db.execute(select(ProjectWorkType.id, ProjectWorkType.project_id, ProjectWorkType.seq))
+        }
+
+        def detail_rows():
+            for project_id, seq, details, values in plans:
+                for detail_seq, (detail, (quantity, unit_price)) in enumerate(zip(details, values), 1):
+                    yield {
+                        "work_type_id": ids[(project_id, seq)], "seq": detail_seq, "name": detail[0],
+                        "unit": detail[1], "cost_category": detail[4], "budget_quantity": quantity,
+                        "budget_unit_price": unit_price, "budget_amount": quantity * unit_price,
+                    }
+
+        detail_count = bulk_insert(self.db, WorkTypeDetail, detail_rows())
+        self.db.commit()
+        self.log("工種", count)
+        self.log("工種明細", detail_count)
+
+    def schedules(self):
+        rng = self.rng
+        colors = ["#3b82f6", "#10b981", "#f59e0b", "#ef4444", "#8b5cf6"]
+        count = bulk_insert(self.db, Schedule, (
+            {
+                "project_id": p.id, "start_date": p.start_date, "end_date": p.end_date,
+                "progress_rate": self._progress_rate(p, self.end) * 100, "color": rng.choice(colors),
+            }
+            for p in self.project_rows
+        ))
+        self.db.commit()
+        self.log("工程", count)
+
+    @staticmethod
+    def _progress_rate(p, on: date) -> float:
+        """工期に対する経過の割合（0〜1）"""
+        total = (p.end_date - p.start_date).days or 1
+        return min(max((on - p.start_date).days / total, 0), 1)
+
+    # ---------- 原価・出来高・入出金 ----------
+
+    def costs(self):
+        rng = self.rng
+        total = self.args.costs if self.args.costs is not None else len(self.started) * 20
+        if not self.started:
+            return
+        per_project = total / len(self.started)
+        categories = [c for c, _ in COST_CATEGORIES]
+        weights = [w for _, w in COST_CATEGORIES]
+
+        def rows():
+            for _ in range(total):
+                p = self.started[rng.randrange(len(self.started))]
+                days = (min(p.end_date, self.end) - p.start_date).days
+                category = rng.choices(categories, weights)[0]
+                # 工事ごとの原価合計が予算の6〜9割程度になる金額
+                amount = max(int(p.budget_amount * 0.75 / per_project * rng.uniform(0.5, 1.5)), 1000)
+                yield {
+                    "project_id": p.id,
+                    "date": p.start_date + timedelta(days=rng.randint(0, max(days, 0))),
+                    "category": category,
+                    "vendor": rng.choice(VENDORS[category]),
+                    "description": f"{p.name[:10]} {category}",
+                    "quantity": 1,
+                    "unit_price": amount,
+                    "amount": amount,
+                }
+
+        count = bulk_insert(self.db, Cost, rows())
+        self.db.commit()
+        self.log("原価", count)
+
+    def progress(self):
+        """着工済み工事の月別出来高と、出来高ごとの請求・入金予定"""
+        rng = self.rng
+        plans = []  # (工事, 年月, 出来高, 請求日)
+
+        def progress_rows():
+            for p in self.started:
+                months = list(month_starts(p.start_date, min(p.end_date, self.end)))
+                for month in months:
+                    amount = int(p.order_amount / len(months) * rng.uniform(0.8, 1.2))
+                    cost = int(amount * rng.uniform(0.7, 0.9))
+                    year_month = month.strftime("%Y-%m")
+                    plans.append((p, year_month, amount, month + timedelta(days=27)))
+                    yield {
+                        "project_id": p.id, "year_month": year_month, "progress_amount": amount,
+                        "progress_rate": round(self._progress_rate(p, month + timedelta(days=27)) * 100, 1),
+                        "cost_amount": cost, "gross_profit": amount - cost,
+                        "gross_profit_rate": round((amount - cost) / amount * 100, 1) if amount else 0,
+                    }
+
+        count = bulk_insert(self.db, MonthlyProgress, progress_rows())
+        self.db.flush()
+        ids = {
+            (project_id, year_month): pid for pid, project_id, year_month in
+            self.db.execute(select(MonthlyProgress.id, MonthlyProgress.project_id, MonthlyProgress.year_month))
+        }
+
+        billing_count = bulk_insert(self.db, Billing, (
+            {"project_id": p.id, "bill_type": "出来高", "date": billing_date, "amount": amount,
+             "done": int(billing_date <= self.end)}
+            for p, _, amount, billing_date in plans
+        ))
+
+        def receivable_rows():
+            for p, year_month, amount, billing_date in plans:
+                expected = billing_date + timedelta(days=rng.choice([30, 60]))
+                paid = expected <= self.end
+                yield {
+                    "project_id": p.id, "progress_id": ids[(p.id, year_month)], "client_name": p.client,
+                    "description": f"{year_month} 出来高", "amount": amount, "billing_date": billing_date,
+                    "expected_date": expected, "actual_date": expected if paid else None,
+                    "status": "入金済" if paid else "請求済",
+                }
+
+        receivable_count = bulk_insert(self.db, Receivable, receivable_rows())
+        self.db.commit()
+        self.log("出来高", count)
+        self.log("請求", billing_count)
+        self.log("入金予定", receivable_count)
+
+    def payables(self):
+        rng = self.rng
+        total = self.args.payables if self.args.payables is not None else self.counts.get("原価", 0) // 10
+        if not self.started:
+            return
+
+        def rows():
+            for _ in range(total):
+                p = self.started[rng.randrange(len(self.started))]
+                category = rng.choice(PAYABLE_CATEGORIES)
+                days = (min(p.end_date, self.end) - p.start_date).days
+                invoice_date = p.start_date + timedelta(days=rng.randint(0, max(days, 0)))
+                expected = invoice_date + timedelta(days=rng.choice([30, 45, 60]))
+                paid = expected <= self.end
+                yield {
+                    "project_id": p.id, "vendor_name": rng.choice(VENDORS[category]), "category": category,
+                    "description": f"{p.name[:10]} {category}", "amount": rng.randint(50, 3000) * 1000,
+                    "invoice_date": invoice_date, "expected_date": expected,
+                    "actual_date": expected if paid else None, "status": "支払済" if paid else "予定",
+                }
+
+        count = bulk_insert(self.db, Payable, rows())
+        self.db.commit()
+        self.log("支払予定", count)
+
+    # ---------- 勤怠・配置・日報 ----------
+
+    def daily_work(self):
+        """平日ごとに作業員を稼働中の工事へ割り当て、勤怠・配置・日報を作る（配置は基準日の1週間先まで）"""
+        rng = self.rng
+        # 月ごとの稼働中の工事（1日ごとに探すと遅いため）
+        active_by_month = {}
+        for p in self.started:
+            for month in month_starts(p.start_date, p.end_date):
+                active_by_month.setdefault(month, []).append(p)
+
+        attendances, assignments, reports = [], [], []
+        counts = {"勤怠": 0, "配置": 0, "日報": 0}
+
+        def flush():
+            for model, rows, name in ((Attendance, attendances, "勤怠"), (Assignment, assignments, "配置"),
+                                      (DailyReport, reports, "日報")):
+                counts[name] += bulk_insert(self.db, model, rows)
+                rows.clear()
+
+        # 作業員は週ごとに同じ現場へ入る
+        current = {}
+        for day in weekdays(self.start, self.end + timedelta(days=7)):
+            candidates = [
+                p for p in active_by_month.get(date(day.year, day.month, 1), ())
+                if p.start_date <= day <= p.end_date
+            ]
+            if not candidates:
                 continue
-
-            cost_date = project.start_date + timedelta(days=random.randint(0, 180))
-
-            cost = Cost(
-                project_id=project.id,
-                date=cost_date,
-                category=cat_name,
-                vendor=random.choice(vendors[cat_name]),
-                description=f"{project.name[:10]}... {cat_name}",
-                amount=entry_amount,
-                quantity=1,
-                unit_price=entry_amount
-            )
-            db.add(cost)
-            cost_count += 1
-            remaining_cost -= entry_amount
-
-db.commit()
-print(f"原価 {cost_count}件 を登録しました")
-
-# ========== 配置データ（段取り） ==========
-print("\n配置データを生成中...")
-
-today = date.today()
-assignment_count = 0
-
-# 施工中の現場を取得
-active_projects = [p for p in projects if p.status == "施工中"]
-
-for day_offset in range(7):  # 今日から1週間分
-    target_date = today + timedelta(days=day_offset)
-
-    # 作業員をシャッフルして配置
-    available_workers = workers.copy()
-    random.shuffle(available_workers)
-
-    for project in active_projects:
-        # 各現場に2〜5人配置
-        num_workers = random.randint(2, 5)
-
-        for _ in range(num_workers):
-            if not available_workers:
-                break
-
-            worker = available_workers.pop()
-
-            assignment = Assignment(
-                worker_id=worker.id,
-                project_id=project.id,
-                date=target_date,
-                start_time="08:00",
-                end_time="17:00",
-                note=""
-            )
-            db.add(assignment)
-            assignment_count += 1
-
-db.commit()
-print(f"配置 {assignment_count}件 を登録しました")
-
-# ========== 経費データ ==========
-print("\n経費データを生成中...")
-
-# Fuel expenses
-fuel_categories = [c for c in expense_categories if c.is_fuel]
-non_fuel_categories = [c for c in expense_categories if not c.is_fuel]
-
-expense_count = 0
-for _ in range(20):
-    expense_date = today - timedelta(days=random.randint(0, 30))
-    project = random.choice(active_projects) if active_projects else projects[0]
-
-    # 燃料費 or 一般経費
-    if random.random() < 0.4 and fuel_categories:
-        # 燃料費
-        category = random.choice(fuel_categories)
-        fuel_type = "regular" if category.name == "ガソリン" else "diesel"
-        fuel_liter = random.randint(20, 60)
-        expense = Expense(
-            project_id=project.id,
-            category_id=category.id,
-            expense_date=expense_date,
-            amount=None,  # 燃料費は単価×リッターで計算
-            fuel_type=fuel_type,
-            fuel_liter=fuel_liter,
-            store_name=random.choice(["ENEOS", "出光", "コスモ石油", "昭和シェル"]),
-            memo=f"現場向け給油",
-            status=random.choice(["pending", "approved"])
-        )
-    else:
-        # 一般経費
-        category = random.choice(non_fuel_categories) if non_fuel_categories else expense_categories[0]
-        expense = Expense(
-            project_id=project.id,
-            category_id=category.id,
-            expense_date=expense_date,
-            amount=random.randint(500, 15000),
-            fuel_type=None,
-            fuel_liter=None,
-            store_name=random.choice(["コンビニ", "ホームセンター", "事務用品店", "飲食店"]),
-            memo=f"{category.name}（現場使用）",
-            status=random.choice(["pending", "approved"])
-        )
-    db.add(expense)
-    expense_count += 1
-
-db.commit()
-print(f"経費 {expense_count}件 を登録しました")
-
-# ========== 完了 ==========
-print("\n" + "=" * 50)
-print("テストデータ生成完了！")
-print("=" * 50)
-print(f"""
-【生成したデータ】
-- 作業員: {len(workers)}人
-- 工事: {len(projects)}件（総受注額: {total_order:,}円）
-- 工種: {work_type_count}件
-- 原価: {cost_count}件
-- 配置: {assignment_count}件
-- 経費: {expense_count}件
-""")
-
-db.close()
+            week = day.isocalendar()[:2]
+            for worker in self.worker_rows:
+                if rng.random() > self.args.attendance_rate:
+                    continue
+                key = (worker.id, week)
+                project = current.get(key)
+                if project is None or not (project.start_date <= day <= project.end_date):
+                    project = current[key] = rng.choice(candidates)
+                assignments.append({
+                    "date": day, "project_id": project.id, "worker_id": worker.id,
+                    "start_time": "08:00", "end_time": "17:00", "note": "",
+                })
+                if day > self.end:
+                    continue
+                overtime = rng.choice([0, 0, 0, 0.5, 1, 2])
+                attendances.append({
+                    "worker_id": worker.id, "date": day, "project_id": project.id,
+                    "check_in": datetime.combine(day, datetime.min.time()) + timedelta(hours=7, minutes=rng.randint(30, 59)),
+                    "check_out": datetime.combine(day, datetime.min.time()) + timedelta(hours=17 + overtime),
+                    "overtime_hours": overtime,
+                })
+                reports.append({
+                    "date": day, "worker_id": worker.id, "project_id": project.id,
+                    "hours": 8, "overtime_hours": overtime,
+                })
+            if len(assignments) >= CHUNK_SIZE:
+                flush()
+            # 週が変わったら前の週の割り当ては不要
+            if day.weekday() == 4:
+                current.clear()
+        flush()
+        self.db.commit()
+        for name, count in counts.items():
+            self.log(name, count)
+
+    # ---------- メッセージ・写真・経費 ----------
+
+    def messages(self):
+        rng = self.rng
+        total = self.args.messages if self.args.messages is not None else len(self.started) * 10
+        if not self.started:
+            return
+
+        def rows():
+            for _ in range(total):
+                p = self.started[rng.randrange(len(self.started))]
+                worker = rng.choice(self.worker_rows)
+                days = (min(p.end_date, self.end) - p.start_date).days
+                sent_at = datetime.combine(p.start_date, datetime.min.time()) + timedelta(
+                    days=rng.randint(0, max(days, 0)), minutes=rng.randint(7 * 60, 19 * 60))
+                yield {
+                    "project_id": p.id, "sender_id": str(worker.id), "sender_name": worker.name,
+                    "content": rng.choice(MESSAGES), "sent_at": sent_at,
+                    "is_read": (self.end - sent_at.date()).days > 3 or rng.random() < 0.5,
+                }
+
+        count = bulk_insert(self.db, Message, rows())
+        self.db.commit()
+        self.log("メッセージ", count)
+
+    def photos(self):
+        rng = self.rng
+        total = self.args.photos if self.args.photos is not None else len(self.started) * 10
+        if not self.started:
+            return
+
+        def rows():
+            for i in range(total):
+                p = self.started[rng.randrange(len(self.started))]
+                worker = rng.choice(self.worker_rows)
+                days = (min(p.end_date, self.end) - p.start_date).days
+                offset = rng.randint(0, max(days, 0))
+                category = PHOTO_CATEGORIES[min(int(offset / (days + 1) * 3), 2)]
+                yield {
+                    "project_id": p.id, "category": category, "work_type": rng.choice(WORK_TYPE_TEMPLATES)[0],
+                    "photo_path": f"uploads/photos/{p.id}/{i + 1}.jpg",
+                    "thumbnail_path": f"uploads/photos/{p.id}/{i + 1}_thumb.jpg",
+                    "taken_at": datetime.combine(p.start_date, datetime.min.time()) + timedelta(
+                        days=offset, minutes=rng.randint(8 * 60, 17 * 60)),
+                    "taken_by": worker.name,
+                }
+
+        count = bulk_insert(self.db, SitePhoto, rows())
+        self.db.commit()
+        self.log("工事写真", count)
+
+    def expenses(self):
+        rng = self.rng
+        active = [p for p in self.started if p.status == "施工中"] or self.started
+        if not active:
+            return
+        fuel = [(name, cid) for name, (cid, is_fuel) in self.category_ids.items() if is_fuel]
+        other = [(name, cid) for name, (cid, is_fuel) in self.category_ids.items() if not is_fuel]
+
+        def rows():
+            for _ in range(self.args.expenses):
+                p = rng.choice(active)
+                # 一括INSERTでは全行のキーを揃える
+                row = {
+                    "project_id": p.id, "expense_date": self.end - timedelta(days=rng.randint(0, 30)),
+                    "status": rng.choice(["pending", "approved"]), "fuel_type": None, "fuel_liter": None,
+                }
+                if rng.random() < 0.4:
+                    name, cid = rng.choice(fuel)
+                    row.update(category_id=cid, amount=None, fuel_type="regular" if name == "ガソリン" else "diesel",
+                               fuel_liter=rng.randint(20, 60), memo="現場向け給油",
+                               store_name=rng.choice(["ENEOS", "出光", "コスモ石油", "昭和シェル"]))
+                else:
+                    name, cid = rng.choice(other)
+                    row.update(category_id=cid, amount=rng.randint(500, 15000), memo=f"{name}（現場使用）",
+                               store_name=rng.choice(["コンビニ", "ホームセンター", "事務用品店", "飲食店"]))
+                yield row
+
+        count = bulk_insert(self.db, Expense, rows())
+        self.db.commit()
+        self.log("経費", count)
+
+    def quotes(self):
+        rng = self.rng
+        total = self.args.quotes if self.args.quotes is not None else len(self.project_rows) * 2
+        plans = []  # (見積番号, 明細)
+
+        def quote_rows():
+            for i in range(total):
+                p = rng.choice(self.project_rows)
+                issue_date = p.start_date - timedelta(days=rng.randint(10, 60))
+                items = []
+                for name, details in rng.sample(WORK_TYPE_TEMPLATES, rng.randint(2, 4)):
+                    for detail in details:
+                        quantity = rng.randint(10, 300)
+                        unit_price = rng.randint(detail[2], detail[3])
+                        items.append((f"{name} {detail[0]}", detail[1], quantity, unit_price))
+                subtotal = sum(q * price for _, _, q, price in items)
+                status = rng.choice(["draft", "sent", "ordered", "rejected"])
+                quote_no = f"Q{issue_date.year}-{i + 1:06d}"
+                plans.append((quote_no, items))
+                yield {
+                    "quote_no": quote_no, "title": p.name, "client_name": p.client, "issue_date": issue_date,
+                    "valid_until": issue_date + timedelta(days=30), "subtotal": subtotal,
+                    "tax_amount": int(subtotal * 0.1), "total": subtotal + int(subtotal * 0.1), "notes": "",
+                    "status": status, "project_id": p.id if status == "ordered" else None,
+                }
+
+        count = bulk_insert(self.db, QuoteDocument, quote_rows())
+        self.db.flush()
+        ids = dict(self.db.execute(select(QuoteDocument.quote_no, QuoteDocument.id)).all())
+
+        def item_rows():
+            for quote_no, items in plans:
+                for seq, (name, unit, quantity, unit_price) in enumerate(items, 1):
+                    yield {
+                        "quote_id": ids[quote_no], "seq": seq, "name": name, "specification": "",
+                        "quantity": quantity, "unit": unit, "unit_price": unit_price, "amount": quantity * unit_price,
+                    }
+
+        item_count = bulk_insert(self.db, QuoteItem, item_rows())
+        self.db.commit()
+        self.log("見積書", count)
+        self.log("見積明細", item_count)
+
+
+def add_size_arguments(parser: argparse.ArgumentParser):
+    """データ量・シード・基準日の引数（benchmark.py と共通）"""
+    parser.add_argument("--workers", type=int, default=50, help="作業員数")
+    parser.add_argument("--projects", type=int, default=20, help="工事数")
+    parser.add_argument("--years", type=float, default=1, help="基準日から遡る期間（年）")
+    parser.add_argument("--costs", type=int, default=None, help="原価の件数（既定: 着工済み工事数×20）")
+    parser.add_argument("--payables", type=int, default=None, help="支払予定の件数（既定: 原価の1割）")
+    parser.add_argument("--messages", type=int, default=None, help="メッセージの件数（既定: 着工済み工事数×10）")
+    parser.add_argument("--photos", type=int, default=None, help="工事写真の件数（既定: 着工済み工事数×10）")
+    parser.add_argument("--expenses", type=int, default=20, help="経費の件数")
+    parser.add_argument("--attendance-rate", type=float, default=0.9, help="平日に出勤する割合")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date.today(), help="基準日（YYYY-MM-DD）")
+    parser.add_argument("--quotes", type=int, default=None, help="見積書の件数（既定: 工事数×2）")
+    parser.add_argument("--seed", type=int, default=42, help="乱数のシード")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="テストデータを生成（生成対象のテーブルは削除して作り直す）")
+    add_size_arguments(parser)
+    parser.add_argument("--database-url", default=None, help="作成先のDB（既定: DATABASE_URL）")
+    return parser.parse_args(argv)
+
+
+def generate(db: Session, args) -> dict:
+    """テストデータを作成し、テーブルごとの件数を返す"""
+    return Generator(db, args).run()
+
+
+def main(argv=None):
+    from database import Base, SessionLocal, create_db_engine, engine
+    from sqlalchemy.orm import sessionmaker
+    import migrations
+
+    args = parse_args(argv)
+    target = create_db_engine(args.database_url) if args.database_url else engine
+    Base.metadata.create_all(bind=target)
+    migrations.upgrade(target)
+    session_factory = sessionmaker(bind=target) if args.database_url else SessionLocal
+
+    print("=" * 50)
+    print("テストデータ生成開始")
+    print("=" * 50)
+    started = time.perf_counter()
+    with session_factory() as db:
+        counts = generate(db, args)
+    elapsed = time.perf_counter() - started
+
+    print("\n" + "=" * 50)
+    print(f"テストデータ生成完了！（{elapsed:.1f}秒）")
+    print("=" * 50)
+    print(f"合計 {sum(counts.values()):,}行")
+
+
+if __name__ == "__main__":
+    main()
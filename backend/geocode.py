@@ -0,0 +1,151 @@
+"""
+ジオコーディング（国土地理院 AddressSearch API使用）
+
+住所を正規化したキーで geocode_cache テーブルにキャッシュし、
+同じ住所（全角・半角や空白の違いを含む）で外部APIを呼ばないようにする。
+まとめて取得する場合は同時実行数と1秒あたりの件数を制限する。
+"""
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from http_client import get_client
+from database import SessionLocal, upsert_insert
+from models import GeocodeCache
+
+GSI_GEOCODE_URL = os.getenv("GSI_GEOCODE_URL", "https://msearch.gsi.go.jp/address-search/AddressSearch")
+
+# まとめて取得するときの同時実行数と1秒あたりの上限（上限はすべての呼び出しで共有）
+BATCH_CONCURRENCY = 4
+RATE_PER_SECOND = 5
+# 見つからなかった住所を再検索しない期間
+NOT_FOUND_TTL = timedelta(days=7)
+
+# 通信エラーで検索できなかった住所（lookup_many の結果。見つからなかった None とは区別する）
+FAILED = object()
+
+_HYPHENS = re.compile(r"[‐‑‒–—―−－]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    """キャッシュ用に住所を正規化（全角英数→半角、ハイフン統一、空白除去）"""
+    key = unicodedata.normalize("NFKC", address or "")
+    key = _HYPHENS.sub("-", key)
+    return _SPACES.sub("", key)
+
+
+class RateLimiter:
+    """1秒あたり rate 回まで（呼び出し間隔を 1/rate 秒以上あける）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        # 枠の確保は await を挟まないのでロック不要（モジュール共有でもイベントループに縛られない）
+        now = time.monotonic()
+        delay = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# 一括検索・1件検索のどちらも同じ制限を通す
+_limiter = RateLimiter(RATE_PER_SECOND)
+
+
+async def fetch(address: str):
+    """APIで検索。見つかれば {latitude, longitude, address}、見つからなければ None"""
+    response = await get_client().get(GSI_GEOCODE_URL, params={"q": address})
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        # 最初の結果を使用
+        result = data[0]
+        coordinates = result.get("geometry", {}).get("coordinates", [])
+        if len(coordinates) >= 2:
+            return {
+                "latitude": coordinates[1],  # 緯度
+                "longitude": coordinates[0],  # 経度
+                "address": result.get("properties", {}).get("title", address)
+            }
+    return None
+
+
+def _load(keys) -> dict:
+    """キャッシュ済みの住所 {key: 結果 or None（見つからなかった）}"""
+    with SessionLocal() as db:
+        rows = db.query(GeocodeCache).filter(GeocodeCache.address_key.in_(list(keys))).all()
+    cached = {}
+    for r in rows:
+        if r.found:
+            cached[r.address_key] = {"latitude": r.latitude, "longitude": r.longitude, "address": r.title}
+        elif r.fetched_at > datetime.now() - NOT_FOUND_TTL:
+            cached[r.address_key] = None
+    return cached
+
+
+def _save(results: dict):
+    """検索結果を保存 {key: 結果 or None}（同じ住所を同時に検索した場合に備えて upsert）"""
+    now = datetime.now()
+    rows = [
+        {
+            "address_key": key,
+            "found": result is not None,
+            "latitude": result["latitude"] if result else None,
+            "longitude": result["longitude"] if result else None,
+            "title": result["address"] if result else None,
+            "fetched_at": now,
+        }
+        for key, result in results.items()
+    ]
+    with SessionLocal() as db:
+        stmt = upsert_insert(db.get_bind(), GeocodeCache).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["address_key"],
+            set_={column: stmt.excluded[column] for column in ("found", "latitude", "longitude", "title", "fetched_at")},
+        ))
+        db.commit()
+
+
+async def lookup(address: str):
+    """1件検索（キャッシュ優先）。通信エラーは例外"""
+    return (await lookup_many([address], raise_errors=True))[address]
+
+
+async def lookup_many(addresses, raise_errors: bool = False) -> dict:
+    """
+    複数住所を検索して {住所: 結果 / None（見つからない） / FAILED（通信エラー）} を返す
+
+    キャッシュにない住所だけ、同時実行数・レート制限つきでAPIを呼ぶ。
+    通信エラーになった住所はキャッシュせず、後で再試行できるよう FAILED にする。
+    """
+    keys = {a: normalize_address(a) for a in addresses}
+    results = await run_in_threadpool(_load, set(keys.values()))
+    missing = [k for k in dict.fromkeys(keys.values()) if k and k not in results]
+
+    if missing:
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def fetch_one(key):
+            async with semaphore:
+                await _limiter.wait()
+                try:
+                    return key, await fetch(key), True
+                except (httpx.HTTPError, ValueError):
+                    if raise_errors:
+                        raise
+                    return key, FAILED, False
+
+        fetched = await asyncio.gather(*(fetch_one(k) for k in missing))
+        new = {key: result for key, result, ok in fetched if ok}
+        if new:
+            await run_in_threadpool(_save, new)
+        results.update({key: result for key, result, _ in fetched})
+
+    return {a: results.get(k) for a, k in keys.items()}
@@ -0,0 +1,33 @@
+"""
+外部API呼び出し用の共有HTTPクライアント
+
+リクエストごとに AsyncClient を作るとTLS接続を毎回張り直すため、
+アプリ起動中は1つのクライアント（コネクションプール）を使い回す。
+起動・終了はアプリの lifespan から startup() / shutdown() を呼ぶ。
+"""
+from typing import Optional
+import httpx
+
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """共有クライアントを返す（lifespan 外から呼ばれた場合はその場で作成）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=POOL_LIMITS)
+    return _client
+
+
+async def startup():
+    get_client()
+
+
+async def shutdown():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,180 @@
+"""
+Excel取込ジョブ（/api/import-jobs/*）
+
+アップロードされたファイルを一時ファイルに保存してジョブを登録し、すぐにジョブIDを返す。
+解析は共有のプロセスプール（process_pool）で行い、ワーカーが読み込んだシート数・行数を
+import_jobs テーブルに書き込む。解析結果の登録とジョブの完了は同じトランザクションで
+commit するため、途中で失敗しても工事・明細が中途半端に残らない。
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from cache import response_cache
+from database import SessionLocal
+from models import ImportJob
+import excel_import
+import process_pool
+
+# 完了していないジョブの状態
+ACTIVE_STATUSES = ("queued", "parsing", "saving")
+
+_tasks = set()
+
+
+def _parse_budget(path, params, progress):
+    return excel_import.parse_budget_workbook(path, params["vendor"], params["category"], progress=progress)
+
+
+def _parse_project(path, params, progress):
+    return excel_import.parse_project_workbook(path, params["vendor"], params["category"], progress=progress)
+
+
+def _parse_estimate(path, params, progress):
+    return excel_import.parse_estimate_workbook(path, progress=progress)
+
+
+def _save_budget(db, job, parsed, params):
+    return excel_import.save_budget_items(db, params["project_id"], parsed)
+
+
+def _save_project(db, job, parsed, params):
+    return excel_import.create_project_from_workbook(db, parsed, job.filename)
+
+
+def _save_estimate(db, job, parsed, params):
+    return excel_import.create_project_from_estimate(db, parsed)
+
+
+# 種類 -> (解析, 登録, 登録後に破棄するキャッシュ)
+KINDS = {
+    "budget": (_parse_budget, _save_budget, ()),
+    "project": (_parse_project, _save_project, ("analytics", "dashboard", "dashboard_summary", "projects_with_weather")),
+    "estimate": (_parse_estimate, _save_estimate, ("analytics", "dashboard", "dashboard_summary", "projects_with_weather")),
+}
+
+
+def _update_job(job_id: int, **values):
+    with SessionLocal() as db:
+        db.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+        db.commit()
+
+
+def recover():
+    """サーバー停止で中断されたジョブを失敗にする（起動時に呼ぶ）"""
+    with SessionLocal() as db:
+        db.execute(
+            update(ImportJob).where(ImportJob.status.in_(ACTIVE_STATUSES)).values(
+                status="failed", message="サーバーの再起動により中断されました", finished_at=datetime.now()
+            )
+        )
+        db.commit()
+
+
+# ---------- ワーカープロセス ----------
+
+def _parse_in_worker(job_id: int, kind: str, path: str, params: dict) -> dict:
+    """ワーカープロセスでファイルを解析し、シートを読むたびに進捗を記録する"""
+    parse = KINDS[kind][0]
+    _update_job(job_id, status="parsing", started_at=datetime.now())
+
+    def progress(sheets_done, sheets_total, rows_read):
+        _update_job(job_id, sheets_done=sheets_done, sheets_total=sheets_total, rows_read=rows_read)
+
+    return parse(path, params, progress)
+
+
+# ---------- 登録 ----------
+
+def _spool(upload_file) -> str:
+    """アップロードを一時ファイルに書き出す（ワーカープロセスに渡すため）"""
+    fd, path = tempfile.mkstemp(prefix="import_", suffix=".xlsx")
+    with os.fdopen(fd, "wb") as out:
+        upload_file.seek(0)
+        shutil.copyfileobj(upload_file, out)
+    return path
+
+
+def _create_job(kind: str, filename: str, params: dict) -> int:
+    with SessionLocal() as db:
+        job = ImportJob(kind=kind, filename=filename, params=json.dumps(params, ensure_ascii=False), status="queued")
+        db.add(job)
+        db.commit()
+        return job.id
+
+
+def _save(job_id: int, kind: str, parsed: dict, params: dict) -> dict:
+    """解析結果を登録し、同じトランザクションでジョブを完了にする"""
+    save = KINDS[kind][1]
+    with SessionLocal() as db:
+        job = db.get(ImportJob, job_id)
+        result = save(db, job, parsed, params)
+        job.status = "succeeded"
+        job.rows_imported = result.get("count", result.get("details_count", 0))
+        job.result = json.dumps({k: v for k, v in result.items() if k != "items"}, ensure_ascii=False, default=str)
+        job.finished_at = datetime.now()
+        db.commit()
+        return result
+
+
+async def _run(job_id: int, kind: str, path: str, params: dict):
+    try:
+        parsed = await process_pool.submit(_parse_in_worker, job_id, kind, path, params)
+        await run_in_threadpool(
+            _update_job, job_id, status="saving", errors=json.dumps(parsed["errors"], ensure_ascii=False)
+        )
+        await run_in_threadpool(_save, job_id, kind, parsed, params)
+        if KINDS[kind][2]:
+            response_cache.invalidate(*KINDS[kind][2])
+    except Exception as e:
+        print(f"取込ジョブ{job_id}の処理に失敗しました: {e}")
+        await run_in_threadpool(
+            _update_job, job_id, status="failed", message=str(e) or type(e).__name__, finished_at=datetime.now()
+        )
+    finally:
+        os.unlink(path)
+
+
+async def submit(kind: str, upload, params: dict) -> int:
+    """アップロードされたファイルの取込ジョブを登録して開始し、ジョブIDを返す"""
+    path = await run_in_threadpool(_spool, upload.file)
+    try:
+        job_id = await run_in_threadpool(_create_job, kind, upload.filename, params)
+    except Exception:
+        os.unlink(path)
+        raise
+    task = asyncio.create_task(_run(job_id, kind, path, params))
+    # 実行中のタスクが破棄されないよう参照を保持
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+def serialize_job(job: ImportJob) -> dict:
+    if job.status == "succeeded":
+        progress = 100
+    elif job.sheets_total:
+        progress = int(job.sheets_done * 100 / job.sheets_total)
+    else:
+        progress = 0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "filename": job.filename,
+        "status": job.status,
+        "progress": progress,
+        "sheets_total": job.sheets_total or 0,
+        "sheets_done": job.sheets_done or 0,
+        "rows_read": job.rows_read or 0,
+        "rows_imported": job.rows_imported or 0,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "result": json.loads(job.result) if job.result else None,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -1,13 +1,15 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, insert, select, update, true
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import date, datetime
-import httpx
-from database import engine, get_db, Base
+from contextlib import asynccontextmanager
+import asyncio
+from database import engine, get_db, Base, SessionLocal, async_engine, get_async_db
 from models import (
     Project, Cost, Billing, FixedCost, Client, Vendor, Material,
     Machine, WorkType, Settings, BudgetDetail,
@@ -24,18 +26,65 @@ from models import (
     DailyReport, DocumentSend, CompanySettings,
     LineWorksSettings, LineWorksUser, LineWorksNotification, LineWorksLog,
     BusinessCard, QuoteDocument, QuoteItem,
-    Member, HotelRequest
+    Member, HotelRequest, ProjectCostRollup, ImportJob
 )
+import cost_rollup
+import migrations
+import analytics
+from cache import response_cache
+import http_client
+import weather
+import geocode
+import exports
+import excel_import
+import estimate_excel
+import import_jobs
+import process_pool
+import zip_stream
+import pdf_cache
+import pdf_documents
+import sql_stats
 from dateutil.relativedelta import relativedelta
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-import tempfile
-import os
+from urllib.parse import quote
+import json
+import hashlib
 
 Base.metadata.create_all(bind=engine)
+# 既存DBへのインデックス追加など（未適用分のみ）
+migrations.upgrade(engine)
 
-app = FastAPI(title="S-BASE API")
+# 原価集計テーブルの初期構築（導入直後のみ）
+with SessionLocal() as _db:
+    cost_rollup.ensure_built(_db)
+
+
+def _active_site_points():
+    """天気の定期更新対象（稼働中で位置情報のある現場）"""
+    with SessionLocal() as db:
+        return db.query(Project.latitude, Project.longitude).filter(
+            Project.status.in_(ACTIVE_STATUSES),
+            Project.latitude.isnot(None),
+            Project.longitude.isnot(None)
+        ).all()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.startup()
+    import_jobs.recover()
+    removed = await run_in_threadpool(pdf_cache.prune)
+    if removed:
+        print(f"古いPDFキャッシュを {removed} 件削除しました")
+    weather_refresher = weather.start_refresher(_active_site_points)
+    yield
+    if weather_refresher:
+        weather_refresher.cancel()
+    process_pool.shutdown()
+    await http_client.shutdown()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="S-BASE API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,8 +92,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 別オリジンのフロントエンドからも読めるようにする（一覧の総件数・次ページの cursor）
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
+# SQL実行状況の計測（SQL_STATS=1 のときだけ）
+if sql_stats.ENABLED:
+    sql_stats.instrument(engine, async_engine.sync_engine)
+    app.add_middleware(sql_stats.SQLStatsMiddleware)
+
 # Pydantic Models
 class ProjectCreate(BaseModel):
     code: Optional[str] = None
@@ -328,50 +384,12 @@ class NotificationCreate(BaseModel):
     link: Optional[str] = None
 
 # ========== Projects ==========
-@app.get("/api/projects")
-def get_projects(db: Session = Depends(get_db)):
-    projects = db.query(Project).order_by(Project.id.desc()).all()
-    result = []
-    for p in projects:
-        total_cost = db.query(func.sum(Cost.amount)).filter(Cost.project_id == p.id).scalar() or 0
-        order_amount = p.order_amount or 0
-        sales_profit = p.sales_profit or 0  # DBから直接取得
-        budget_amount = order_amount - sales_profit  # 自動計算
-        construction_profit = budget_amount - total_cost
-        total_profit = sales_profit + construction_profit
-
-        # 利益率（対受注額）
-        sales_profit_rate = round((sales_profit / order_amount * 100), 1) if order_amount > 0 else 0
-        construction_profit_rate = round((construction_profit / order_amount * 100), 1) if order_amount > 0 else 0
-        total_profit_rate = round((total_profit / order_amount * 100), 1) if order_amount > 0 else 0
+# 進行中とみなすステータス（status=active で指定可能）
+ACTIVE_STATUSES = ["施工中", "受注確定"]
 
-        result.append({
-            "id": p.id, "code": p.code, "name": p.name, "client": p.client, "status": p.status,
-            "order_type": p.order_type, "prefecture": p.prefecture, "probability": p.probability,
-            "order_amount": order_amount, "budget_amount": budget_amount, "tax_rate": p.tax_rate,
-            "period": p.period, "sales_person": p.sales_person, "site_person": p.site_person,
-            "address": p.address, "latitude": p.latitude, "longitude": p.longitude,
-            "start_date": str(p.start_date) if p.start_date else None,
-            "end_date": str(p.end_date) if p.end_date else None,
-            "total_cost": total_cost,
-            "contract_amount": order_amount,  # 互換性のため
-            "actual_cost": total_cost,  # 互換性のため
-            "sales_profit": sales_profit,
-            "construction_profit": construction_profit,
-            "total_profit": total_profit,
-            "sales_profit_rate": sales_profit_rate,
-            "construction_profit_rate": construction_profit_rate,
-            "total_profit_rate": total_profit_rate,
-        })
-    return result
-
-@app.get("/api/projects/{project_id}")
-def get_project(project_id: int, db: Session = Depends(get_db)):
-    """単一工事の取得"""
-    p = db.query(Project).filter(Project.id == project_id).first()
-    if not p:
-        raise HTTPException(status_code=404, detail="Project not found")
-    total_cost = db.query(func.sum(Cost.amount)).filter(Cost.project_id == p.id).scalar() or 0
+def serialize_project(p, total_cost):
+    """工事の一覧・詳細で共通のレスポンス（利益・利益率を含む）"""
+    total_cost = total_cost or 0
     order_amount = p.order_amount or 0
     sales_profit = p.sales_profit or 0  # DBから直接取得
     budget_amount = order_amount - sales_profit  # 自動計算
@@ -387,18 +405,102 @@ def get_project(project_id: int, db: Session = Depends(get_db)):
         "id": p.id, "code": p.code, "name": p.name, "client": p.client, "status": p.status,
         "order_type": p.order_type, "prefecture": p.prefecture, "probability": p.probability,
         "order_amount": order_amount, "budget_amount": budget_amount, "tax_rate": p.tax_rate,
-        "period": p.period, "start_date": str(p.start_date) if p.start_date else None,
-        "end_date": str(p.end_date) if p.end_date else None,
-        "sales_person": p.sales_person, "site_person": p.site_person,
+        "period": p.period, "sales_person": p.sales_person, "site_person": p.site_person,
         "address": p.address, "latitude": p.latitude, "longitude": p.longitude,
+        "start_date": str(p.start_date) if p.start_date else None,
+        "end_date": str(p.end_date) if p.end_date else None,
         "total_cost": total_cost,
         "contract_amount": order_amount,  # 互換性のため
+        "actual_cost": total_cost,  # 互換性のため
         "sales_profit": sales_profit,
         "construction_profit": construction_profit,
         "total_profit": total_profit,
         "sales_profit_rate": sales_profit_rate,
         "construction_profit_rate": construction_profit_rate,
         "total_profit_rate": total_profit_rate,
+    }
+
+def project_cost_totals(db: Session):
+    """工事別の原価合計（project_id, total_cost）のサブクエリ（原価集計テーブルから）"""
+    return db.query(
+        ProjectCostRollup.project_id.label("project_id"),
+        func.sum(ProjectCostRollup.amount).label("total_cost")
+    ).group_by(ProjectCostRollup.project_id).subquery()
+
+@app.get("/api/projects")
+def get_projects(
+    response: Response,
+    status: Optional[str] = None,
+    probability: Optional[str] = None,
+    sort: str = "id",
+    order: str = "desc",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    db: Session = Depends(get_db)
+):
+    """工事一覧（原価は集計済みサブクエリをJOINして1クエリで取得）
+
+    status / probability はカンマ区切りで複数指定可（status=active は進行中の工事）。
+    limit 指定時は X-Total-Count ヘッダーに絞り込み後の総件数を返す。
+    """
+    cost_totals = project_cost_totals(db)
+    total_cost = func.coalesce(cost_totals.c.total_cost, 0)
+
+    sort_columns = {
+        "id": Project.id,
+        "code": Project.code,
+        "name": Project.name,
+        "client": Project.client,
+        "status": Project.status,
+        "order_amount": Project.order_amount,
+        "start_date": Project.start_date,
+        "end_date": Project.end_date,
+        "created_at": Project.created_at,
+        "updated_at": Project.updated_at,
+        "total_cost": total_cost,
+    }
+    if sort not in sort_columns:
+        raise HTTPException(status_code=400, detail=f"Invalid sort: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Invalid order: {order}")
+
+    filters = []
+    if status:
+        statuses = []
+        for s in status.split(","):
+            s = s.strip()
+            statuses.extend(ACTIVE_STATUSES if s == "active" else [s])
+        filters.append(Project.status.in_(statuses))
+    if probability:
+        filters.append(Project.probability.in_([s.strip() for s in probability.split(",")]))
+
+    sort_column = sort_columns[sort]
+    query = db.query(Project, total_cost).outerjoin(
+        cost_totals, cost_totals.c.project_id == Project.id
+    ).filter(*filters).order_by(
+        sort_column.asc() if order == "asc" else sort_column.desc(),
+        Project.id.desc()
+    )
+
+    if limit is not None:
+        limit = max(1, min(limit, 1000))
+        offset = max(0, offset)
+        response.headers["X-Total-Count"] = str(db.query(Project).filter(*filters).count())
+        query = query.offset(offset).limit(limit)
+
+    return [serialize_project(p, cost) for p, cost in query.all()]
+
+@app.get("/api/projects/{project_id:int}")
+def get_project(project_id: int, db: Session = Depends(get_db)):
+    """単一工事の取得"""
+    p = db.query(Project).filter(Project.id == project_id).first()
+    if not p:
+        raise HTTPException(status_code=404, detail="Project not found")
+    total_cost = db.query(func.sum(ProjectCostRollup.amount)).filter(
+        ProjectCostRollup.project_id == p.id
+    ).scalar() or 0
+    return {
+        **serialize_project(p, total_cost),
         "created_at": str(p.created_at) if p.created_at else None,
         "updated_at": str(p.updated_at) if p.updated_at else None,
     }
@@ -414,6 +516,7 @@ def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
     db_project = Project(**project_data)
     db.add(db_project)
     db.commit()
+    response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
     db.refresh(db_project)
     return db_project
 
@@ -425,6 +528,7 @@ def update_project(project_id: int, project: ProjectCreate, db: Session = Depend
     for key, value in project.dict().items():
         setattr(db_project, key, value)
     db.commit()
+    response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
     return db_project
 
 @app.delete("/api/projects/{project_id}")
@@ -432,8 +536,10 @@ def delete_project(project_id: int, db: Session = Depends(get_db)):
     db_project = db.query(Project).filter(Project.id == project_id).first()
     if db_project:
         db.query(Cost).filter(Cost.project_id == project_id).delete()
+        cost_rollup.remove_project(db, project_id)
         db.delete(db_project)
         db.commit()
+        response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
     return {"ok": True}
 
 # ========== Costs ==========
@@ -448,7 +554,9 @@ def get_costs(project_id: Optional[int] = None, db: Session = Depends(get_db)):
 def create_cost(cost: CostCreate, db: Session = Depends(get_db)):
     db_cost = Cost(**cost.dict())
     db.add(db_cost)
+    cost_rollup.apply_cost(db, db_cost)
     db.commit()
+    response_cache.invalidate("analytics", "dashboard")
     db.refresh(db_cost)
     return db_cost
 
@@ -456,22 +564,23 @@ def create_cost(cost: CostCreate, db: Session = Depends(get_db)):
 def delete_cost(cost_id: int, db: Session = Depends(get_db)):
     db_cost = db.query(Cost).filter(Cost.id == cost_id).first()
     if db_cost:
+        cost_rollup.apply_cost(db, db_cost, sign=-1)
         db.delete(db_cost)
         db.commit()
+        response_cache.invalidate("analytics", "dashboard")
     return {"ok": True}
 
 # ========== Monthly Data ==========
 @app.get("/api/projects/{project_id}/monthly")
 def get_monthly_data(project_id: int, db: Session = Depends(get_db)):
-    costs = db.query(Cost).filter(Cost.project_id == project_id).all()
+    rollups = db.query(ProjectCostRollup).filter(ProjectCostRollup.project_id == project_id).all()
     cost_by_month = {}
-    for c in costs:
-        if c.date:
-            key = c.date.strftime("%Y-%m")
-            if key not in cost_by_month:
-                cost_by_month[key] = {"労務費": 0, "材料費": 0, "外注費": 0, "経費": 0, "合計": 0}
-            cost_by_month[key][c.category] = cost_by_month[key].get(c.category, 0) + (c.amount or 0)
-            cost_by_month[key]["合計"] += (c.amount or 0)
+    for r in rollups:
+        key = r.year_month
+        if key not in cost_by_month:
+            cost_by_month[key] = {"労務費": 0, "材料費": 0, "外注費": 0, "経費": 0, "合計": 0}
+        cost_by_month[key][r.category] = cost_by_month[key].get(r.category, 0) + (r.amount or 0)
+        cost_by_month[key]["合計"] += (r.amount or 0)
     return [{"month": k, **v} for k, v in sorted(cost_by_month.items())]
 
 # ========== Work Type Stats ==========
@@ -490,10 +599,13 @@ def get_worktype_stats(project_id: int, db: Session = Depends(get_db)):
 # ========== Dashboard ==========
 @app.get("/api/dashboard")
 def get_dashboard(db: Session = Depends(get_db)):
+    return response_cache.get_or_set(("dashboard",), lambda: build_dashboard(db))
+
+def build_dashboard(db: Session):
     projects = db.query(Project).all()
     total_order = sum(p.order_amount or 0 for p in projects)
     total_budget = sum(p.budget_amount or 0 for p in projects)
-    total_cost = db.query(func.sum(Cost.amount)).scalar() or 0
+    total_cost = db.query(func.sum(ProjectCostRollup.amount)).scalar() or 0
     
     confirmed = [p for p in projects if p.probability == "確定"]
     likely = [p for p in projects if p.probability == "見込み有"]
@@ -726,157 +838,30 @@ def update_budget_detail(detail_id: int, detail: dict, db: Session = Depends(get
 
 # Excelファイルアップロード用
 from fastapi import File, UploadFile
-import openpyxl
-from io import BytesIO
+
+
+async def parse_excel_upload(parse, file: UploadFile, *args):
+    """アップロードされたExcelを excel_import の parse_* でワーカースレッド上で解析"""
+    try:
+        return await run_in_threadpool(parse, file.file, *args)
+    except excel_import.ExcelImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 @app.post("/api/budget-details/upload/{project_id}")
-async def upload_budget_excel(project_id: int, file: UploadFile = File(...), vendor: str = "", category: str = "外注費", db: Session = Depends(get_db)):
-    contents = await file.read()
-    wb = openpyxl.load_workbook(BytesIO(contents), data_only=True)
-    
-    items = []
-    for sheet in wb.worksheets:
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            # 空行スキップ
-            if not row or all(cell is None for cell in row):
-                continue
-            
-            # 名称を探す（最初の文字列セル）
-            name = None
-            spec = ""
-            qty = 0
-            unit = "式"
-            price = 0
-            amount = 0
-            note = ""
-            
-            # 列を解析
-            for i, cell in enumerate(row):
-                if cell is None:
-                    continue
-                cell_str = str(cell).strip()
-                
-                # スキップする行
-                skip_words = ['直接工事費', '諸経費', '機械回送費', '小計', '合計', '端数調整', '法定福利費', '労働災害', '内訳', '名称', '規格', '数量', '単位', '単価', '金額', '備考']
-                if any(skip in cell_str for skip in skip_words):
-                    name = None
-                    break
-                
-                # 数値判定
-                if isinstance(cell, (int, float)):
-                    if name and qty == 0 and cell > 0:
-                        qty = float(cell)
-                    elif name and qty > 0 and price == 0 and cell > 100:
-                        price = int(cell)
-                    elif name and price > 0 and amount == 0:
-                        amount = int(cell)
-                elif isinstance(cell, str) and cell.strip():
-                    if name is None:
-                        name = cell.strip()
-                    elif not spec:
-                        spec = cell.strip()
-                    elif cell in ['m2', 'ｍ2', 'm3', 'ｍ3', '式', '日', '日/式', '往復', 't', 'L', '人工', '台', '個', '本', 'kg', 'm', 'ｍ']:
-                        unit = cell.strip()
-                    else:
-                        note = cell.strip()
-            
-            if name and (qty > 0 or amount > 0):
-                items.append({
-                    "project_id": project_id,
-                    "category": category,
-                    "work_type": name,
-                    "vendor": vendor,
-                    "description": f"{spec}（{note}）" if note else spec,
-                    "quantity": qty,
-                    "unit": unit.replace('/式', '').replace('日/式', '日'),
-                    "unit_price": price,
-                    "amount": amount if amount > 0 else int(qty * price)
-                })
-    
-    # DB登録
-    for item in items:
-        db_detail = BudgetDetail(**item)
-        db.add(db_detail)
-    db.commit()
-    
-    return {"count": len(items), "items": items}
+async def upload_budget_excel(project_id: int, file: UploadFile = File(...), vendor: str = "", category: str = "外注費", db: AsyncSession = Depends(get_async_db)):
+    parsed = await parse_excel_upload(excel_import.parse_budget_workbook, file, vendor, category)
+    result = await db.run_sync(excel_import.save_budget_items, project_id, parsed)
+    await db.commit()
+    return {**result, "errors": parsed["errors"]}
 
 @app.post("/api/projects/upload-excel")
-async def upload_project_excel(file: UploadFile = File(...), vendor: str = "", category: str = "外注費", db: Session = Depends(get_db)):
-    contents = await file.read()
-    wb = openpyxl.load_workbook(BytesIO(contents), data_only=True)
-    
-    project_name = ""
-    client = ""
-    budget_items = []
-    
-    skip_keywords = ['直接工事費', '諸経費', '機械回送費', '小計', '合計', '端数調整', '法定福利費', '労働災害', '内訳明細書', '施工条件', '本見積', '御見積']
-    
-    for sheet in wb.worksheets:
-        if '条件書' in sheet.title:
-            continue
-        for row in sheet.iter_rows(values_only=True):
-            if not row:
-                continue
-            cells = [str(c).strip() if c else "" for c in row]
-            row_text = " ".join(cells)
-            
-            if '工事名' in row_text:
-                for c in row:
-                    if c and '工事名' not in str(c) and len(str(c)) > 5:
-                        project_name = str(c).strip()
-                        break
-            
-            if not client:
-                for c in row:
-                    if c and '御中' in str(c):
-                        client = str(c).replace('御中', '').strip()
-            
-            if any(kw in row_text for kw in skip_keywords):
-                continue
-            
-            nums = [c for c in row if isinstance(c, (int, float)) and c != 0]
-            if len(nums) >= 2:
-                name, spec, qty, unit, price, amount = "", "", 0, "式", 0, 0
-                for c in row:
-                    if c is None:
-                        continue
-                    if isinstance(c, (int, float)) and c != 0:
-                        if qty == 0 and c < 100000:
-                            qty = float(c)
-                        elif price == 0 and c >= 100:
-                            price = int(c)
-                        elif amount == 0:
-                            amount = int(c)
-                    elif isinstance(c, str) and c.strip():
-                        cs = c.strip()
-                        if cs in ['m2', 'm3', '式', '日', '往復', 't', 'L', '人工', '台']:
-                            unit = cs
-                        elif not name and len(cs) > 2:
-                            name = cs
-                        elif name and not spec:
-                            spec = cs
-                
-                if name and (qty > 0 or amount > 0):
-                    if amount == 0:
-                        amount = int(qty * price)
-                    budget_items.append({"category": category, "work_type": name, "vendor": vendor, "description": spec, "quantity": qty, "unit": unit, "unit_price": price, "amount": amount})
-    
-    new_project = Project(code=str(1000 + db.query(Project).count() + 1), name=project_name or file.filename.replace('.xlsx', ''), client=client, status="見積中", order_type="一次請", prefecture="", probability="見込み有", order_amount=0, budget_amount=0, tax_rate=0.1, period="", sales_person="", site_person="")
-    db.add(new_project)
-    db.commit()
-    db.refresh(new_project)
-    
-    total = 0
-    for item in budget_items:
-        item["project_id"] = new_project.id
-        db.add(BudgetDetail(**item))
-        total += item.get("amount", 0)
-    
-    new_project.budget_amount = total
-    db.commit()
-    
-    return {"project_id": new_project.id, "name": new_project.name, "count": len(budget_items), "total": total}
+async def upload_project_excel(file: UploadFile = File(...), vendor: str = "", category: str = "外注費", db: AsyncSession = Depends(get_async_db)):
+    parsed = await parse_excel_upload(excel_import.parse_project_workbook, file, vendor, category)
+    result = await db.run_sync(excel_import.create_project_from_workbook, parsed, file.filename)
+    await db.commit()
+    response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
+    return {**result, "errors": parsed["errors"]}
 
 
 if __name__ == "__main__":
@@ -1024,6 +1009,7 @@ def create_progress(data: MonthlyProgressCreate, db: Session = Depends(get_db)):
         db.add(progress)
         db.commit()
         db.refresh(progress)
+    response_cache.invalidate("analytics")
 
     # 自動連携: 入金予定を作成
     project = db.query(Project).filter(Project.id == data.project_id).first()
@@ -1070,6 +1056,7 @@ def update_progress(progress_id: int, data: dict, db: Session = Depends(get_db))
     for key, value in data.items():
         setattr(progress, key, value)
     db.commit()
+    response_cache.invalidate("analytics")
     return progress
 
 @app.delete("/api/progress/{progress_id}")
@@ -1080,6 +1067,7 @@ def delete_progress(progress_id: int, db: Session = Depends(get_db)):
         db.query(Receivable).filter(Receivable.progress_id == progress_id).delete()
         db.delete(progress)
         db.commit()
+        response_cache.invalidate("analytics")
     return {"ok": True}
 
 
@@ -1258,194 +1246,124 @@ def get_cashflow(year_month: Optional[str] = None, db: Session = Depends(get_db)
 async def geocode_address(address: str):
     """住所から緯度経度を取得（国土地理院API使用）"""
     try:
-        async with httpx.AsyncClient() as client:
-            # 国土地理院のジオコーディングAPI
-            url = f"https://msearch.gsi.go.jp/address-search/AddressSearch?q={address}"
-            response = await client.get(url)
-
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    # 最初の結果を使用
-                    result = data[0]
-                    coordinates = result.get("geometry", {}).get("coordinates", [])
-                    if len(coordinates) >= 2:
-                        return {
-                            "success": True,
-                            "latitude": coordinates[1],  # 緯度
-                            "longitude": coordinates[0],  # 経度
-                            "address": result.get("properties", {}).get("title", address)
-                        }
-
-            return {"success": False, "error": "住所が見つかりませんでした"}
+        result = await geocode.lookup(address)
+        if result:
+            return {"success": True, **result}
+        return {"success": False, "error": "住所が見つかりませんでした"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def _projects_missing_location(db: Session, project_ids: Optional[List[int]]):
+    query = db.query(Project.id, Project.address).filter(
+        Project.address.isnot(None),
+        Project.address != "",
+        (Project.latitude.is_(None)) | (Project.longitude.is_(None))
+    )
+    if project_ids:
+        query = query.filter(Project.id.in_(project_ids))
+    return query.all()
+
+
+def _update_project_locations(db: Session, locations: dict):
+    for project in db.query(Project).filter(Project.id.in_(list(locations))).all():
+        project.latitude, project.longitude = locations[project.id]
+    db.commit()
+
+
+class GeocodeBatchRequest(BaseModel):
+    project_ids: Optional[List[int]] = None  # 省略時は位置情報のない全工事
+
+
+@app.post("/api/geocode/batch")
+async def geocode_projects(data: Optional[GeocodeBatchRequest] = None, db: AsyncSession = Depends(get_async_db)):
+    """
+    位置情報のない工事の住所をまとめてジオコーディングし、緯度経度を保存
+
+    住所が見つからなかった工事は not_found、通信エラーで検索できなかった工事は
+    failed（再実行で取得できる可能性あり）に返す。
+    """
+    project_ids = data.project_ids if data else None
+    projects = await db.run_sync(_projects_missing_location, project_ids)
+
+    results = await geocode.lookup_many([p.address for p in projects])
+    locations = {}
+    not_found = []
+    failed = []
+    for p in projects:
+        result = results.get(p.address)
+        if result is geocode.FAILED:
+            failed.append({"project_id": p.id, "address": p.address})
+        elif result:
+            locations[p.id] = (result["latitude"], result["longitude"])
+        else:
+            not_found.append({"project_id": p.id, "address": p.address})
+
+    if locations:
+        await db.run_sync(_update_project_locations, locations)
+        response_cache.invalidate("projects_with_weather")
+
+    return {
+        "total": len(projects),
+        "updated": len(locations),
+        "not_found": not_found,
+        "failed": failed
+    }
+
+
 # ========== 天気予報API ==========
 @app.get("/api/weather")
 async def get_weather(lat: float, lon: float):
     """緯度経度から14日間の天気予報を取得（Open-Meteo API使用）"""
     try:
-        async with httpx.AsyncClient() as client:
-            # Open-Meteo APIを使用（無料・APIキー不要）
-            url = (
-                f"https://api.open-meteo.com/v1/forecast?"
-                f"latitude={lat}&longitude={lon}"
-                f"&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max"
-                f"&timezone=Asia/Tokyo"
-                f"&forecast_days=14"
-            )
-            response = await client.get(url)
-
-            if response.status_code == 200:
-                data = response.json()
-                daily = data.get("daily", {})
-
-                # 天気コードから天気情報に変換
-                weather_codes = {
-                    0: {"icon": "☀️", "text": "快晴"},
-                    1: {"icon": "🌤️", "text": "晴れ"},
-                    2: {"icon": "⛅", "text": "薄曇り"},
-                    3: {"icon": "☁️", "text": "曇り"},
-                    45: {"icon": "🌫️", "text": "霧"},
-                    48: {"icon": "🌫️", "text": "霧氷"},
-                    51: {"icon": "🌧️", "text": "小雨"},
-                    53: {"icon": "🌧️", "text": "雨"},
-                    55: {"icon": "🌧️", "text": "強い雨"},
-                    61: {"icon": "🌧️", "text": "弱い雨"},
-                    63: {"icon": "🌧️", "text": "雨"},
-                    65: {"icon": "🌧️", "text": "強い雨"},
-                    71: {"icon": "🌨️", "text": "小雪"},
-                    73: {"icon": "🌨️", "text": "雪"},
-                    75: {"icon": "🌨️", "text": "大雪"},
-                    80: {"icon": "🌦️", "text": "にわか雨"},
-                    81: {"icon": "🌦️", "text": "にわか雨"},
-                    82: {"icon": "🌧️", "text": "激しいにわか雨"},
-                    95: {"icon": "⛈️", "text": "雷雨"},
-                    96: {"icon": "⛈️", "text": "雷雨・雹"},
-                    99: {"icon": "⛈️", "text": "激しい雷雨"},
-                }
-
-                forecasts = []
-                dates = daily.get("time", [])
-                codes = daily.get("weather_code", [])
-                temp_max = daily.get("temperature_2m_max", [])
-                temp_min = daily.get("temperature_2m_min", [])
-                precip_prob = daily.get("precipitation_probability_max", [])
-
-                for i in range(len(dates)):
-                    code = codes[i] if i < len(codes) else 0
-                    weather = weather_codes.get(code, {"icon": "❓", "text": "不明"})
-                    forecasts.append({
-                        "date": dates[i],
-                        "weather_code": code,
-                        "icon": weather["icon"],
-                        "text": weather["text"],
-                        "temp_max": temp_max[i] if i < len(temp_max) else None,
-                        "temp_min": temp_min[i] if i < len(temp_min) else None,
-                        "precipitation_probability": precip_prob[i] if i < len(precip_prob) else None
-                    })
-
-                return {
-                    "success": True,
-                    "forecasts": forecasts
-                }
-
-            return {"success": False, "error": "天気情報を取得できませんでした"}
+        forecasts = await weather.get_forecast(lat, lon)
+        return {
+            "success": True,
+            "forecasts": forecasts
+        }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-@app.get("/api/projects/with-weather")
-async def get_projects_with_weather(db: Session = Depends(get_db)):
-    """進行中の現場と天気情報を取得"""
-    # 進行中の現場のみ取得
+def _active_projects_for_map(db: Session) -> list:
     projects = db.query(Project).filter(
-        Project.status.in_(["施工中", "受注確定"])
+        Project.status.in_(ACTIVE_STATUSES)
     ).all()
+    return [{
+        "id": project.id,
+        "code": project.code,
+        "name": project.name,
+        "client": project.client,
+        "status": project.status,
+        "address": project.address,
+        "latitude": project.latitude,
+        "longitude": project.longitude,
+        "weather": None
+    } for project in projects]
 
-    result = []
-    async with httpx.AsyncClient() as client:
-        for project in projects:
-            project_data = {
-                "id": project.id,
-                "code": project.code,
-                "name": project.name,
-                "client": project.client,
-                "status": project.status,
-                "address": project.address,
-                "latitude": project.latitude,
-                "longitude": project.longitude,
-                "weather": None
-            }
 
-            # 位置情報がある場合は天気を取得
-            if project.latitude and project.longitude:
-                try:
-                    url = (
-                        f"https://api.open-meteo.com/v1/forecast?"
-                        f"latitude={project.latitude}&longitude={project.longitude}"
-                        f"&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max"
-                        f"&timezone=Asia/Tokyo"
-                        f"&forecast_days=14"
-                    )
-                    response = await client.get(url)
-                    if response.status_code == 200:
-                        data = response.json()
-                        daily = data.get("daily", {})
-
-                        weather_codes = {
-                            0: {"icon": "☀️", "text": "快晴"},
-                            1: {"icon": "🌤️", "text": "晴れ"},
-                            2: {"icon": "⛅", "text": "薄曇り"},
-                            3: {"icon": "☁️", "text": "曇り"},
-                            45: {"icon": "🌫️", "text": "霧"},
-                            48: {"icon": "🌫️", "text": "霧氷"},
-                            51: {"icon": "🌧️", "text": "小雨"},
-                            53: {"icon": "🌧️", "text": "雨"},
-                            55: {"icon": "🌧️", "text": "強い雨"},
-                            61: {"icon": "🌧️", "text": "弱い雨"},
-                            63: {"icon": "🌧️", "text": "雨"},
-                            65: {"icon": "🌧️", "text": "強い雨"},
-                            71: {"icon": "🌨️", "text": "小雪"},
-                            73: {"icon": "🌨️", "text": "雪"},
-                            75: {"icon": "🌨️", "text": "大雪"},
-                            80: {"icon": "🌦️", "text": "にわか雨"},
-                            81: {"icon": "🌦️", "text": "にわか雨"},
-                            82: {"icon": "🌧️", "text": "激しいにわか雨"},
-                            95: {"icon": "⛈️", "text": "雷雨"},
-                            96: {"icon": "⛈️", "text": "雷雨・雹"},
-                            99: {"icon": "⛈️", "text": "激しい雷雨"},
-                        }
-
-                        forecasts = []
-                        dates = daily.get("time", [])
-                        codes = daily.get("weather_code", [])
-                        temp_max = daily.get("temperature_2m_max", [])
-                        temp_min = daily.get("temperature_2m_min", [])
-                        precip_prob = daily.get("precipitation_probability_max", [])
-
-                        for i in range(len(dates)):
-                            code = codes[i] if i < len(codes) else 0
-                            weather = weather_codes.get(code, {"icon": "❓", "text": "不明"})
-                            forecasts.append({
-                                "date": dates[i],
-                                "weather_code": code,
-                                "icon": weather["icon"],
-                                "text": weather["text"],
-                                "temp_max": temp_max[i] if i < len(temp_max) else None,
-                                "temp_min": temp_min[i] if i < len(temp_min) else None,
-                                "precipitation_probability": precip_prob[i] if i < len(precip_prob) else None
-                            })
-
-                        project_data["weather"] = forecasts
-                except Exception:
-                    pass
-
-            result.append(project_data)
+@app.get("/api/projects/with-weather")
+async def get_projects_with_weather(db: AsyncSession = Depends(get_async_db)):
+    """進行中の現場と天気情報を取得（天気を取得できなかった現場は weather=None）"""
+    # 全現場の天気がそろった結果はJSONのまま保持し、そのまま返す
+    cached = response_cache.get(("projects_with_weather",))
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    token = response_cache.version("projects_with_weather")
 
-    return result
+    result = await db.run_sync(_active_projects_for_map)
+
+    # 位置情報がある現場の天気をまとめて並行取得
+    points = [(p["latitude"], p["longitude"]) for p in result if p["latitude"] and p["longitude"]]
+    forecasts = await weather.fetch_forecasts(points)
+    for p in result:
+        if p["latitude"] and p["longitude"]:
+            p["weather"] = forecasts.get((p["latitude"], p["longitude"]))
+
+    body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+    if all(forecasts.values()):
+        response_cache.set(("projects_with_weather",), body, ttl=weather.FORECAST_TTL, token=token)
+    return Response(content=body, media_type="application/json")
 
 
 # ========== Estimates API ==========
@@ -1471,6 +1389,8 @@ def update_estimate(estimate_id: int, data: EstimateCreate, db: Session = Depend
         raise HTTPException(status_code=404, detail="Estimate not found")
     for key, value in data.model_dump().items():
         setattr(estimate, key, value)
+    # PDFキャッシュのキーに使うため秒未満まで記録
+    estimate.updated_at = datetime.now()
     db.commit()
     return estimate
 
@@ -1564,6 +1484,7 @@ def create_expense(data: ExpenseCreate, db: Session = Depends(get_db)):
     approval = Approval(type="expense", reference_id=expense.id, requested_by="user")
     db.add(approval)
     db.commit()
+    response_cache.invalidate("approvals_count", "dashboard_summary")
     return expense
 
 @app.put("/api/expenses/{expense_id}")
@@ -1676,8 +1597,10 @@ def get_pending_approvals(db: Session = Depends(get_db)):
 
 @app.get("/api/approvals/count")
 def get_pending_count(db: Session = Depends(get_db)):
-    count = db.query(Approval).filter(Approval.status == "pending").count()
-    return {"count": count}
+    return response_cache.get_or_set(
+        ("approvals_count",),
+        lambda: {"count": db.query(Approval).filter(Approval.status == "pending").count()}
+    )
 
 @app.put("/api/approvals/{approval_id}/approve")
 def approve_approval(approval_id: int, approved_by: Optional[str] = None, db: Session = Depends(get_db)):
@@ -1688,6 +1611,7 @@ def approve_approval(approval_id: int, approved_by: Optional[str] = None, db: Se
     approval.approved_by = approved_by
     approval.approved_at = datetime.now()
     db.commit()
+    response_cache.invalidate("approvals_count", "dashboard_summary")
     return approval
 
 @app.put("/api/approvals/{approval_id}/reject")
@@ -1699,6 +1623,7 @@ def reject_approval(approval_id: int, comment: Optional[str] = None, db: Session
     approval.comment = comment
     approval.approved_at = datetime.now()
     db.commit()
+    response_cache.invalidate("approvals_count", "dashboard_summary")
     return approval
 
 
@@ -1715,13 +1640,14 @@ def get_unread_count(user_id: Optional[str] = None, db: Session = Depends(get_db
     query = db.query(Notification).filter(Notification.is_read == False)
     if user_id:
         query = query.filter(Notification.user_id == user_id)
-    return {"count": query.count()}
+    return response_cache.get_or_set(("notifications_unread", user_id), lambda: {"count": query.count()})
 
 @app.post("/api/notifications/")
 def create_notification(data: NotificationCreate, db: Session = Depends(get_db)):
     notification = Notification(**data.model_dump())
     db.add(notification)
     db.commit()
+    response_cache.invalidate("notifications_unread", "dashboard_summary")
     db.refresh(notification)
     return notification
 
@@ -1731,6 +1657,7 @@ def mark_notification_read(notification_id: int, db: Session = Depends(get_db)):
     if notification:
         notification.is_read = True
         db.commit()
+        response_cache.invalidate("notifications_unread", "dashboard_summary")
     return {"message": "marked as read"}
 
 @app.put("/api/notifications/read-all")
@@ -1740,6 +1667,7 @@ def mark_all_read(user_id: Optional[str] = None, db: Session = Depends(get_db)):
         query = query.filter(Notification.user_id == user_id)
     query.update({"is_read": True})
     db.commit()
+    response_cache.invalidate("notifications_unread", "dashboard_summary")
     return {"message": "all marked as read"}
 
 
@@ -1894,6 +1822,7 @@ def create_inventory_item(data: InventoryItemCreate, db: Session = Depends(get_d
     item = InventoryItem(**data.model_dump())
     db.add(item)
     db.commit()
+    response_cache.invalidate("dashboard_summary")
     db.refresh(item)
     return item
 
@@ -1905,6 +1834,7 @@ def update_inventory_item(item_id: int, data: InventoryItemCreate, db: Session =
     for key, value in data.model_dump().items():
         setattr(item, key, value)
     db.commit()
+    response_cache.invalidate("dashboard_summary")
     return item
 
 @app.delete("/api/inventory/{item_id}")
@@ -1913,6 +1843,7 @@ def delete_inventory_item(item_id: int, db: Session = Depends(get_db)):
     if item:
         db.delete(item)
         db.commit()
+        response_cache.invalidate("dashboard_summary")
     return {"message": "deleted"}
 
 @app.post("/api/inventory/{item_id}/in")
@@ -1925,6 +1856,7 @@ def inventory_in(item_id: int, data: InventoryTransactionCreate, db: Session = D
                                         project_id=data.project_id, date=data.date or date.today(), note=data.note)
     db.add(transaction)
     db.commit()
+    response_cache.invalidate("dashboard_summary")
     return item
 
 @app.post("/api/inventory/{item_id}/out")
@@ -1937,6 +1869,7 @@ def inventory_out(item_id: int, data: InventoryTransactionCreate, db: Session =
                                         project_id=data.project_id, date=data.date or date.today(), note=data.note)
     db.add(transaction)
     db.commit()
+    response_cache.invalidate("dashboard_summary")
     return item
 
 
@@ -1999,22 +1932,42 @@ def create_vehicle_log(data: VehicleLogCreate, db: Session = Depends(get_db)):
 
 
 # ========== Schedules API ==========
+def query_schedules(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """工程と工事名を1回のJOINで取得。期間指定時は [start_date, end_date] と重なる工程のみ"""
+    query = db.query(Schedule, Project.name).outerjoin(Project, Project.id == Schedule.project_id)
+    # 開始日・終了日が未設定の工程は期間の端が開いているものとして扱う
+    if end_date:
+        query = query.filter((Schedule.start_date.is_(None)) | (Schedule.start_date <= end_date))
+    if start_date:
+        query = query.filter((Schedule.end_date.is_(None)) | (Schedule.end_date >= start_date))
+    return query.order_by(Schedule.id).all()
+
+def json_response_with_etag(request: Request, payload) -> Response:
+    """内容のハッシュを ETag として返し、If-None-Match が一致すれば 304 を返す"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    if etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/schedules/")
-def get_schedules(db: Session = Depends(get_db)):
-    schedules = db.query(Schedule).all()
+def get_schedules(request: Request, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                  db: Session = Depends(get_db)):
     result = []
-    for s in schedules:
-        project = db.query(Project).filter(Project.id == s.project_id).first()
+    for s, project_name in query_schedules(db, start_date, end_date):
         result.append({
             "id": s.id,
             "project_id": s.project_id,
-            "project_name": project.name if project else None,
+            "project_name": project_name,
             "start_date": s.start_date.isoformat() if s.start_date else None,
             "end_date": s.end_date.isoformat() if s.end_date else None,
             "progress_rate": s.progress_rate,
             "color": s.color
         })
-    return result
+    return json_response_with_etag(request, result)
 
 @app.post("/api/schedules/")
 def create_schedule(data: ScheduleCreate, db: Session = Depends(get_db)):
@@ -2104,31 +2057,78 @@ def get_attendances(worker_id: Optional[int] = None, month: Optional[str] = None
         query = query.filter(Attendance.date >= start_date, Attendance.date < end_date)
     return query.order_by(Attendance.date.desc()).all()
 
+def _month_start(year_month: str, name: str) -> date:
+    try:
+        year, mon = map(int, year_month.split("-"))
+        return date(year, mon, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} は YYYY-MM 形式で指定してください")
+
 @app.get("/api/attendances/summary")
-def get_attendance_summary(month: str, db: Session = Depends(get_db)):
-    year, mon = map(int, month.split("-"))
-    start_date = date(year, mon, 1)
-    if mon == 12:
-        end_date = date(year + 1, 1, 1)
+def get_attendance_summary(month: Optional[str] = None, start_month: Optional[str] = None,
+                           end_month: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    稼働中の作業員ごとの出勤日数・残業時間（工事別・打刻状況別の内訳つき）
+
+    month で1か月、start_month〜end_month（両端含む）で複数月をまとめて集計する。
+    """
+    if month:
+        start_date = _month_start(month, "month")
+        end_date = start_date + relativedelta(months=1)
+    elif start_month and end_month:
+        start_date = _month_start(start_month, "start_month")
+        end_date = _month_start(end_month, "end_month") + relativedelta(months=1)
+        if start_date >= end_date:
+            raise HTTPException(status_code=400, detail="start_month は end_month 以前を指定してください")
     else:
-        end_date = date(year, mon + 1, 1)
+        raise HTTPException(status_code=400, detail="month または start_month / end_month を指定してください")
 
-    workers = db.query(Worker).filter(Worker.is_active == True).all()
-    result = []
-    for worker in workers:
-        attendances = db.query(Attendance).filter(
-            Attendance.worker_id == worker.id,
-            Attendance.date >= start_date,
-            Attendance.date < end_date
-        ).all()
-        total_days = len(attendances)
-        total_overtime = sum(a.overtime_hours or 0 for a in attendances)
-        result.append({
-            "worker_id": worker.id,
-            "worker_name": worker.name,
-            "total_days": total_days,
-            "total_overtime": total_overtime
+    status = case(
+        (Attendance.check_in.isnot(None) & Attendance.check_out.isnot(None), "退勤済"),
+        (Attendance.check_in.isnot(None), "退勤未打刻"),
+        else_="打刻なし"
+    )
+    rows = db.query(
+        Worker.id, Worker.name, Attendance.project_id, Project.name, status,
+        func.count(Attendance.id), func.coalesce(func.sum(Attendance.overtime_hours), 0)
+    ).outerjoin(
+        Attendance,
+        (Attendance.worker_id == Worker.id) & (Attendance.date >= start_date) & (Attendance.date < end_date)
+    ).outerjoin(
+        Project, Project.id == Attendance.project_id
+    ).filter(
+        Worker.is_active == True
+    ).group_by(
+        Worker.id, Worker.name, Attendance.project_id, Project.name, status
+    ).order_by(Worker.id).all()
+
+    summaries = {}
+    for worker_id, worker_name, project_id, project_name, day_status, days, overtime in rows:
+        summary = summaries.get(worker_id)
+        if summary is None:
+            summary = summaries[worker_id] = {
+                "worker_id": worker_id,
+                "worker_name": worker_name,
+                "total_days": 0,
+                "total_overtime": 0,
+                "by_project": {},
+                "by_status": {}
+            }
+        if not days:
+            continue  # 期間内の勤怠なし
+        summary["total_days"] += days
+        summary["total_overtime"] += overtime
+        by_project = summary["by_project"].setdefault(project_id, {
+            "project_id": project_id, "project_name": project_name, "days": 0, "overtime": 0
         })
+        by_project["days"] += days
+        by_project["overtime"] += overtime
+        summary["by_status"][day_status] = summary["by_status"].get(day_status, 0) + days
+
+    result = []
+    for summary in summaries.values():
+        summary["by_project"] = list(summary["by_project"].values())
+        result.append(summary)
     return result
 
 @app.post("/api/attendances/")
@@ -2405,7 +2405,10 @@ def search(q: str, type: Optional[str] = None, db: Session = Depends(get_db)):
 # ========== Dashboard Summary API ==========
 @app.get("/api/dashboard/summary")
 def get_dashboard_summary(db: Session = Depends(get_db)):
-    active_projects = db.query(Project).filter(Project.status.in_(["施工中", "受注確定"])).count()
+    return response_cache.get_or_set(("dashboard_summary",), lambda: build_dashboard_summary(db))
+
+def build_dashboard_summary(db: Session):
+    active_projects = db.query(Project).filter(Project.status.in_(ACTIVE_STATUSES)).count()
     pending_approvals = db.query(Approval).filter(Approval.status == "pending").count()
     low_stock = db.query(InventoryItem).filter(InventoryItem.quantity <= InventoryItem.min_quantity).count()
     unread_notifications = db.query(Notification).filter(Notification.is_read == False).count()
@@ -2836,6 +2839,7 @@ def create_message(data: MessageCreate, db: Session = Depends(get_db)):
     message = Message(**data.model_dump())
     db.add(message)
     db.commit()
+    response_cache.invalidate("messages_unread")
     db.refresh(message)
     return message
 
@@ -2844,7 +2848,7 @@ def get_unread_message_count(project_id: Optional[int] = None, user_id: Optional
     query = db.query(Message).filter(Message.is_read == False)
     if project_id:
         query = query.filter(Message.project_id == project_id)
-    return {"count": query.count()}
+    return response_cache.get_or_set(("messages_unread", project_id), lambda: {"count": query.count()})
 
 @app.put("/api/messages/{message_id}/read")
 def mark_message_read(message_id: int, user_id: str, db: Session = Depends(get_db)):
@@ -2854,12 +2858,14 @@ def mark_message_read(message_id: int, user_id: str, db: Session = Depends(get_d
     if message:
         message.is_read = True
     db.commit()
+    response_cache.invalidate("messages_unread")
     return {"message": "marked as read"}
 
 @app.put("/api/messages/read-all")
 def mark_all_messages_read(project_id: int, user_id: str, db: Session = Depends(get_db)):
     db.query(Message).filter(Message.project_id == project_id, Message.is_read == False).update({"is_read": True})
     db.commit()
+    response_cache.invalidate("messages_unread")
     return {"message": "all marked as read"}
 
 
@@ -2962,8 +2968,6 @@ def check_permission(role: str, resource: str, action: str, db: Session = Depend
 # タスク23: 外部連携 API
 # ============================================
 
-import csv
-from io import StringIO
 from fastapi.responses import StreamingResponse
 
 class IntegrationSettingCreate(BaseModel):
@@ -2973,115 +2977,53 @@ class IntegrationSettingCreate(BaseModel):
     config: Optional[str] = None
     is_active: Optional[bool] = False
 
-# CSV出力（弥生会計フォーマット）
-@app.get("/api/export/yayoi")
-def export_yayoi(year_month: str, db: Session = Depends(get_db)):
-    year, month = map(int, year_month.split('-'))
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1)
+def _cost_export_response(fmt: str, year_month: Optional[str], date_from: Optional[date],
+                          date_to: Optional[date], encoding: str):
+    """原価CSVのレスポンス（year_month か date_from〜date_to で期間指定）"""
+    if encoding not in exports.ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"encoding は {', '.join(exports.ENCODINGS)} のいずれかを指定してください")
+
+    if date_from or date_to:
+        if not (date_from and date_to) or date_from > date_to:
+            raise HTTPException(status_code=400, detail="date_from と date_to を正しく指定してください")
+        start_date, end_date = date_from, date_to + relativedelta(days=1)
+        period = f"{date_from.isoformat()}_{date_to.isoformat()}"
+    elif year_month:
+        try:
+            year, month = map(int, year_month.split('-'))
+            start_date = date(year, month, 1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="year_month は YYYY-MM 形式で指定してください")
+        end_date = start_date + relativedelta(months=1)
+        period = year_month
     else:
-        end_date = date(year, month + 1, 1)
-
-    costs = db.query(Cost).filter(Cost.date >= start_date, Cost.date < end_date).all()
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["日付", "借方科目", "借方金額", "貸方科目", "貸方金額", "摘要"])
+        raise HTTPException(status_code=400, detail="year_month または date_from / date_to を指定してください")
 
-    category_accounts = {
-        "労務費": "労務費",
-        "材料費": "材料費",
-        "外注費": "外注費",
-        "経費": "諸経費"
-    }
-
-    for cost in costs:
-        account = category_accounts.get(cost.category, "諸経費")
-        writer.writerow([
-            cost.date.strftime("%Y/%m/%d") if cost.date else "",
-            account,
-            cost.amount or 0,
-            "未払金",
-            cost.amount or 0,
-            f"{cost.vendor or ''} {cost.description or ''}"
-        ])
-
-    output.seek(0)
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=yayoi_{year_month}.csv"}
+        exports.stream_costs_csv(fmt, start_date, end_date, encoding),
+        headers={
+            "Content-Type": exports.content_type(encoding),
+            "Content-Disposition": f"attachment; filename={fmt}_{period}.csv"
+        }
     )
 
+# CSV出力（弥生会計フォーマット）
+@app.get("/api/export/yayoi")
+def export_yayoi(year_month: Optional[str] = None, date_from: Optional[date] = None,
+                 date_to: Optional[date] = None, encoding: str = "utf-8"):
+    return _cost_export_response("yayoi", year_month, date_from, date_to, encoding)
+
 # CSV出力（freeeフォーマット）
 @app.get("/api/export/freee")
-def export_freee(year_month: str, db: Session = Depends(get_db)):
-    year, month = map(int, year_month.split('-'))
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1)
-    else:
-        end_date = date(year, month + 1, 1)
-
-    costs = db.query(Cost).filter(Cost.date >= start_date, Cost.date < end_date).all()
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["取引日", "勘定科目", "税区分", "金額", "取引先", "品目", "メモ"])
-
-    for cost in costs:
-        writer.writerow([
-            cost.date.strftime("%Y-%m-%d") if cost.date else "",
-            cost.category or "",
-            "課税仕入10%",
-            cost.amount or 0,
-            cost.vendor or "",
-            cost.work_type or "",
-            cost.description or ""
-        ])
-
-    output.seek(0)
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=freee_{year_month}.csv"}
-    )
+def export_freee(year_month: Optional[str] = None, date_from: Optional[date] = None,
+                 date_to: Optional[date] = None, encoding: str = "utf-8"):
+    return _cost_export_response("freee", year_month, date_from, date_to, encoding)
 
 # CSV出力（マネーフォワードフォーマット）
 @app.get("/api/export/moneyforward")
-def export_moneyforward(year_month: str, db: Session = Depends(get_db)):
-    year, month = map(int, year_month.split('-'))
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1)
-    else:
-        end_date = date(year, month + 1, 1)
-
-    costs = db.query(Cost).filter(Cost.date >= start_date, Cost.date < end_date).all()
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["日付", "借方勘定科目", "借方補助科目", "借方金額", "貸方勘定科目", "貸方補助科目", "貸方金額", "摘要"])
-
-    for cost in costs:
-        writer.writerow([
-            cost.date.strftime("%Y/%m/%d") if cost.date else "",
-            cost.category or "",
-            cost.work_type or "",
-            cost.amount or 0,
-            "未払金",
-            cost.vendor or "",
-            cost.amount or 0,
-            cost.description or ""
-        ])
-
-    output.seek(0)
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=moneyforward_{year_month}.csv"}
-    )
+def export_moneyforward(year_month: Optional[str] = None, date_from: Optional[date] = None,
+                        date_to: Optional[date] = None, encoding: str = "utf-8"):
+    return _cost_export_response("moneyforward", year_month, date_from, date_to, encoding)
 
 # 外部連携設定
 @app.get("/api/integrations/")
@@ -3104,42 +3046,46 @@ def create_integration(data: IntegrationSettingCreate, db: Session = Depends(get
 
 # LINE通知（設定があれば送信）
 @app.post("/api/notify/line")
-async def send_line_notification(message: str, db: Session = Depends(get_db)):
-    setting = db.query(IntegrationSetting).filter(
+async def send_line_notification(message: str, db: AsyncSession = Depends(get_async_db)):
+    setting = await db.scalar(select(IntegrationSetting).where(
         IntegrationSetting.service == "line",
         IntegrationSetting.is_active == True
-    ).first()
+    ).limit(1))
     if not setting or not setting.access_token:
         return {"success": False, "error": "LINE連携が設定されていません"}
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://notify-api.line.me/api/notify",
-                headers={"Authorization": f"Bearer {setting.access_token}"},
-                data={"message": message}
-            )
-            return {"success": response.status_code == 200}
+        response = await http_client.get_client().post(
+            "https://notify-api.line.me/api/notify",
+            headers={"Authorization": f"Bearer {setting.access_token}"},
+            data={"message": message}
+        )
+        return {"success": response.status_code == 200}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 # Googleカレンダー連携用エンドポイント
 @app.get("/api/calendar/events")
-def get_calendar_events(year_month: str, db: Session = Depends(get_db)):
-    """工程をカレンダーイベント形式で取得"""
-    schedules = db.query(Schedule).all()
+def get_calendar_events(request: Request, year_month: str, db: Session = Depends(get_db)):
+    """工程をカレンダーイベント形式で取得（指定月にかかる工程のみ）"""
+    try:
+        year, month = map(int, year_month.split("-"))
+        month_start = date(year, month, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="year_month は YYYY-MM 形式で指定してください")
+    month_end = month_start + relativedelta(months=1, days=-1)
+
     events = []
-    for s in schedules:
-        project = db.query(Project).filter(Project.id == s.project_id).first()
+    for s, project_name in query_schedules(db, month_start, month_end):
         events.append({
             "id": s.id,
-            "title": project.name if project else f"Project {s.project_id}",
+            "title": project_name or f"Project {s.project_id}",
             "start": s.start_date.isoformat() if s.start_date else None,
             "end": s.end_date.isoformat() if s.end_date else None,
             "color": s.color,
             "project_id": s.project_id
         })
-    return events
+    return json_response_with_etag(request, events)
 
 
 # ============================================
@@ -3282,6 +3228,8 @@ def update_company_settings(data: CompanySettingsUpdate, db: Session = Depends(g
     for key, value in data.model_dump().items():
         if value is not None:
             setattr(settings, key, value)
+    # PDFキャッシュのキーに使うため秒未満まで記録
+    settings.updated_at = datetime.now()
     db.commit()
     db.refresh(settings)
     return settings
@@ -3311,6 +3259,36 @@ def create_document_send(data: DocumentSendCreate, db: Session = Depends(get_db)
     db.refresh(send)
     return send
 
+def document_send_pdf_source(db: Session, send: DocumentSend):
+    source = PDF_SOURCES.get(send.document_type)
+    if source is None:
+        raise HTTPException(status_code=400, detail=f"PDFを作成できない帳票です: {send.document_type}")
+    return source(db, send.document_id)
+
+@app.get("/api/document-sends/{send_id}/pdf")
+async def get_document_send_pdf(send_id: int, db: AsyncSession = Depends(get_async_db)):
+    """発行した帳票のPDF（元データが変わっていなければ作成済みのファイルを返す）"""
+    send = await db.get(DocumentSend, send_id)
+    if not send:
+        raise HTTPException(status_code=404, detail="Document send not found")
+    return await pdf_response(await db.run_sync(document_send_pdf_source, send))
+
+@app.post("/api/document-sends/{send_id}/resend")
+async def resend_document(send_id: int, db: AsyncSession = Depends(get_async_db)):
+    """同じ帳票を同じ宛先に再発行（PDFは作成済みならキャッシュを使う）"""
+    send = await db.get(DocumentSend, send_id)
+    if not send:
+        raise HTTPException(status_code=404, detail="Document send not found")
+    key, render, data, filename = await db.run_sync(document_send_pdf_source, send)
+    await run_in_threadpool(pdf_cache.get_or_render, key, render, data)
+
+    resent = DocumentSend(document_type=send.document_type, document_id=send.document_id,
+                          recipient_email=send.recipient_email)
+    db.add(resent)
+    await db.commit()
+    await db.refresh(resent)
+    return resent
+
 @app.get("/api/document-sends/{send_id}/track")
 def track_document_open(send_id: int, db: Session = Depends(get_db)):
     """メール開封トラッキング"""
@@ -3329,17 +3307,32 @@ def track_document_open(send_id: int, db: Session = Depends(get_db)):
 from fastapi.responses import StreamingResponse
 from io import BytesIO
 
-@app.get("/api/documents/estimate/{estimate_id}/pdf")
-def generate_estimate_pdf(estimate_id: int, db: Session = Depends(get_db)):
-    """見積書PDF生成（簡易版 - HTML形式で返す）"""
-    # 実際のPDF生成はfpdf2やreportlabなどを使用
-    # ここでは簡易的にJSONで必要データを返す
-    estimate = db.query(Estimate).filter(Estimate.id == estimate_id).first()
-    if not estimate:
-        raise HTTPException(status_code=404, detail="Estimate not found")
-    project = db.query(Project).filter(Project.id == estimate.project_id).first()
-    company = db.query(CompanySettings).first()
+def pdf_company(company) -> dict:
+    """帳票に載せる会社情報（会社設定が未登録なら社名だけ）"""
     return {
+        "name": company.company_name if company else "サンユウテック",
+        "postal_code": company.postal_code if company else "",
+        "address": company.address if company else "",
+        "phone": company.phone if company else "",
+        "fax": company.fax if company else "",
+        "invoice_number": company.invoice_number if company else ""
+    }
+
+
+def pdf_row_stamps(*rows) -> list:
+    """PDFキャッシュのキーにする元データの (テーブル, id, 更新日時)"""
+    return [(row.__tablename__, row.id, row.updated_at) for row in rows if row is not None]
+
+
+def estimate_pdf_source(db: Session, estimate_id: int):
+    """見積明細PDFの (キャッシュキー, 作成関数, データ, ファイル名)"""
+    row = db.query(Estimate, Project, CompanySettings).outerjoin(
+        Project, Project.id == Estimate.project_id
+    ).outerjoin(CompanySettings, true()).filter(Estimate.id == estimate_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Estimate not found")
+    estimate, project, company = row
+    data = {
         "type": "estimate",
         "project": {"id": project.id, "name": project.name, "client": project.client} if project else None,
         "estimate": {
@@ -3350,37 +3343,84 @@ def generate_estimate_pdf(estimate_id: int, db: Session = Depends(get_db)):
             "unit_price": estimate.unit_price,
             "amount": estimate.amount
         },
-        "company": {
-            "name": company.company_name if company else "サンユウテック",
-            "address": company.address if company else "",
-            "phone": company.phone if company else "",
-            "invoice_number": company.invoice_number if company else ""
-        }
+        "company": pdf_company(company),
+        "date": (estimate.updated_at or estimate.created_at or datetime.now()).strftime("%Y年%m月%d日")
     }
+    key = pdf_cache.cache_key("estimate", pdf_documents.TEMPLATE_VERSION, pdf_row_stamps(estimate, project, company))
+    filename = f"見積書_{project.name if project else ''}_{estimate.id}.pdf"
+    return key, pdf_documents.estimate_pdf, data, filename
 
-@app.get("/api/documents/project/{project_id}/ledger")
-def get_project_ledger(project_id: int, db: Session = Depends(get_db)):
-    """工事台帳データ取得（タスク7-1対応）"""
+
+def quote_pdf_source(db: Session, quote_id: int):
+    """見積書PDFの (キャッシュキー, 作成関数, データ, ファイル名)"""
+    row = db.query(QuoteDocument, CompanySettings).outerjoin(
+        CompanySettings, true()
+    ).filter(QuoteDocument.id == quote_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    quote_doc, company = row
+    items = db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).order_by(QuoteItem.seq).all()
+    data = {**serialize_quote(quote_doc, items), "company": pdf_company(company)}
+    # 明細の変更時も update_quote が見積書の updated_at を進める
+    key = pdf_cache.cache_key("quote", pdf_documents.TEMPLATE_VERSION, pdf_row_stamps(quote_doc, company))
+    return key, pdf_documents.quote_pdf, data, f"見積書_{quote_doc.quote_no}.pdf"
+
+
+def ledger_pdf_source(db: Session, project_id: int):
+    """工事台帳PDFの (キャッシュキー, 作成関数, データ, ファイル名)"""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    data = project_ledger_data(db, project)
+    # 台帳は複数テーブルの集計なので、集計結果そのものをキーにする
+    key = pdf_cache.cache_key("ledger", pdf_documents.TEMPLATE_VERSION, data)
+    return key, pdf_documents.ledger_pdf, data, f"工事台帳_{project.code or project.id}.pdf"
+
+
+# 帳票の種類（DocumentSend.document_type）-> PDFの取得元
+PDF_SOURCES = {
+    "estimate": estimate_pdf_source,
+    "quote": quote_pdf_source,
+    "ledger": ledger_pdf_source,
+}
+
+
+async def pdf_response(source) -> Response:
+    """作成済みならキャッシュから、なければスレッドプールで作成してPDFを返す"""
+    key, render, data, filename = source
+    content = await run_in_threadpool(pdf_cache.get_or_render, key, render, data)
+    return Response(content=content, media_type=pdf_documents.CONTENT_TYPE,
+        headers={"Content-Disposition": attachment_disposition(filename)})
+
+
+@app.get("/api/documents/estimate/{estimate_id}/pdf")
+async def generate_estimate_pdf(estimate_id: int, db: AsyncSession = Depends(get_async_db)):
+    """見積書PDF生成"""
+    return await pdf_response(await db.run_sync(estimate_pdf_source, estimate_id))
+
+
+def project_ledger_data(db: Session, project: Project) -> dict:
+    """工事台帳の集計"""
+    project_id = project.id
 
     # 原価集計
-    costs = db.query(Cost).filter(Cost.project_id == project_id).all()
+    category_totals = db.query(
+        ProjectCostRollup.category, func.sum(ProjectCostRollup.amount)
+    ).filter(ProjectCostRollup.project_id == project_id).group_by(ProjectCostRollup.category).all()
     cost_by_category = {"労務費": 0, "材料費": 0, "外注費": 0, "機械費": 0, "経費": 0}
-    for c in costs:
-        if c.category in cost_by_category:
-            cost_by_category[c.category] += c.amount or 0
-
-    # 日報からの労務費
-    reports = db.query(DailyReport).filter(DailyReport.project_id == project_id).all()
+    for category, amount in category_totals:
+        if category in cost_by_category:
+            cost_by_category[category] += amount or 0
+
+    # 日報からの労務費（作業員の日当は結合して1回で取得）
+    reports = db.query(DailyReport.hours, DailyReport.overtime_hours, Worker.daily_rate).join(
+        Worker, Worker.id == DailyReport.worker_id
+    ).filter(DailyReport.project_id == project_id).order_by(DailyReport.id).all()
     labor_from_reports = 0
-    for r in reports:
-        worker = db.query(Worker).filter(Worker.id == r.worker_id).first()
-        if worker and worker.daily_rate:
-            labor_from_reports += worker.daily_rate * (r.hours / 8)
-            labor_from_reports += (worker.daily_rate / 8) * 1.25 * (r.overtime_hours or 0)
-
+    for hours, overtime_hours, daily_rate in reports:
+        if daily_rate:
+            labor_from_reports += daily_rate * (hours / 8)
+            labor_from_reports += (daily_rate / 8) * 1.25 * (overtime_hours or 0)
     # 出来高累計
     progress = db.query(MonthlyProgress).filter(MonthlyProgress.project_id == project_id).all()
     total_progress = sum(p.progress_amount or 0 for p in progress)
@@ -3419,6 +3459,21 @@ def get_project_ledger(project_id: int, db: Session = Depends(get_db)):
     }
 
 
+@app.get("/api/documents/project/{project_id}/ledger")
+def get_project_ledger(project_id: int, db: Session = Depends(get_db)):
+    """工事台帳データ取得（タスク7-1対応）"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project_ledger_data(db, project)
+
+
+@app.get("/api/documents/project/{project_id}/ledger/pdf")
+async def get_project_ledger_pdf(project_id: int, db: AsyncSession = Depends(get_async_db)):
+    """工事台帳PDF"""
+    return await pdf_response(await db.run_sync(ledger_pdf_source, project_id))
+
+
 # ============================================
 # タスク7-3: 経営分析 (Analytics) API
 # ============================================
@@ -3428,84 +3483,21 @@ def get_monthly_sales(year: Optional[int] = None, db: Session = Depends(get_db))
     """月別売上推移"""
     if not year:
         year = datetime.now().year
-
-    result = []
-    for month in range(1, 13):
-        year_month = f"{year}-{month:02d}"
-        # 出来高から売上を計算
-        progress = db.query(func.sum(MonthlyProgress.progress_amount)).filter(
-            MonthlyProgress.year_month == year_month
-        ).scalar() or 0
-
-        # 原価を計算
-        start_date = date(year, month, 1)
-        end_date = date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)
-        costs = db.query(func.sum(Cost.amount)).filter(
-            Cost.date >= start_date,
-            Cost.date < end_date
-        ).scalar() or 0
-
-        result.append({
-            "month": year_month,
-            "sales": progress,
-            "cost": costs,
-            "profit": progress - costs
-        })
-
-    return result
+    return analytics.monthly_sales(analytics.get_snapshot(db, year))
 
 @app.get("/api/analytics/client-breakdown")
 def get_client_breakdown(year: Optional[int] = None, db: Session = Depends(get_db)):
     """顧客別売上比率"""
     if not year:
         year = datetime.now().year
-
-    # プロジェクト別に出来高を集計
-    projects = db.query(Project).all()
-    client_sales = {}
-
-    for p in projects:
-        progress = db.query(func.sum(MonthlyProgress.progress_amount)).filter(
-            MonthlyProgress.project_id == p.id,
-            MonthlyProgress.year_month.like(f"{year}-%")
-        ).scalar() or 0
-
-        client = p.client or "その他"
-        if client not in client_sales:
-            client_sales[client] = 0
-        client_sales[client] += progress
-
-    return [{"client": k, "sales": v} for k, v in sorted(client_sales.items(), key=lambda x: -x[1])]
+    return analytics.get_snapshot(db, year)["client_breakdown"]
 
 @app.get("/api/analytics/person-ranking")
 def get_person_ranking(year: Optional[int] = None, db: Session = Depends(get_db)):
     """担当者別粗利ランキング"""
     if not year:
         year = datetime.now().year
-
-    projects = db.query(Project).all()
-    person_profit = {}
-
-    for p in projects:
-        # 出来高
-        progress = db.query(func.sum(MonthlyProgress.progress_amount)).filter(
-            MonthlyProgress.project_id == p.id,
-            MonthlyProgress.year_month.like(f"{year}-%")
-        ).scalar() or 0
-
-        # 原価
-        costs = db.query(func.sum(Cost.amount)).filter(
-            Cost.project_id == p.id
-        ).scalar() or 0
-
-        person = p.site_person or p.sales_person or "未割当"
-        if person not in person_profit:
-            person_profit[person] = {"sales": 0, "cost": 0, "profit": 0}
-        person_profit[person]["sales"] += progress
-        person_profit[person]["cost"] += costs
-        person_profit[person]["profit"] += progress - costs
-
-    return [{"person": k, **v} for k, v in sorted(person_profit.items(), key=lambda x: -x[1]["profit"])]
+    return analytics.get_snapshot(db, year)["person_ranking"]
 
 @app.get("/api/analytics/target-vs-actual")
 def get_target_vs_actual(db: Session = Depends(get_db)):
@@ -3521,9 +3513,8 @@ def get_target_vs_actual(db: Session = Depends(get_db)):
     else:
         fiscal_year_start = date(now.year - 1, fiscal_start, 1)
 
-    actual = db.query(func.sum(MonthlyProgress.progress_amount)).filter(
-        MonthlyProgress.year_month >= fiscal_year_start.strftime("%Y-%m")
-    ).scalar() or 0
+    snapshot = analytics.get_snapshot(db, fiscal_year_start.year)
+    actual = analytics.sales_since(snapshot, fiscal_year_start.strftime("%Y-%m"))
 
     return {
         "target": target,
@@ -3537,31 +3528,7 @@ def get_profit_trend(year: Optional[int] = None, db: Session = Depends(get_db)):
     """月別粗利率推移"""
     if not year:
         year = datetime.now().year
-
-    result = []
-    for month in range(1, 13):
-        year_month = f"{year}-{month:02d}"
-        progress = db.query(func.sum(MonthlyProgress.progress_amount)).filter(
-            MonthlyProgress.year_month == year_month
-        ).scalar() or 0
-
-        start_date = date(year, month, 1)
-        end_date = date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)
-        costs = db.query(func.sum(Cost.amount)).filter(
-            Cost.date >= start_date,
-            Cost.date < end_date
-        ).scalar() or 0
-
-        profit = progress - costs
-        profit_rate = round(profit / progress * 100, 1) if progress > 0 else 0
-
-        result.append({
-            "month": year_month,
-            "profit": profit,
-            "profit_rate": profit_rate
-        })
-
-    return result
+    return analytics.profit_trend(analytics.get_snapshot(db, year))
 
 
 # ============================================
@@ -3607,9 +3574,9 @@ def update_lineworks_settings(data: LineWorksSettingsUpdate, db: Session = Depen
     return {"ok": True}
 
 @app.post("/api/lineworks/test-connection")
-async def test_lineworks_connection(db: Session = Depends(get_db)):
+async def test_lineworks_connection(db: AsyncSession = Depends(get_async_db)):
     """LINE WORKS接続テスト"""
-    settings = db.query(LineWorksSettings).first()
+    settings = await db.scalar(select(LineWorksSettings).limit(1))
     if not settings or not settings.client_id:
         return {"success": False, "error": "LINE WORKS設定が未完了です"}
 
@@ -3691,9 +3658,9 @@ def get_lineworks_unread_count(db: Session = Depends(get_db)):
     return {"count": 0}
 
 @app.post("/api/lineworks/send")
-async def send_lineworks_message(data: dict, db: Session = Depends(get_db)):
+async def send_lineworks_message(data: dict, db: AsyncSession = Depends(get_async_db)):
     """LINE WORKSメッセージ送信"""
-    settings = db.query(LineWorksSettings).first()
+    settings = await db.scalar(select(LineWorksSettings).limit(1))
     if not settings or not settings.is_active:
         return {"success": False, "error": "LINE WORKSが無効です"}
 
@@ -3705,14 +3672,29 @@ async def send_lineworks_message(data: dict, db: Session = Depends(get_db)):
         status="sent"
     )
     db.add(log)
-    db.commit()
+    await db.commit()
 
     # 実際のメッセージ送信はLINE WORKS APIを呼び出す
     # ここでは簡易実装
     return {"success": True, "log_id": log.id}
 
+async def _assignment_lines(db: AsyncSession, day: date) -> str:
+    """指定日の配置（作業員名・現場名は結合して1回で取得）"""
+    rows = await db.execute(
+        select(Worker.id, Worker.name, Project.id, Project.name)
+        .select_from(Assignment)
+        .outerjoin(Worker, Worker.id == Assignment.worker_id)
+        .outerjoin(Project, Project.id == Assignment.project_id)
+        .where(Assignment.date == day)
+        .order_by(Assignment.id)
+    )
+    return "".join(
+        f"・{worker_name if worker_id else '?'}: {project_name if project_id else '?'}\n"
+        for worker_id, worker_name, project_id, project_name in rows
+    )
+
 @app.post("/api/lineworks/webhook")
-async def lineworks_webhook(data: dict, db: Session = Depends(get_db)):
+async def lineworks_webhook(data: dict, db: AsyncSession = Depends(get_async_db)):
     """LINE WORKSからのWebhook受信（双方向通信）"""
     message = data.get("content", {}).get("text", "")
     user_id = data.get("source", {}).get("userId", "")
@@ -3720,31 +3702,21 @@ async def lineworks_webhook(data: dict, db: Session = Depends(get_db)):
     response_message = ""
 
     if "今日の配置" in message:
-        today = date.today()
-        assignments = db.query(Assignment).filter(Assignment.date == today).all()
-        if assignments:
-            response_message = "【本日の配置】\n"
-            for a in assignments:
-                worker = db.query(Worker).filter(Worker.id == a.worker_id).first()
-                project = db.query(Project).filter(Project.id == a.project_id).first()
-                response_message += f"・{worker.name if worker else '?'}: {project.name if project else '?'}\n"
+        lines = await _assignment_lines(db, date.today())
+        if lines:
+            response_message = "【本日の配置】\n" + lines
         else:
             response_message = "本日の配置情報はありません"
 
     elif "明日の配置" in message:
-        tomorrow = date.today() + relativedelta(days=1)
-        assignments = db.query(Assignment).filter(Assignment.date == tomorrow).all()
-        if assignments:
-            response_message = "【明日の配置】\n"
-            for a in assignments:
-                worker = db.query(Worker).filter(Worker.id == a.worker_id).first()
-                project = db.query(Project).filter(Project.id == a.project_id).first()
-                response_message += f"・{worker.name if worker else '?'}: {project.name if project else '?'}\n"
+        lines = await _assignment_lines(db, date.today() + relativedelta(days=1))
+        if lines:
+            response_message = "【明日の配置】\n" + lines
         else:
             response_message = "明日の配置情報はありません"
 
     elif "承認一覧" in message:
-        approvals = db.query(Approval).filter(Approval.status == "pending").all()
+        approvals = (await db.scalars(select(Approval).where(Approval.status == "pending"))).all()
         if approvals:
             response_message = f"【承認待ち: {len(approvals)}件】\n"
             for a in approvals[:5]:
@@ -3755,11 +3727,12 @@ async def lineworks_webhook(data: dict, db: Session = Depends(get_db)):
     elif message.startswith("承認 "):
         try:
             approval_id = int(message.replace("承認 ", "").strip())
-            approval = db.query(Approval).filter(Approval.id == approval_id).first()
+            approval = await db.get(Approval, approval_id)
             if approval:
                 approval.status = "approved"
                 approval.approved_at = datetime.now()
-                db.commit()
+                await db.commit()
+                response_cache.invalidate("approvals_count", "dashboard_summary")
                 response_message = f"ID:{approval_id}を承認しました"
             else:
                 response_message = "該当する承認が見つかりません"
@@ -3767,7 +3740,6 @@ async def lineworks_webhook(data: dict, db: Session = Depends(get_db)):
             response_message = "承認コマンドの形式: 承認 {ID}"
 
     elif "天気" in message:
-        projects = db.query(Project).filter(Project.status == "施工中").limit(3).all()
         response_message = "【現場天気】\n天気情報はアプリで確認してください"
 
     elif "日報" in message:
@@ -3923,41 +3895,74 @@ def get_cards_stats_by_tag(db: Session = Depends(get_db)):
 
 # ========== Quote Document API (見積書) ==========
 
+def serialize_quote_item(item):
+    return {
+        "id": item.id,
+        "seq": item.seq,
+        "name": item.name,
+        "specification": item.specification,
+        "quantity": item.quantity,
+        "unit": item.unit,
+        "unit_price": item.unit_price,
+        "amount": item.amount
+    }
+
+
+def serialize_quote(q, items=None):
+    """見積書の共通形式（items=None なら明細を含めない）"""
+    data = {
+        "id": q.id,
+        "quote_no": q.quote_no,
+        "title": q.title,
+        "client_name": q.client_name,
+        "issue_date": q.issue_date.isoformat() if q.issue_date else None,
+        "valid_until": q.valid_until.isoformat() if q.valid_until else None,
+        "subtotal": q.subtotal,
+        "tax_amount": q.tax_amount,
+        "total": q.total,
+        "notes": q.notes,
+        "status": q.status,
+        "project_id": q.project_id,
+        "created_at": q.created_at.isoformat() if q.created_at else None,
+    }
+    if items is not None:
+        data["items"] = [serialize_quote_item(item) for item in items]
+    return data
+
+
 @app.get("/api/quotes")
-def get_all_quotes(db: Session = Depends(get_db)):
-    """全見積書一覧を取得"""
-    quotes = db.query(QuoteDocument).order_by(QuoteDocument.created_at.desc()).all()
-    result = []
-    for q in quotes:
-        items = db.query(QuoteItem).filter(QuoteItem.quote_id == q.id).order_by(QuoteItem.seq).all()
-        result.append({
-            "id": q.id,
-            "quote_no": q.quote_no,
-            "title": q.title,
-            "client_name": q.client_name,
-            "issue_date": q.issue_date.isoformat() if q.issue_date else None,
-            "valid_until": q.valid_until.isoformat() if q.valid_until else None,
-            "subtotal": q.subtotal,
-            "tax_amount": q.tax_amount,
-            "total": q.total,
-            "notes": q.notes,
-            "status": q.status,
-            "project_id": q.project_id,
-            "created_at": q.created_at.isoformat() if q.created_at else None,
-            "items": [
-                {
-                    "id": item.id,
-                    "seq": item.seq,
-                    "name": item.name,
-                    "specification": item.specification,
-                    "quantity": item.quantity,
-                    "unit": item.unit,
-                    "unit_price": item.unit_price,
-                    "amount": item.amount
-                } for item in items
-            ]
-        })
-    return result
+def get_all_quotes(response: Response, limit: Optional[int] = None, cursor: Optional[int] = None,
+                   include_items: bool = True, db: Session = Depends(get_db)):
+    """
+    見積書一覧を取得（新しい順）
+
+    limit を指定すると件数を区切り、続きがあれば X-Next-Cursor ヘッダーに次の cursor を返す。
+    include_items=false で明細を省略（一覧画面用）。
+    """
+    query = db.query(QuoteDocument)
+    if cursor:
+        query = query.filter(QuoteDocument.id < cursor)
+    query = query.order_by(QuoteDocument.id.desc())
+    if limit is not None:
+        limit = max(1, min(limit, 500))
+        quotes = query.limit(limit + 1).all()
+        if len(quotes) > limit:
+            quotes = quotes[:limit]
+            response.headers["X-Next-Cursor"] = str(quotes[-1].id)
+    else:
+        quotes = query.all()
+
+    if not include_items:
+        return [serialize_quote(q) for q in quotes]
+
+    # 明細は1回のクエリでまとめて取得して見積書ごとに振り分け
+    items_by_quote = {q.id: [] for q in quotes}
+    if quotes:
+        for item in db.query(QuoteItem).filter(
+            QuoteItem.quote_id.in_(list(items_by_quote))
+        ).order_by(QuoteItem.quote_id, QuoteItem.seq):
+            items_by_quote[item.quote_id].append(item)
+    return [serialize_quote(q, items_by_quote[q.id]) for q in quotes]
 
 
 @app.get("/api/quotes/{quote_id}")
@@ -3968,34 +3973,63 @@ def get_quote(quote_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Quote not found")
 
     items = db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).order_by(QuoteItem.seq).all()
+    return serialize_quote(quote, items)
+
+
+@app.get("/api/quotes/{quote_id}/pdf")
+async def get_quote_pdf(quote_id: int, db: AsyncSession = Depends(get_async_db)):
+    """見積書PDF"""
+    return await pdf_response(await db.run_sync(quote_pdf_source, quote_id))
+
+
+QUOTE_ITEM_FIELDS = ("seq", "name", "specification", "quantity", "unit", "unit_price", "amount")
+
+
+def quote_item_values(item: dict, seq: int) -> dict:
+    """リクエストの明細1行 → QuoteItem の列値"""
     return {
-        "id": quote.id,
-        "quote_no": quote.quote_no,
-        "title": quote.title,
-        "client_name": quote.client_name,
-        "issue_date": quote.issue_date.isoformat() if quote.issue_date else None,
-        "valid_until": quote.valid_until.isoformat() if quote.valid_until else None,
-        "subtotal": quote.subtotal,
-        "tax_amount": quote.tax_amount,
-        "total": quote.total,
-        "notes": quote.notes,
-        "status": quote.status,
-        "project_id": quote.project_id,
-        "items": [
-            {
-                "id": item.id,
-                "seq": item.seq,
-                "name": item.name,
-                "specification": item.specification,
-                "quantity": item.quantity,
-                "unit": item.unit,
-                "unit_price": item.unit_price,
-                "amount": item.amount
-            } for item in items
-        ]
+        "seq": seq,
+        "name": item.get("name", ""),
+        "specification": item.get("specification", ""),
+        "quantity": item.get("quantity", 1),
+        "unit": item.get("unit", "式"),
+        "unit_price": item.get("unit_price", 0),
+        "amount": item.get("amount", 0)
     }
 
 
+def save_quote_items(db: Session, quote_id: int, items_data: list, existing: list = None):
+    """
+    明細を差分で保存（変更のあった行だけ UPDATE、増えた行は一括 INSERT、なくなった行は DELETE）
+
+    送られた明細に id があれば既存行と id で対応づけ、なければ同じ表示順（seq）の既存行に対応づける。
+    """
+    existing = existing or []
+    by_id = {item.id: item for item in existing}
+    claimed_ids = {item.get("id") for item in items_data if item.get("id") in by_id}
+    by_seq = {item.seq: item for item in existing if item.id not in claimed_ids}
+
+    inserts, updates, kept = [], [], set()
+    for seq, item in enumerate(items_data):
+        values = quote_item_values(item, seq)
+        current = by_id.get(item.get("id")) or by_seq.pop(seq, None)
+        if current is None or current.id in kept:
+            inserts.append({"quote_id": quote_id, **values})
+            continue
+        kept.add(current.id)
+        if any(getattr(current, field) != values[field] for field in QUOTE_ITEM_FIELDS):
+            updates.append({"id": current.id, **values})
+
+    deleted_ids = [item.id for item in existing if item.id not in kept]
+    if deleted_ids:
+        db.query(QuoteItem).filter(QuoteItem.id.in_(deleted_ids)).delete(synchronize_session=False)
+    if updates:
+        db.execute(update(QuoteItem), updates)
+    if inserts:
+        db.execute(insert(QuoteItem), inserts)
+    return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deleted_ids)}
+
+
 @app.post("/api/quotes")
 def create_quote(data: dict, db: Session = Depends(get_db)):
     """見積書を作成"""
@@ -4026,19 +4060,8 @@ def create_quote(data: dict, db: Session = Depends(get_db)):
     db.add(quote)
     db.flush()
 
-    # 明細を登録
-    for seq, item in enumerate(items_data):
-        quote_item = QuoteItem(
-            quote_id=quote.id,
-            seq=seq,
-            name=item.get("name", ""),
-            specification=item.get("specification", ""),
-            quantity=item.get("quantity", 1),
-            unit=item.get("unit", "式"),
-            unit_price=item.get("unit_price", 0),
-            amount=item.get("amount", 0)
-        )
-        db.add(quote_item)
+    # 明細を一括登録
+    save_quote_items(db, quote.id, items_data)
 
     db.commit()
     db.refresh(quote)
@@ -4054,9 +4077,6 @@ def update_quote(quote_id: int, data: dict, db: Session = Depends(get_db)):
 
     items_data = data.pop("items", [])
 
-    # 既存明細を削除
-    db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).delete()
-
     # 金額計算
     subtotal = sum(item.get("amount", 0) for item in items_data)
     tax_amount = int(subtotal * 0.1)
@@ -4072,22 +4092,14 @@ def update_quote(quote_id: int, data: dict, db: Session = Depends(get_db)):
     quote.tax_amount = tax_amount
     quote.total = total
 
-    # 明細を再登録
-    for seq, item in enumerate(items_data):
-        quote_item = QuoteItem(
-            quote_id=quote.id,
-            seq=seq,
-            name=item.get("name", ""),
-            specification=item.get("specification", ""),
-            quantity=item.get("quantity", 1),
-            unit=item.get("unit", "式"),
-            unit_price=item.get("unit_price", 0),
-            amount=item.get("amount", 0)
-        )
-        db.add(quote_item)
+    # 明細は変更のあった行だけ保存
+    existing = db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).all()
+    changes = save_quote_items(db, quote.id, items_data, existing)
+    # 明細だけの変更でも更新日時を進める
+    quote.updated_at = datetime.now()
 
     db.commit()
-    return {"id": quote.id, "total": total}
+    return {"id": quote.id, "total": total, "items": changes}
 
 
 @app.delete("/api/quotes/{quote_id}")
@@ -4136,26 +4148,26 @@ def convert_quote_to_order(quote_id: int, db: Session = Depends(get_db)):
     db.add(project)
     db.flush()
 
-    # 見積明細 → 工種として登録
-    for seq, item in enumerate(items):
-        work_type = ProjectWorkType(
-            project_id=project.id,
-            seq=seq + 1,
-            name=item.name,
-            spec=item.specification or "",
-            quantity=item.quantity,
-            unit=item.unit,
-            budget_unit_price=item.unit_price,
-            budget_amount=item.amount,
-            rate=1.0
-        )
-        db.add(work_type)
+    # 見積明細 → 工種として一括登録
+    if items:
+        db.execute(insert(ProjectWorkType), [{
+            "project_id": project.id,
+            "seq": seq + 1,
+            "name": item.name,
+            "spec": item.specification or "",
+            "quantity": item.quantity,
+            "unit": item.unit,
+            "budget_unit_price": item.unit_price,
+            "budget_amount": item.amount,
+            "rate": 1.0
+        } for seq, item in enumerate(items)])
 
     # 見積書のステータスを更新
     quote.status = "ordered"
     quote.project_id = project.id
 
     db.commit()
+    response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
 
     return {
         "success": True,
@@ -4171,725 +4183,281 @@ def convert_quote_to_order(quote_id: int, db: Session = Depends(get_db)):
 # 見積書Excel出力機能
 # ============================================
 
-# スタイル定義
-THIN = Side(style='thin', color='000000')
-BORDER_ALL = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
-BLACK_FILL = PatternFill('solid', fgColor='000000')
-YELLOW_FILL = PatternFill('solid', fgColor='FFFF99')
-WHITE_FONT = Font(color='FFFFFF', bold=True)
-TITLE_FONT = Font(size=16, bold=True)
-SMALL_FONT = Font(size=9)
-RED_FONT = Font(size=10, color='FF0000')
-
-
-def create_cover_sheet(ws, data):
-    """御見積書（表紙）シート作成"""
-    col_widths = {'A': 10, 'B': 12, 'C': 18, 'D': 10, 'E': 6, 'F': 6, 'G': 12, 'H': 10, 'I': 12}
-    for col, width in col_widths.items():
-        ws.column_dimensions[col].width = width
-    
-    ws.merge_cells('A1:I1')
-    ws['A1'] = "御 見 積 書"
-    ws['A1'].font = Font(size=16, bold=True, color='FFFFFF')
-    ws['A1'].fill = BLACK_FILL
-    ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-    ws.row_dimensions[1].height = 30
-    
-    ws.merge_cells('A2:E2')
-    ws['A2'] = f"{data['estimate_info']['to_company']}　御中"
-    ws['A2'].font = Font(size=11, bold=True)
-    
-    company = data['company_info']
-    ws['G2'] = company['name']
-    ws['G2'].font = Font(size=11, bold=True)
-    ws['G3'] = company['postal']
-    ws['G4'] = company['address']
-    ws['G5'] = f"{company['tel']}  {company['fax']}"
-    
-    info = data['estimate_info']
-    row = 7
-    for label, value in [("【工 事 名】", info.get('project_name', '')),
-                         ("【工事場所】", info.get('project_location', '')),
-                         ("【工　　期】", info.get('period', '')),
-                         ("【支払条件】", info.get('payment_terms', '')),
-                         ("【受渡条件】", info.get('delivery_terms', '')),
-                         ("【担 当 者】", info.get('contact', ''))]:
-        ws[f'A{row}'] = label
-        ws.merge_cells(f'B{row}:E{row}')
-        ws[f'B{row}'] = value
-        row += 1
-    
-    row += 1
-    ws.merge_cells(f'A{row}:H{row}')
-    ws[f'A{row}'] = "毎度、格別の御引立を賜り有難うございます。"
-    row += 1
-    ws.merge_cells(f'A{row}:H{row}')
-    ws[f'A{row}'] = "御依頼を戴きました本件に付き、誠心誠意検討を加え御見積申し上げましたので"
-    row += 1
-    ws.merge_cells(f'A{row}:H{row}')
-    ws[f'A{row}'] = "是非御下命賜ります様、お願い申し上げます。"
-    
-    row += 2
-    subtotal = info.get('subtotal', 0)
-    tax_rate = info.get('tax_rate', 0.10)
-    tax = int(subtotal * tax_rate)
-    total = subtotal + tax
-    
-    ws[f'C{row}'] = "小 計 金 額"
-    ws[f'F{row}'] = f"¥{subtotal:,}"
-    ws[f'F{row}'].alignment = Alignment(horizontal='right')
-    row += 1
-    ws[f'C{row}'] = f"消費税({int(tax_rate*100)}%)"
-    ws[f'F{row}'] = f"¥{tax:,}"
-    ws[f'F{row}'].alignment = Alignment(horizontal='right')
-    row += 1
-    ws.merge_cells(f'C{row}:D{row}')
-    ws[f'C{row}'] = "合 計 金 額"
-    ws[f'C{row}'].font = Font(size=12, bold=True)
-    ws.merge_cells(f'F{row}:G{row}')
-    ws[f'F{row}'] = f"¥{total:,}"
-    ws[f'F{row}'].font = Font(size=14, bold=True)
-    ws[f'F{row}'].alignment = Alignment(horizontal='right')
-    
-    row += 2
-    headers = ["No.", "名　称", "仕様・規格・寸法", "設計", "数量", "単位", "金額", "単価", "備考"]
-    for i, h in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=i, value=h)
-        cell.fill = BLACK_FILL
-        cell.font = Font(size=9, color='FFFFFF', bold=True)
-        cell.border = BORDER_ALL
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    row += 1
-    for idx, wt in enumerate(data['work_types'], 1):
-        ws.cell(row=row, column=1, value=idx).border = BORDER_ALL
-        ws.cell(row=row, column=1).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=2, value=wt['name']).border = BORDER_ALL
-        ws.cell(row=row, column=3, value=wt.get('spec', '') or "内訳書別添え").border = BORDER_ALL
-        ws.cell(row=row, column=4, value="").border = BORDER_ALL
-        ws.cell(row=row, column=5, value=wt.get('quantity', 1)).border = BORDER_ALL
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=6, value=wt.get('unit', '式')).border = BORDER_ALL
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=7, value=wt.get('amount', 0)).border = BORDER_ALL
-        ws.cell(row=row, column=7).number_format = '#,##0'
-        ws.cell(row=row, column=7).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=8, value="").border = BORDER_ALL
-        ws.cell(row=row, column=9, value="").border = BORDER_ALL
-        row += 1
-    
-    for _ in range(2):
-        for i in range(1, 10):
-            ws.cell(row=row, column=i, value="").border = BORDER_ALL
-        row += 1
-    
-    ws.cell(row=row, column=1, value="").border = BORDER_ALL
-    ws.merge_cells(f'B{row}:F{row}')
-    ws.cell(row=row, column=2, value="合　計（税抜）").border = BORDER_ALL
-    ws.cell(row=row, column=2).font = Font(bold=True)
-    for i in range(3, 7):
-        ws.cell(row=row, column=i).border = BORDER_ALL
-    ws.cell(row=row, column=7, value=subtotal).border = BORDER_ALL
-    ws.cell(row=row, column=7).number_format = '#,##0'
-    ws.cell(row=row, column=7).alignment = Alignment(horizontal='right')
-    ws.cell(row=row, column=7).font = Font(bold=True)
-    ws.cell(row=row, column=8, value="").border = BORDER_ALL
-    ws.cell(row=row, column=9, value="").border = BORDER_ALL
-
-
-def create_breakdown_sheet(ws, work_type, sheet_num, company_info):
-    """内訳明細書シート作成"""
-    col_widths = {'A': 18, 'B': 22, 'C': 8, 'D': 6, 'E': 10, 'F': 12, 'G': 18}
-    for col, width in col_widths.items():
-        ws.column_dimensions[col].width = width
-    
-    ws.merge_cells('A1:G1')
-    ws['A1'] = "内 訳 明 細 書"
-    ws['A1'].font = Font(size=14, bold=True, color='FFFFFF')
-    ws['A1'].fill = BLACK_FILL
-    ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-    ws.row_dimensions[1].height = 25
-    
-    row = 3
-    headers = ["名　称", "規　格", "数量", "単位", "単価", "金額", "備　考"]
-    for i, h in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=i, value=h)
-        cell.fill = YELLOW_FILL
-        cell.font = Font(size=9, bold=True)
-        cell.border = BORDER_ALL
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    row += 1
-    ws.merge_cells(f'A{row}:G{row}')
-    ws[f'A{row}'] = work_type['name']
-    ws[f'A{row}'].fill = YELLOW_FILL
-    ws[f'A{row}'].font = Font(size=10, bold=True)
-    ws[f'A{row}'].border = BORDER_ALL
-    for i in range(2, 8):
-        ws.cell(row=row, column=i).border = BORDER_ALL
-    
-    row += 1
-    category = work_type.get('category', '')
-    if category:
-        ws[f'A{row}'] = category
-        ws[f'A{row}'].font = Font(size=9)
-    
-    row += 1
-    items = work_type.get('items', [])
-    direct_cost = 0
-    
-    for item in items:
-        ws.cell(row=row, column=1, value=item.get('name', '')).border = BORDER_ALL
-        ws.cell(row=row, column=2, value=item.get('spec', '')).border = BORDER_ALL
-        qty = item.get('quantity', 0)
-        ws.cell(row=row, column=3, value=qty if qty else '').border = BORDER_ALL
-        ws.cell(row=row, column=3).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=4, value=item.get('unit', '')).border = BORDER_ALL
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        unit_price = item.get('unit_price', 0)
-        ws.cell(row=row, column=5, value=unit_price if unit_price else '').border = BORDER_ALL
-        ws.cell(row=row, column=5).number_format = '#,##0'
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='right')
-        amount = item.get('amount', 0)
-        ws.cell(row=row, column=6, value=amount if amount else '').border = BORDER_ALL
-        ws.cell(row=row, column=6).number_format = '#,##0'
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=7, value=item.get('note', '')).border = BORDER_ALL
-        direct_cost += amount
-        row += 1
-    
-    for _ in range(2):
-        for i in range(1, 8):
-            ws.cell(row=row, column=i, value="").border = BORDER_ALL
-        row += 1
-    
-    summary = work_type.get('summary', {})
-    
-    # 直接工事費
-    ws.cell(row=row, column=1, value="直接工事費").border = BORDER_ALL
-    for i in range(2, 5):
-        ws.cell(row=row, column=i, value="").border = BORDER_ALL
-    ws.cell(row=row, column=3, value=1.0).border = BORDER_ALL
-    ws.cell(row=row, column=4, value="式").border = BORDER_ALL
-    ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-    direct = summary.get('direct_cost', direct_cost)
-    ws.cell(row=row, column=5, value="").border = BORDER_ALL
-    ws.cell(row=row, column=6, value=direct).border = BORDER_ALL
-    ws.cell(row=row, column=6).number_format = '#,##0'
-    ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-    ws.cell(row=row, column=7, value="").border = BORDER_ALL
-    row += 1
-    
-    # 機械回送費
-    transport = summary.get('transport_cost', 0)
-    if transport:
-        ws.cell(row=row, column=1, value="機械回送費").border = BORDER_ALL
-        ws.cell(row=row, column=2, value=summary.get('transport_note', '')).border = BORDER_ALL
-        ws.cell(row=row, column=3, value=1.0).border = BORDER_ALL
-        ws.cell(row=row, column=4, value="往復").border = BORDER_ALL
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=5, value=transport).border = BORDER_ALL
-        ws.cell(row=row, column=5).number_format = '#,##0'
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=6, value=transport).border = BORDER_ALL
-        ws.cell(row=row, column=6).number_format = '#,##0'
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=7, value="").border = BORDER_ALL
-        row += 1
-    
-    # 諸経費
-    overhead = summary.get('overhead', 0)
-    if overhead:
-        ws.cell(row=row, column=1, value="諸　経　費").border = BORDER_ALL
-        ws.cell(row=row, column=2, value=summary.get('overhead_note', '')).border = BORDER_ALL
-        ws.cell(row=row, column=3, value=1.0).border = BORDER_ALL
-        ws.cell(row=row, column=4, value="式").border = BORDER_ALL
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=5, value=overhead).border = BORDER_ALL
-        ws.cell(row=row, column=5).number_format = '#,##0'
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=6, value=overhead).border = BORDER_ALL
-        ws.cell(row=row, column=6).number_format = '#,##0'
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=7, value="").border = BORDER_ALL
-        row += 1
-    
-    # 値引き
-    discount = summary.get('discount', 0)
-    if discount:
-        ws.cell(row=row, column=1, value="値 引 き").border = BORDER_ALL
-        ws.cell(row=row, column=2, value="").border = BORDER_ALL
-        ws.cell(row=row, column=3, value=1.0).border = BORDER_ALL
-        ws.cell(row=row, column=4, value="式").border = BORDER_ALL
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=5, value=abs(discount)).border = BORDER_ALL
-        ws.cell(row=row, column=5).number_format = '#,##0'
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=6, value=discount).border = BORDER_ALL
-        ws.cell(row=row, column=6).number_format = '#,##0'
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=6).font = RED_FONT
-        ws.cell(row=row, column=7, value="").border = BORDER_ALL
-        row += 1
-    
-    # 法定福利費
-    welfare = summary.get('welfare_base', 0)
-    welfare_rate = summary.get('welfare_rate', 0.15938)
-    if welfare:
-        ws.cell(row=row, column=1, value="法定福利費").border = BORDER_ALL
-        ws.cell(row=row, column=2, value="事業主負担分").border = BORDER_ALL
-        ws.cell(row=row, column=3, value=1.0).border = BORDER_ALL
-        ws.cell(row=row, column=4, value="式").border = BORDER_ALL
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=5, value=welfare).border = BORDER_ALL
-        ws.cell(row=row, column=5).number_format = '#,##0'
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=6, value=welfare).border = BORDER_ALL
-        ws.cell(row=row, column=6).number_format = '#,##0'
-        ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=7, value=f"社会保険料率\n〜{welfare_rate*100:.3f}%").border = BORDER_ALL
-        ws.cell(row=row, column=7).alignment = Alignment(wrap_text=True)
-        row += 1
-    
-    # 小計
-    ws.cell(row=row, column=1, value="小　計").border = BORDER_ALL
-    ws.cell(row=row, column=1).font = Font(size=10, bold=True)
-    for i in range(2, 6):
-        ws.cell(row=row, column=i, value="").border = BORDER_ALL
-    subtotal = summary.get('subtotal', work_type.get('amount', 0))
-    ws.cell(row=row, column=6, value=subtotal).border = BORDER_ALL
-    ws.cell(row=row, column=6).number_format = '#,##0'
-    ws.cell(row=row, column=6).alignment = Alignment(horizontal='right')
-    ws.cell(row=row, column=6).font = Font(size=10, bold=True)
-    ws.cell(row=row, column=7, value="").border = BORDER_ALL
-
-
-def create_condition_sheet(ws, conditions, company_info):
-    """施工条件書シート作成"""
-    ws.column_dimensions['A'].width = 4
-    ws.column_dimensions['B'].width = 90
-    
-    ws.merge_cells('A1:B1')
-    ws['A1'] = "施 工 条 件 書"
-    ws['A1'].font = Font(size=14, bold=True, color='FFFFFF')
-    ws['A1'].fill = BLACK_FILL
-    ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-    ws.row_dimensions[1].height = 25
-    
-    row = 3
-    for i, cond in enumerate(conditions, 1):
-        ws.cell(row=row, column=1, value=i)
-        ws.cell(row=row, column=1).alignment = Alignment(horizontal='right')
-        ws.cell(row=row, column=2, value=cond)
-        ws.row_dimensions[row].height = 18
-        row += 1
-    
-    row += 2
-    ws.cell(row=row, column=2, value=company_info['name'])
-    ws.cell(row=row, column=2).alignment = Alignment(horizontal='right')
-
-
-def create_estimate_excel_v2(data, output_path):
-    """見積書Excelを作成"""
-    wb = Workbook()
-    ws1 = wb.active
-    ws1.title = "御見積書"
-    create_cover_sheet(ws1, data)
-    
-    for idx, wt in enumerate(data['work_types'], 1):
-        ws = wb.create_sheet(f"内訳明細書{idx}")
-        create_breakdown_sheet(ws, wt, idx, data['company_info'])
-    
-    ws3 = wb.create_sheet("施工条件書")
-    create_condition_sheet(ws3, data.get('conditions', []), data['company_info'])
-    
-    wb.save(output_path)
-    return output_path
+# 書式・シートの作成は estimate_excel.py
 
 
 # ============================================
 # 見積書Excel出力API
 # ============================================
 
+def attachment_disposition(filename: str) -> str:
+    """ダウンロード用の Content-Disposition（日本語のファイル名は RFC 5987 形式）"""
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+ESTIMATE_COMPANY_INFO = {
+    "name": "株式会社 サンユウテック",
+    "postal": "〒816-0912",
+    "address": "福岡県大野城市御笠川6丁目2-5",
+    "tel": "TEL092-555-9211",
+    "fax": "FAX092-555-9217"
+}
+
+# 一括出力できる案件数の上限
+ESTIMATE_BATCH_LIMIT = 200
+
+
+def load_estimate_data(db: Session, projects) -> dict:
+    """
+    案件ごとの見積書データ {project_id: data} を作成
+
+    工種・明細は案件数にかかわらずそれぞれ1回のクエリで読み込む。
+    """
+    project_ids = [p.id for p in projects]
+    work_types = db.query(ProjectWorkType).filter(
+        ProjectWorkType.project_id.in_(project_ids)
+    ).order_by(ProjectWorkType.project_id, ProjectWorkType.seq, ProjectWorkType.id).all()
+
+    details_by_work_type = {wt.id: [] for wt in work_types}
+    if work_types:
+        details = db.query(WorkTypeDetail).filter(
+            WorkTypeDetail.work_type_id.in_(list(details_by_work_type))
+        ).order_by(WorkTypeDetail.work_type_id, WorkTypeDetail.seq, WorkTypeDetail.id).all()
+        for d in details:
+            details_by_work_type[d.work_type_id].append(d)
+
+    work_types_by_project = {pid: [] for pid in project_ids}
+    for wt in work_types:
+        work_types_by_project[wt.project_id].append(wt)
+
+    result = {}
+    for project in projects:
+        work_types_data = []
+        subtotal = 0
+        for wt in work_types_by_project[project.id]:
+            details = details_by_work_type[wt.id]
+
+            items = [{"name": d.name, "spec": d.spec or "", "quantity": d.budget_quantity or 0,
+                      "unit": d.unit or "", "unit_price": d.budget_unit_price or 0,
+                      "amount": d.budget_amount or 0} for d in details]
+
+            direct_cost = sum(d.budget_amount or 0 for d in details)
+            amount = wt.estimate_amount or wt.budget_amount or direct_cost
+            subtotal += amount
+
+            work_types_data.append({
+                "name": wt.name,
+                "spec": wt.spec or "内訳書別添え",
+                "quantity": wt.quantity or 1,
+                "unit": wt.unit or "式",
+                "amount": amount,
+                "category": wt.note or "",
+                "items": items,
+                "summary": {"direct_cost": direct_cost, "subtotal": amount}
+            })
+
+        result[project.id] = {
+            "company_info": ESTIMATE_COMPANY_INFO,
+            "estimate_info": {
+                "to_company": project.client or "",
+                "project_name": project.name,
+                "project_location": project.address or "",
+                "period": getattr(project, 'period', '') or "",
+                "payment_terms": "出来高請負払 現金100%",
+                "delivery_terms": "別途、工事経理確認書及び現場条件書による",
+                "contact": "上原 拓",
+                "subtotal": subtotal,
+                "tax_rate": 0.10,
+            },
+            "work_types": work_types_data,
+            "conditions": []
+        }
+    return result
+
+
 @app.post("/api/projects/{project_id}/export-estimate")
-async def export_estimate(project_id: int, db: Session = Depends(get_db)):
-    """案件の見積書をExcelで出力"""
-    project = db.query(Project).filter(Project.id == project_id).first()
+async def export_estimate(project_id: int, write_only: Optional[bool] = None, db: AsyncSession = Depends(get_async_db)):
+    """
+    案件の見積書をExcelで出力
+
+    メモリ上で作成して返す（一時ファイルは作らない）。write_only を省略した場合は
+    明細が多いときだけ write_only モードで作成する。
+    """
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    work_types = db.query(ProjectWorkType).filter(
-        ProjectWorkType.project_id == project_id
-    ).order_by(ProjectWorkType.seq).all()
-    
-    company_info = {
-        "name": "株式会社 サンユウテック",
-        "postal": "〒816-0912",
-        "address": "福岡県大野城市御笠川6丁目2-5",
-        "tel": "TEL092-555-9211",
-        "fax": "FAX092-555-9217"
-    }
-    
-    work_types_data = []
-    subtotal = 0
-    for wt in work_types:
-        details = db.query(WorkTypeDetail).filter(
-            WorkTypeDetail.work_type_id == wt.id
-        ).order_by(WorkTypeDetail.seq).all()
-        
-        items = [{"name": d.name, "spec": d.spec or "", "quantity": d.budget_quantity or 0,
-                  "unit": d.unit or "", "unit_price": d.budget_unit_price or 0,
-                  "amount": d.budget_amount or 0} for d in details]
-        
-        direct_cost = sum(d.budget_amount or 0 for d in details)
-        amount = wt.estimate_amount or wt.budget_amount or direct_cost
-        subtotal += amount
-        
-        work_types_data.append({
-            "name": wt.name,
-            "spec": wt.spec or "内訳書別添え",
-            "quantity": wt.quantity or 1,
-            "unit": wt.unit or "式",
-            "amount": amount,
-            "category": wt.note or "",
-            "items": items,
-            "summary": {"direct_cost": direct_cost, "subtotal": amount}
-        })
-    
-    data = {
-        "company_info": company_info,
-        "estimate_info": {
-            "to_company": project.client or "",
-            "project_name": project.name,
-            "project_location": project.address or "",
-            "period": getattr(project, 'period', '') or "",
-            "payment_terms": "出来高請負払 現金100%",
-            "delivery_terms": "別途、工事経理確認書及び現場条件書による",
-            "contact": "上原 拓",
-            "subtotal": subtotal,
-            "tax_rate": 0.10,
-        },
-        "work_types": work_types_data,
-        "conditions": []
-    }
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-        create_estimate_excel_v2(data, tmp.name)
-        tmp_path = tmp.name
-    
+
+    data = (await db.run_sync(load_estimate_data, [project]))[project.id]
+    content = await run_in_threadpool(estimate_excel.estimate_excel_bytes, data, write_only)
+
     filename = f"見積書_{project.name}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-    return FileResponse(path=tmp_path, filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return Response(content=content, media_type=estimate_excel.CONTENT_TYPE,
+        headers={"Content-Disposition": attachment_disposition(filename)})
 
 
-# ============================================
-# 見積書Excel取込API（強化版）
-# ============================================
+class EstimateBatchExportRequest(BaseModel):
+    project_ids: Optional[List[int]] = None  # 指定した案件（省略時は status / client で絞り込み）
+    status: Optional[str] = None
+    client: Optional[str] = None
+    write_only: Optional[bool] = None
 
-@app.post("/api/projects/import-estimate")
-async def import_estimate(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """見積書Excelを読み込んで新規案件として登録（内訳明細書も含む）"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
 
-    try:
-        wb = load_workbook(tmp_path, data_only=True)
+def _estimate_batch_projects(db: Session, data: EstimateBatchExportRequest):
+    query = db.query(Project)
+    if data.project_ids:
+        query = query.filter(Project.id.in_(data.project_ids))
+    if data.status:
+        query = query.filter(Project.status == data.status)
+    if data.client:
+        query = query.filter(Project.client == data.client)
+    projects = query.order_by(Project.id).limit(ESTIMATE_BATCH_LIMIT + 1).all()
+    if len(projects) > ESTIMATE_BATCH_LIMIT:
+        return projects, None
+    return projects, load_estimate_data(db, projects)
 
-        # ============ 1. 御見積書シートから基本情報取得 ============
-        project_name = ""
-        client = ""
-        location = ""
-        period = ""
-        work_types_data = []
 
-        if "御見積書" in wb.sheetnames:
-            ws = wb["御見積書"]
-
-            # 基本情報を探す
-            for row in ws.iter_rows(min_row=1, max_row=30):
-                for cell in row:
-                    val = str(cell.value) if cell.value else ""
-
-                    # 宛先（御中）
-                    if "御中" in val:
-                        client = val.replace("御中", "").replace("　", " ").strip()
-
-                    # 工事名
-                    if "工事名" in val.replace(" ", "").replace("　", ""):
-                        # 次のセルを確認
-                        for c in range(cell.column + 1, cell.column + 5):
-                            next_cell = ws.cell(row=cell.row, column=c)
-                            if next_cell.value:
-                                project_name = str(next_cell.value).strip()
-                                break
-
-                    # 工事場所
-                    if "工事場所" in val.replace(" ", ""):
-                        for c in range(cell.column + 1, cell.column + 5):
-                            next_cell = ws.cell(row=cell.row, column=c)
-                            if next_cell.value:
-                                location = str(next_cell.value).strip()
-                                break
-
-                    # 工期
-                    if "工期" in val.replace(" ", "").replace("　", ""):
-                        for c in range(cell.column + 1, cell.column + 5):
-                            next_cell = ws.cell(row=cell.row, column=c)
-                            if next_cell.value:
-                                period = str(next_cell.value).strip()
-                                break
-
-            # 工種テーブルを探す
-            in_table = False
-            seq_counter = 1
-            for row in ws.iter_rows(min_row=10, max_row=100):
-                first_val = row[0].value
-
-                # ヘッダー行を検出
-                if first_val and str(first_val).strip().lower() in ["no.", "no", "番号"]:
-                    in_table = True
+def _zip_entry_name(project) -> str:
+    name = f"{project.code or project.id}_見積書_{project.name}.xlsx"
+    return name.replace("/", "_").replace("\\", "_")
+
+
+@app.post("/api/projects/export-estimates")
+async def export_estimates(data: EstimateBatchExportRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    複数案件の見積書Excelをzipでまとめて出力
+
+    各案件のExcelはプロセスプールで並行して作成し、できたものから順にzipに追加して送信する。
+    作成に失敗した案件は zip 内の「出力エラー.txt」に記録する。1件も作成できなければ 500 を返す。
+    """
+    if not (data.project_ids or data.status or data.client):
+        raise HTTPException(status_code=400, detail="project_ids または status / client を指定してください")
+
+    projects, estimates = await db.run_sync(_estimate_batch_projects, data)
+    if estimates is None:
+        raise HTTPException(status_code=400, detail=f"一度に出力できるのは{ESTIMATE_BATCH_LIMIT}件までです")
+    if not projects:
+        raise HTTPException(status_code=404, detail="対象の案件がありません")
+
+    names = {p.id: _zip_entry_name(p) for p in projects}
+
+    async def build(pid):
+        try:
+            return pid, await process_pool.submit(estimate_excel.estimate_excel_bytes, estimates[pid], data.write_only), None
+        except Exception as e:
+            return pid, None, e
+
+    # 1件できるまで待ってから送信を始める（全件失敗ならエラー内容だけの zip を 200 で返さない）
+    tasks = [asyncio.ensure_future(build(pid)) for pid in names]
+    pending = set(tasks)
+    finished = []
+    try:
+        while pending and all(error is not None for _, _, error in finished):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished.extend(task.result() for task in done)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    if all(error is not None for _, _, error in finished):
+        for pid, _, error in finished:
+            print(f"見積書の作成に失敗しました（案件ID {pid}）: {error}")
+        raise HTTPException(status_code=500, detail=f"見積書を作成できませんでした: {finished[0][2]}")
+
+    async def results():
+        for result in finished:
+            yield result
+        for next_done in asyncio.as_completed(pending):
+            yield await next_done
+
+    async def stream():
+        archive = zip_stream.ZipStream()
+        errors = []
+        try:
+            async for pid, content, error in results():
+                if error is not None:
+                    print(f"見積書の作成に失敗しました（案件ID {pid}）: {error}")
+                    errors.append(f"{names[pid]}: {error}")
                     continue
+                yield archive.add(names[pid], content)
+            if errors:
+                yield archive.add("出力エラー.txt", "\n".join(errors).encode("utf-8"), compress=True)
+            yield archive.close()
+        finally:
+            # 途中で接続が切れた場合、まだ始まっていない作成は取り消す
+            for task in tasks:
+                task.cancel()
 
-                # データ行
-                if in_table:
-                    name = ""
-                    amount = 0
-
-                    # 最初のセルが数値（No.）の場合
-                    try:
-                        no = int(first_val)
-                        name = str(row[1].value).strip() if row[1].value else ""
-                    except (ValueError, TypeError):
-                        # No.がない場合は最初のセルを名前として使用
-                        name = str(first_val).strip() if first_val else ""
-                        no = seq_counter
-
-                    # 合計行はスキップ
-                    if not name or "合計" in name:
-                        if "合計" in str(first_val or ""):
-                            in_table = False
-                        continue
-
-                    # 金額を探す（一式 × 単価形式でシンプルに）
-                    for cell in row[1:]:
-                        val = cell.value
-                        if val is None:
-                            continue
-                        # 数値で1000以上なら金額として判定
-                        if isinstance(val, (int, float)) and val >= 1000:
-                            amount = int(val)
-
-                    if name and amount > 0:
-                        work_types_data.append({
-                            "seq": no,
-                            "name": name,
-                            "spec": "",
-                            "quantity": 1,
-                            "unit": "式",
-                            "amount": amount
-                        })
-                        seq_counter += 1
-
-        # ============ 2. 内訳明細書シートから明細取得 ============
-        all_details = {}  # 工種名 -> 明細リスト
-
-        for sheet_name in wb.sheetnames:
-            if "内訳" in sheet_name or "明細" in sheet_name:
-                ws = wb[sheet_name]
-
-                current_work_type = ""
-                details = []
-
-                for row in ws.iter_rows(min_row=1, max_row=300):
-                    row_values = [cell.value for cell in row]
-                    first_val = str(row[0].value).strip() if row[0].value else ""
-
-                    # 工種名を検出（黄色背景 or 結合セル）
-                    if row[0].fill and hasattr(row[0].fill, 'fgColor'):
-                        fill_color = row[0].fill.fgColor
-                        if fill_color and fill_color.rgb and 'FFFF' in str(fill_color.rgb):
-                            # 黄色っぽい背景 = 工種名
-                            if first_val and first_val not in ["名称", "名　称"]:
-                                current_work_type = first_val
-                                continue
-
-                    # ヘッダー行をスキップ
-                    if first_val in ["名称", "名　称", "品名"]:
-                        continue
-
-                    # 合計・小計行のみスキップ（直接工事費・諸経費・法定福利費は取り込む）
-                    skip_keywords = ["小計", "小　計", "合計", "合　計"]
-                    if any(kw in first_val for kw in skip_keywords):
-                        continue
-
-                    # 空行スキップ
-                    if not first_val:
-                        continue
-
-                    # 明細行として処理
-                    try:
-                        name = first_val
-                        spec = str(row[1].value).strip() if len(row) > 1 and row[1].value else ""
-                        quantity = 0
-                        unit = ""
-                        unit_price = 0
-                        amount = 0
-
-                        # 数量
-                        if len(row) > 2 and row[2].value:
-                            try:
-                                quantity = float(row[2].value)
-                            except:
-                                pass
-
-                        # 単位
-                        if len(row) > 3 and row[3].value:
-                            unit = str(row[3].value).strip()
-
-                        # 単価
-                        if len(row) > 4 and row[4].value:
-                            try:
-                                unit_price = int(float(row[4].value))
-                            except:
-                                pass
-
-                        # 金額
-                        if len(row) > 5 and row[5].value:
-                            try:
-                                amount = int(float(row[5].value))
-                            except:
-                                pass
-
-                        # 有効なデータのみ追加
-                        if name and (quantity > 0 or amount > 0):
-                            detail = {
-                                "name": name,
-                                "spec": spec,
-                                "quantity": quantity,
-                                "unit": unit,
-                                "unit_price": unit_price,
-                                "amount": amount
-                            }
-                            details.append(detail)
-                    except Exception as e:
-                        print(f"明細行パースエラー: {e}")
-                        continue
-
-                # 工種名が特定できなかった場合はシート名から推測
-                if not current_work_type:
-                    current_work_type = sheet_name.replace("内訳明細書", "").strip() or "明細"
-
-                if details:
-                    all_details[current_work_type] = details
-
-        # ============ 3. データベースに保存 ============
-
-        # プロジェクト名がなければ生成
-        if not project_name:
-            project_name = f"取込案件_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-
-        # 案件作成
-        project = Project(
-            name=project_name,
-            client=client,
-            address=location,
-            status="見積中"
-        )
-        db.add(project)
-        db.commit()
-        db.refresh(project)
-
-        # 工種が見つからなかった場合、内訳明細書のキーから作成
-        # ※内訳からの自動合計はしない。単価をそのまま使用
-        if not work_types_data and all_details:
-            for idx, (wt_name, details) in enumerate(all_details.items(), 1):
-                # 最初の明細の金額を単価として使用（自動合計しない）
-                first_detail = details[0] if details else {}
-                amount = first_detail.get("amount", 0) or first_detail.get("unit_price", 0)
-                work_types_data.append({
-                    "seq": idx,
-                    "name": wt_name,
-                    "spec": "",
-                    "quantity": 1,
-                    "unit": "式",
-                    "amount": amount
-                })
-
-        # 工種作成
-        created_work_types = []
-        for wt in work_types_data:
-            work_type = ProjectWorkType(
-                project_id=project.id,
-                seq=wt.get("seq", 1),
-                name=wt["name"],
-                spec=wt.get("spec", ""),
-                quantity=wt.get("quantity", 1),
-                unit=wt.get("unit", "式"),
-                budget_amount=wt.get("amount", 0),
-                estimate_amount=wt.get("amount", 0),
-                rate=1.0
-            )
-            db.add(work_type)
-            db.commit()
-            db.refresh(work_type)
-            created_work_types.append(work_type)
-
-        # 明細作成
-        total_details = 0
-        for wt in created_work_types:
-            # 工種名で明細を検索
-            details = all_details.get(wt.name, [])
-
-            # 見つからなければ部分一致で検索
-            if not details:
-                for key in all_details.keys():
-                    if wt.name in key or key in wt.name:
-                        details = all_details[key]
-                        break
-
-            # それでもなければ最初の明細を使用（工種が1つの場合）
-            if not details and len(created_work_types) == 1 and all_details:
-                details = list(all_details.values())[0]
-
-            for idx, d in enumerate(details, 1):
-                detail = WorkTypeDetail(
-                    work_type_id=wt.id,
-                    seq=idx,
-                    name=d.get("name", ""),
-                    spec=d.get("spec", ""),
-                    budget_quantity=d.get("quantity", 0),
-                    unit=d.get("unit", ""),
-                    budget_unit_price=d.get("unit_price", 0),
-                    budget_amount=d.get("amount", 0),
-                    cost_category="経費"  # デフォルト
-                )
-                db.add(detail)
-                total_details += 1
-
-            # ※工種の予算金額は再計算しない（単価をそのまま使用）
+    filename = f"見積書_{datetime.now().strftime('%Y%m%d')}.zip"
+    return StreamingResponse(stream(), media_type="application/zip",
+        headers={"Content-Disposition": attachment_disposition(filename)})
 
-        db.commit()
 
+# ============================================
+# 見積書Excel取込API（強化版）
+# ============================================
+
+@app.post("/api/projects/import-estimate")
+async def import_estimate(file: UploadFile = File(...), dry_run: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """
+    見積書Excelを読み込んで新規案件として登録（内訳明細書も含む）
+
+    案件・工種・明細は1トランザクションで登録する。dry_run=true の場合は登録せず解析結果だけ返す。
+    """
+    parsed = await parse_excel_upload(excel_import.parse_estimate_workbook, file)
+
+    if dry_run:
         return {
-            "success": True,
-            "project_id": project.id,
-            "project_name": project_name,
-            "client": client,
-            "location": location,
-            "work_types_count": len(created_work_types),
-            "details_count": total_details,
-            "message": f"案件「{project_name}」を作成しました。工種{len(created_work_types)}件、明細{total_details}件を取り込みました。"
+            "dry_run": True,
+            **parsed,
+            "work_types_count": len(parsed["work_types"]),
+            "details_count": sum(len(wt["details"]) for wt in parsed["work_types"]),
         }
 
+    try:
+        result = await db.run_sync(excel_import.create_project_from_estimate, parsed)
+        await db.commit()
     except Exception as e:
+        await db.rollback()
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"取込エラー: {str(e)}")
 
-    finally:
-        os.unlink(tmp_path)
+    response_cache.invalidate("analytics", "dashboard", "dashboard_summary", "projects_with_weather")
+    return {**result, "errors": parsed["errors"]}
+
+
+# ============================================
+# Excel取込ジョブAPI
+# ============================================
+
+@app.post("/api/import-jobs/budget/{project_id}", status_code=202)
+async def create_budget_import_job(project_id: int, file: UploadFile = File(...), vendor: str = "", category: str = "外注費"):
+    """予算明細Excelの取込ジョブを登録（結果は GET /api/import-jobs/{job_id} で確認）"""
+    job_id = await import_jobs.submit("budget", file, {"project_id": project_id, "vendor": vendor, "category": category})
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.post("/api/import-jobs/project", status_code=202)
+async def create_project_import_job(file: UploadFile = File(...), vendor: str = "", category: str = "外注費"):
+    """工事一括登録Excelの取込ジョブを登録"""
+    job_id = await import_jobs.submit("project", file, {"vendor": vendor, "category": category})
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.post("/api/import-jobs/estimate", status_code=202)
+async def create_estimate_import_job(file: UploadFile = File(...)):
+    """見積書Excelの取込ジョブを登録"""
+    job_id = await import_jobs.submit("estimate", file, {})
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/api/import-jobs/{job_id}")
+def get_import_job(job_id: int, db: Session = Depends(get_db)):
+    """取込ジョブの状態・進捗・読み取れなかった行"""
+    job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="取込ジョブが見つかりません")
+    return import_jobs.serialize_job(job)
 
 
 # ============================================
@@ -4949,7 +4517,7 @@ def init_members(db: Session = Depends(get_db)):
 # ============================================
 
 @app.post("/api/hotel-request")
-async def create_hotel_request(data: dict, db: Session = Depends(get_db)):
+async def create_hotel_request(data: dict, db: AsyncSession = Depends(get_async_db)):
     """ホテル予約依頼を作成し、LINE WORKSに送信"""
     import json
 
@@ -4969,8 +4537,7 @@ async def create_hotel_request(data: dict, db: Session = Depends(get_db)):
         requested_by=data.get("requested_by", "システム")
     )
     db.add(hotel_request)
-    db.commit()
-    db.refresh(hotel_request)
+    await db.commit()
 
     # LINE WORKSメッセージを作成
     checkin_date = data.get("checkin", "")
@@ -5015,7 +4582,7 @@ async def create_hotel_request(data: dict, db: Session = Depends(get_db)):
 依頼ID: #{hotel_request.id}"""
 
     # LINE WORKS設定を取得して送信
-    lw_settings = db.query(LineWorksSettings).first()
+    lw_settings = await db.scalar(select(LineWorksSettings).limit(1))
     lw_sent = False
 
     if lw_settings and lw_settings.is_active:
@@ -5040,7 +4607,7 @@ async def create_hotel_request(data: dict, db: Session = Depends(get_db)):
                 response_data=json.dumps({"hotel_request_id": hotel_request.id})
             )
             db.add(log)
-            db.commit()
+            await db.commit()
             lw_sent = True
         except Exception as e:
             print(f"LINE WORKS送信エラー: {e}")
@@ -5067,3 +4634,18 @@ def get_hotel_requests(db: Session = Depends(get_db)):
         "status": r.status,
         "created_at": str(r.created_at)
     } for r in requests]
+
+
+# ============================================
+# 開発用: SQL実行状況
+# ============================================
+
+@app.get("/api/debug/sql-stats")
+def get_sql_stats():
+    """ルート別のSQL実行回数・DB時間・取得行数・N+1の疑い（SQL_STATS=1 のときのみ記録）"""
+    return {"enabled": sql_stats.ENABLED, "routes": sql_stats.snapshot()}
+
+@app.delete("/api/debug/sql-stats")
+def reset_sql_stats():
+    sql_stats.reset()
+    return {"ok": True}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+スキーマのバージョン管理
+
+create_all は既存テーブルへのインデックス追加などを反映しないため、
+既存DBに必要な変更はここにバージョン付きで登録し、起動時に未適用分だけ実行する。
+適用済みバージョンは schema_migrations テーブルに記録する。
+
+    python migrations.py upgrade   # 未適用のマイグレーションを実行
+    python migrations.py status    # 適用状況を表示
+"""
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, insert, select
+from database import Base
+import models  # noqa: F401  テーブル定義を Base.metadata に登録
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# (バージョン, 説明, 実行関数) - バージョン順に追加していく
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _create_indexes(conn, index_names):
+    """models.py に定義済みのインデックスを名前で探して作成（既存ならスキップ）"""
+    indexes = {
+        index.name: index
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    }
+    for name in index_names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+@migration(1, "主要な検索条件カラムにインデックスを追加")
+def add_hot_filter_indexes(conn):
+    _create_indexes(conn, [
+        "ix_costs_project_id_date",
+        "ix_costs_date",
+        "ix_billings_project_id",
+        "ix_budget_details_project_id",
+        "ix_expenses_project_id",
+        "ix_expenses_status",
+        "ix_project_work_types_project_id_seq",
+        "ix_work_type_details_work_type_id_seq",
+        "ix_monthly_progress_project_id_year_month",
+        "ix_monthly_progress_year_month",
+        "ix_receivables_project_id",
+        "ix_receivables_progress_id",
+        "ix_receivables_expected_date",
+        "ix_payables_project_id",
+        "ix_payables_expected_date",
+        "ix_estimates_project_id",
+        "ix_budgets_project_id",
+        "ix_approvals_status_requested_at",
+        "ix_notifications_user_id_is_read",
+        "ix_notifications_is_read",
+        "ix_assignments_date",
+        "ix_assignments_project_id",
+        "ix_ky_reports_project_id",
+        "ix_inventory_transactions_item_id",
+        "ix_schedules_project_id",
+        "ix_attendances_worker_id_date",
+        "ix_attendances_date",
+        "ix_site_photos_project_id",
+        "ix_drawings_project_id",
+        "ix_drawing_pins_drawing_id",
+        "ix_inspection_items_inspection_id",
+        "ix_corrections_inspection_id",
+        "ix_worker_registrations_worker_id",
+        "ix_worker_registrations_project_id",
+        "ix_worker_registrations_health_check_date",
+        "ix_safety_trainings_project_id",
+        "ix_qualifications_worker_id",
+        "ix_messages_project_id_sent_at",
+        "ix_messages_is_read",
+        "ix_message_reads_message_id",
+        "ix_daily_reports_date_worker_id",
+        "ix_daily_reports_project_id",
+        "ix_lineworks_users_user_id",
+        "ix_quote_items_quote_id_seq",
+    ])
+
+
+@migration(2, "天気予報キャッシュから旧形式（日別リスト）の行を削除")
+def drop_old_weather_cache(conn):
+    # キャッシュなので消しても次の表示で取り直される
+    table = models.WeatherForecastCache.__table__
+    conn.execute(delete(table).where(table.c.forecasts.like("[%")))
+
+
+def applied_versions(engine) -> set:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine) -> list:
+    """未適用のマイグレーションを1件ずつ別トランザクションで実行。適用したバージョンを返す"""
+    done = applied_versions(engine)
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(insert(schema_migrations).values(
+                version=version, description=description, applied_at=datetime.now()
+            ))
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "upgrade":
+        Base.metadata.create_all(bind=engine)
+        applied = upgrade(engine)
+        if applied:
+            print(f"マイグレーションを適用しました: {applied}")
+        else:
+            print("未適用のマイグレーションはありません")
+    elif command == "status":
+        done = applied_versions(engine)
+        for version, description, _ in MIGRATIONS:
+            mark = "適用済" if version in done else "未適用"
+            print(f"{version:4d} [{mark}] {description}")
+    else:
+        print(f"不明なコマンド: {command}（upgrade / status）")
+        sys.exit(2)
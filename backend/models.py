@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from database import Base
 
@@ -30,9 +30,12 @@ class Project(Base):
 
 class Cost(Base):
     __tablename__ = "costs"
+    __table_args__ = (
+        Index("ix_costs_project_id_date", "project_id", "date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, nullable=False)
-    date = Column(Date, nullable=False)
+    date = Column(Date, nullable=False, index=True)
     category = Column(String, nullable=False)  # 労務費/材料費/外注費/経費
     work_type = Column(String)  # 工種
     vendor = Column(String)
@@ -43,10 +46,22 @@ class Cost(Base):
     amount = Column(Integer, default=0)
     created_at = Column(DateTime, server_default=func.now())
 
+class ProjectCostRollup(Base):
+    """原価集計（工事別・費目別・月別） - costsへの書き込み時に差分更新"""
+    __tablename__ = "project_cost_rollups"
+    __table_args__ = (UniqueConstraint("project_id", "category", "year_month"),)
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, nullable=False, index=True)
+    category = Column(String, nullable=False)
+    year_month = Column(String(7), nullable=False)  # YYYY-MM
+    amount = Column(Integer, default=0)  # 原価合計
+    cost_count = Column(Integer, default=0)  # 原価件数
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
 class Billing(Base):
     __tablename__ = "billings"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False, index=True)
     bill_type = Column(String, nullable=False)
     date = Column(Date, nullable=False)
     amount = Column(Integer, default=0)
@@ -126,7 +141,7 @@ class BudgetDetail(Base):
     """予算明細"""
     __tablename__ = "budget_details"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False, index=True)
     category = Column(String)
     work_type = Column(String)
     vendor = Column(String)
@@ -178,7 +193,7 @@ class Expense(Base):
     """経費申請"""
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
     user_id = Column(Integer, default=1)
     category_id = Column(Integer, ForeignKey("expense_categories.id"), nullable=False)
     expense_date = Column(Date, nullable=False)
@@ -187,7 +202,7 @@ class Expense(Base):
     fuel_liter = Column(Float)  # 給油量
     store_name = Column(String(100))
     memo = Column(Text)
-    status = Column(String(20), default="pending")  # pending / approved / rejected
+    status = Column(String(20), default="pending", index=True)  # pending / approved / rejected
     reject_reason = Column(Text)
     approved_by = Column(Integer)
     approved_at = Column(DateTime)
@@ -214,6 +229,9 @@ class ExpenseReceipt(Base):
 class ProjectWorkType(Base):
     """案件工種（内訳書レベル）"""
     __tablename__ = "project_work_types"
+    __table_args__ = (
+        Index("ix_project_work_types_project_id_seq", "project_id", "seq"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     seq = Column(Integer, default=1)  # 表示順
@@ -235,6 +253,9 @@ class ProjectWorkType(Base):
 class WorkTypeDetail(Base):
     """工種明細（品名レベル - 材料費・機械費・労務費など）"""
     __tablename__ = "work_type_details"
+    __table_args__ = (
+        Index("ix_work_type_details_work_type_id_seq", "work_type_id", "seq"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     work_type_id = Column(Integer, ForeignKey("project_work_types.id"), nullable=False)
     seq = Column(Integer, default=1)  # 表示順
@@ -261,9 +282,12 @@ class WorkTypeDetail(Base):
 class MonthlyProgress(Base):
     """出来高調書（工事別・月別）"""
     __tablename__ = "monthly_progress"
+    __table_args__ = (
+        Index("ix_monthly_progress_project_id_year_month", "project_id", "year_month"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
-    year_month = Column(String(7), nullable=False)  # YYYY-MM
+    year_month = Column(String(7), nullable=False, index=True)  # YYYY-MM
     progress_amount = Column(Integer, default=0)  # 出来高金額
     progress_rate = Column(Float, default=0)  # 出来高率（%）
     cost_amount = Column(Integer, default=0)  # 原価金額
@@ -278,13 +302,13 @@ class Receivable(Base):
     """入金予定（売掛金）"""
     __tablename__ = "receivables"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
-    progress_id = Column(Integer, ForeignKey("monthly_progress.id"))  # 関連する出来高
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
+    progress_id = Column(Integer, ForeignKey("monthly_progress.id"), index=True)  # 関連する出来高
     client_name = Column(String, nullable=False)  # 元請け名
     description = Column(String)  # 内容
     amount = Column(Integer, default=0)  # 入金予定額
     billing_date = Column(Date)  # 請求日
-    expected_date = Column(Date, nullable=False)  # 入金予定日
+    expected_date = Column(Date, nullable=False, index=True)  # 入金予定日
     actual_date = Column(Date)  # 実際の入金日
     status = Column(String, default="予定")  # 予定/請求済/入金済
     note = Column(Text)
@@ -296,14 +320,14 @@ class Payable(Base):
     """支払予定（買掛金）"""
     __tablename__ = "payables"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))  # 関連工事（任意）
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)  # 関連工事（任意）
     cost_id = Column(Integer, ForeignKey("costs.id"))  # 関連する原価
     vendor_name = Column(String, nullable=False)  # 業者名
     category = Column(String)  # 外注費/材料費/機械費/経費
     description = Column(String)  # 内容
     amount = Column(Integer, default=0)  # 支払予定額
     invoice_date = Column(Date)  # 請求書日付
-    expected_date = Column(Date, nullable=False)  # 支払予定日
+    expected_date = Column(Date, nullable=False, index=True)  # 支払予定日
     actual_date = Column(Date)  # 実際の支払日
     status = Column(String, default="予定")  # 予定/支払済
     note = Column(Text)
@@ -319,7 +343,7 @@ class Estimate(Base):
     """見積明細"""
     __tablename__ = "estimates"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
     work_type = Column(String)  # 工種
     description = Column(String)  # 明細
     quantity = Column(Float, default=0)  # 数量
@@ -335,7 +359,7 @@ class Budget(Base):
     """予算明細（案件別）"""
     __tablename__ = "budgets"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
     work_type = Column(String)  # 工種
     category = Column(String)  # カテゴリ（労務費/材料費/外注費/経費）
     vendor = Column(String)  # 業者名
@@ -355,6 +379,9 @@ class Budget(Base):
 class Approval(Base):
     """承認ワークフロー"""
     __tablename__ = "approvals"
+    __table_args__ = (
+        Index("ix_approvals_status_requested_at", "status", "requested_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     type = Column(String)  # expense/invoice/leave
     reference_id = Column(Integer)  # 参照先ID
@@ -369,13 +396,16 @@ class Approval(Base):
 class Notification(Base):
     """通知"""
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_id_is_read", "user_id", "is_read"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String)
     type = Column(String)  # approval/alert/info
     title = Column(String)
     message = Column(Text)
     link = Column(String)
-    is_read = Column(Boolean, default=False)
+    is_read = Column(Boolean, default=False, index=True)
     created_at = Column(DateTime, server_default=func.now())
 
 
@@ -400,8 +430,8 @@ class Assignment(Base):
     """作業員配置"""
     __tablename__ = "assignments"
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(Date, nullable=False)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    date = Column(Date, nullable=False, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     worker_id = Column(Integer, ForeignKey("workers.id"))
     start_time = Column(String)
     end_time = Column(String)
@@ -417,7 +447,7 @@ class KYReport(Base):
     """KYレポート"""
     __tablename__ = "ky_reports"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     date = Column(Date, nullable=False)
     work_content = Column(Text)
     hazards = Column(Text)  # JSON配列
@@ -458,7 +488,7 @@ class InventoryTransaction(Base):
     """在庫入出庫"""
     __tablename__ = "inventory_transactions"
     id = Column(Integer, primary_key=True, index=True)
-    item_id = Column(Integer, ForeignKey("inventory_items.id"))
+    item_id = Column(Integer, ForeignKey("inventory_items.id"), index=True)
     type = Column(String)  # in/out
     quantity = Column(Float)
     project_id = Column(Integer, ForeignKey("projects.id"))
@@ -505,7 +535,7 @@ class Schedule(Base):
     """工程スケジュール"""
     __tablename__ = "schedules"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     start_date = Column(Date)
     end_date = Column(Date)
     progress_rate = Column(Float, default=0)
@@ -516,9 +546,12 @@ class Schedule(Base):
 class Attendance(Base):
     """勤怠"""
     __tablename__ = "attendances"
+    __table_args__ = (
+        Index("ix_attendances_worker_id_date", "worker_id", "date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     worker_id = Column(Integer, ForeignKey("workers.id"))
-    date = Column(Date)
+    date = Column(Date, index=True)
     check_in = Column(DateTime)
     check_out = Column(DateTime)
     project_id = Column(Integer, ForeignKey("projects.id"))
@@ -616,7 +649,7 @@ class Drawing(Base):
     """図面"""
     __tablename__ = "drawings"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     name = Column(String, nullable=False)
     version = Column(Integer, default=1)
     file_path = Column(String)
@@ -630,7 +663,7 @@ class DrawingPin(Base):
     """図面ピン（指示・写真紐付け）"""
     __tablename__ = "drawing_pins"
     id = Column(Integer, primary_key=True, index=True)
-    drawing_id = Column(Integer, ForeignKey("drawings.id"))
+    drawing_id = Column(Integer, ForeignKey("drawings.id"), index=True)
     x = Column(Float)  # X座標(%)
     y = Column(Float)  # Y座標(%)
     pin_type = Column(String)  # instruction/photo/issue
@@ -648,7 +681,7 @@ class SitePhoto(Base):
     """工事写真"""
     __tablename__ = "site_photos"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     category = Column(String)  # 着工前/施工中/完成
     work_type = Column(String)
     photo_path = Column(String)
@@ -694,7 +727,7 @@ class InspectionItem(Base):
     """検査項目"""
     __tablename__ = "inspection_items"
     id = Column(Integer, primary_key=True, index=True)
-    inspection_id = Column(Integer, ForeignKey("inspections.id"))
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), index=True)
     item_name = Column(String)
     standard = Column(String)
     result = Column(String)  # OK/NG/NA
@@ -706,7 +739,7 @@ class Correction(Base):
     """是正指示"""
     __tablename__ = "corrections"
     id = Column(Integer, primary_key=True, index=True)
-    inspection_id = Column(Integer, ForeignKey("inspections.id"))
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), index=True)
     inspection_item_id = Column(Integer)
     description = Column(Text)
     photo_before = Column(Integer)  # 是正前写真ID
@@ -726,13 +759,13 @@ class WorkerRegistration(Base):
     """作業員登録（安全書類用）"""
     __tablename__ = "worker_registrations"
     id = Column(Integer, primary_key=True, index=True)
-    worker_id = Column(Integer, ForeignKey("workers.id"))
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    worker_id = Column(Integer, ForeignKey("workers.id"), index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     blood_type = Column(String)
     emergency_contact = Column(String)
     emergency_phone = Column(String)
     qualifications = Column(Text)  # JSON配列
-    health_check_date = Column(Date)
+    health_check_date = Column(Date, index=True)
     insurance_number = Column(String)
     registered_at = Column(DateTime, server_default=func.now())
 
@@ -741,7 +774,7 @@ class SafetyTraining(Base):
     """安全教育記録"""
     __tablename__ = "safety_trainings"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     worker_id = Column(Integer, ForeignKey("workers.id"))
     training_date = Column(Date)
     training_type = Column(String)  # 新規入場者教育/送り出し教育
@@ -754,7 +787,7 @@ class Qualification(Base):
     """資格証"""
     __tablename__ = "qualifications"
     id = Column(Integer, primary_key=True, index=True)
-    worker_id = Column(Integer, ForeignKey("workers.id"))
+    worker_id = Column(Integer, ForeignKey("workers.id"), index=True)
     name = Column(String, nullable=False)
     number = Column(String)
     issue_date = Column(Date)
@@ -770,6 +803,9 @@ class Qualification(Base):
 class Message(Base):
     """メッセージ"""
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_project_id_sent_at", "project_id", "sent_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
     sender_id = Column(String)
@@ -778,14 +814,14 @@ class Message(Base):
     attachment_path = Column(String)
     attachment_type = Column(String)  # image/file
     sent_at = Column(DateTime, server_default=func.now())
-    is_read = Column(Boolean, default=False)
+    is_read = Column(Boolean, default=False, index=True)
 
 
 class MessageRead(Base):
     """既読管理"""
     __tablename__ = "message_reads"
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"))
+    message_id = Column(Integer, ForeignKey("messages.id"), index=True)
     user_id = Column(String)
     read_at = Column(DateTime, server_default=func.now())
 
@@ -841,10 +877,13 @@ class IntegrationSetting(Base):
 class DailyReport(Base):
     """日報"""
     __tablename__ = "daily_reports"
+    __table_args__ = (
+        Index("ix_daily_reports_date_worker_id", "date", "worker_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
     worker_id = Column(Integer, ForeignKey("workers.id"))
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     hours = Column(Float, default=8)  # 作業時間
     overtime_hours = Column(Float, default=0)  # 残業時間
     note = Column(Text)
@@ -914,7 +953,7 @@ class LineWorksUser(Base):
     """LINE WORKSユーザー紐付け"""
     __tablename__ = "lineworks_users"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     lineworks_user_id = Column(String)
     is_active = Column(Boolean, default=True)
 
@@ -992,6 +1031,9 @@ class QuoteDocument(Base):
 class QuoteItem(Base):
     """見積書明細"""
     __tablename__ = "quote_items"
+    __table_args__ = (
+        Index("ix_quote_items_quote_id_seq", "quote_id", "seq"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     quote_id = Column(Integer, ForeignKey("quote_documents.id"), nullable=False)
     seq = Column(Integer, default=0)  # 表示順
@@ -1037,3 +1079,46 @@ class HotelRequest(Base):
     requested_by = Column(String)  # 依頼者
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class WeatherForecastCache(Base):
+    """天気予報キャッシュ（緯度経度をメッシュに丸めた単位で保持）"""
+    __tablename__ = "weather_forecast_cache"
+    id = Column(Integer, primary_key=True, index=True)
+    cell = Column(String, nullable=False, unique=True)  # 丸めた "緯度,経度"
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    forecasts = Column(Text, nullable=False)  # Open-Meteo の daily（列ごとの配列、JSON）
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class GeocodeCache(Base):
+    """住所→緯度経度のキャッシュ（正規化した住所単位）"""
+    __tablename__ = "geocode_cache"
+    id = Column(Integer, primary_key=True, index=True)
+    address_key = Column(String, nullable=False, unique=True)  # 正規化した住所
+    found = Column(Boolean, default=True)  # 見つからなかった住所も一定期間記録
+    latitude = Column(Float)
+    longitude = Column(Float)
+    title = Column(String)  # 国土地理院の住所表記
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class ImportJob(Base):
+    """Excel取込ジョブ（アップロード後にバックグラウンドで解析・登録）"""
+    __tablename__ = "import_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # budget / project / estimate
+    filename = Column(String)
+    params = Column(Text)  # 取込条件（JSON）
+    status = Column(String, default="queued", index=True)  # queued/parsing/saving/succeeded/failed
+    sheets_total = Column(Integer, default=0)
+    sheets_done = Column(Integer, default=0)
+    rows_read = Column(Integer, default=0)  # 読み込んだ行数
+    rows_imported = Column(Integer, default=0)  # 登録した明細数
+    errors = Column(Text)  # 読み取れなかったシート・行（JSON配列）
+    result = Column(Text)  # 登録結果（JSON）
+    message = Column(Text)  # 失敗時のエラー内容
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
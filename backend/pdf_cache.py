@@ -0,0 +1,91 @@
+"""
+PDFの保存キャッシュ（内容アドレス方式）
+
+帳票の種類・テンプレートの版・元データの更新日時からキーを作り、
+PDF_CACHE_DIR/<キー先頭2文字>/<キー>.pdf に保存する。元データが更新されるとキーが変わるので
+同じ帳票の再ダウンロード・再送信では描画せずにファイルを返す。
+キーが変わった古いファイルは使われなくなるため、PDF_CACHE_MAX_AGE_DAYS 日使われていないものを
+起動時に prune() で消す（使うたびに更新日時を進める）。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "./pdf_cache")
+# この日数使われていないPDFを削除する（0で削除しない）
+PDF_CACHE_MAX_AGE_DAYS = float(os.getenv("PDF_CACHE_MAX_AGE_DAYS", "30"))
+
+
+def cache_key(*parts) -> str:
+    """キーの元になる値（日時などは文字列化）から sha256 を作る"""
+    text = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def path_for(key: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, key[:2], f"{key}.pdf")
+
+
+def get(key: str):
+    """保存済みのPDF（なければ None）"""
+    path = path_for(key)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        # 最後に使った日時として残す（prune の判定に使う）
+        os.utime(path)
+    except OSError:
+        pass
+    return content
+
+
+def put(key: str, content: bytes):
+    """一時ファイルに書いてから置き換える（書き込み途中のファイルを読ませない）"""
+    path = path_for(key)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(content)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_or_render(key: str, render, *args) -> bytes:
+    """保存済みならそれを返し、なければ render(*args) で作って保存する"""
+    content = get(key)
+    if content is None:
+        content = render(*args)
+        try:
+            put(key, content)
+        except OSError as e:
+            print(f"PDFキャッシュの保存に失敗しました: {e}")
+    return content
+
+
+def prune(max_age_days: float = None) -> int:
+    """最後に使ってから max_age_days 日を過ぎたPDF（と書き込み途中で残った一時ファイル）を消し、件数を返す"""
+    max_age_days = PDF_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if max_age_days <= 0 or not os.path.isdir(PDF_CACHE_DIR):
+        return 0
+    threshold = time.time() - max_age_days * 86400
+    removed = 0
+    for directory, _, files in os.walk(PDF_CACHE_DIR):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < threshold:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                # 他のプロセスが同時に消した・使った場合など
+                continue
+    return removed
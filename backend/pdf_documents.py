@@ -0,0 +1,215 @@
+"""
+帳票PDFの作成（reportlab使用）
+
+見積明細・見積書・工事台帳をA4縦のPDFにする。日本語はフォントファイル不要の
+CIDフォント（HeiseiKakuGo-W5）で描画する。各関数はDBに触れず、画面用のAPIと同じ形の
+dict を受け取ってPDFのバイト列を返す（スレッドプールで実行する想定）。
+"""
+from io import BytesIO
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# レイアウトを変えたら上げる（キャッシュのキーに含める）
+TEMPLATE_VERSION = 1
+
+FONT = "HeiseiKakuGo-W5"
+CONTENT_TYPE = "application/pdf"
+
+_font_registered = False
+
+
+def _register_font():
+    global _font_registered
+    if not _font_registered:
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+        _font_registered = True
+
+
+TITLE = ParagraphStyle("title", fontName=FONT, fontSize=20, leading=26, alignment=1, spaceAfter=6 * mm)
+NORMAL = ParagraphStyle("normal", fontName=FONT, fontSize=9, leading=13)
+RIGHT = ParagraphStyle("right", parent=NORMAL, alignment=2)
+CLIENT = ParagraphStyle("client", fontName=FONT, fontSize=14, leading=20)
+HEADING = ParagraphStyle("heading", fontName=FONT, fontSize=11, leading=16, spaceBefore=5 * mm, spaceAfter=2 * mm)
+
+GRID = [
+    ("FONTNAME", (0, 0), (-1, -1), FONT),
+    ("FONTSIZE", (0, 0), (-1, -1), 9),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+]
+HEADER_ROW = [
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#D9E1F2")),
+    ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+]
+
+
+def _para(text, style=NORMAL) -> Paragraph:
+    """文字列をそのまま表示する Paragraph（& < > をエスケープ）"""
+    return Paragraph(escape(str(text or "")), style)
+
+
+def yen(value) -> str:
+    return f"¥{int(round(value or 0)):,}"
+
+
+def number(value) -> str:
+    if value is None:
+        return ""
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def _build(title: str, story: list) -> bytes:
+    output = BytesIO()
+    doc = SimpleDocTemplate(
+        output, pagesize=A4, title=title,
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+    )
+    doc.build(story)
+    return output.getvalue()
+
+
+def _company_block(company: dict) -> list:
+    lines = [company.get("name") or ""]
+    if company.get("postal_code") or company.get("address"):
+        lines.append(" ".join(filter(None, [company.get("postal_code"), company.get("address")])))
+    if company.get("phone"):
+        lines.append(f"TEL {company['phone']}" + (f"  FAX {company['fax']}" if company.get("fax") else ""))
+    if company.get("invoice_number"):
+        lines.append(f"登録番号 {company['invoice_number']}")
+    return [_para(line, RIGHT) for line in lines]
+
+
+def _header(title: str, client: str, company: dict, meta: list) -> list:
+    """表題・宛先・発行元・番号などの見出し部分"""
+    left = [_para(f"{client or ''} 御中", CLIENT)]
+    right = [_para(f"{label}: {value}", RIGHT) for label, value in meta if value] + _company_block(company)
+    table = Table([[left, right]], colWidths=[95 * mm, 85 * mm])
+    table.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    return [Paragraph(title, TITLE), table, Spacer(1, 6 * mm)]
+
+
+def _items_table(rows: list, total_rows: list) -> Table:
+    """明細表（rows は [品名, 規格, 数量, 単位, 単価, 金額]）"""
+    header = ["品名・工種", "規格・仕様", "数量", "単位", "単価", "金額"]
+    body = [
+        [_para(name), _para(spec), number(qty), unit or "", yen(price), yen(amount)]
+        for name, spec, qty, unit, price, amount in rows
+    ]
+    footer = [["", "", "", "", label, yen(value)] for label, value in total_rows]
+    table = Table([header] + body + footer, colWidths=[50 * mm, 45 * mm, 18 * mm, 14 * mm, 25 * mm, 28 * mm],
+                  repeatRows=1)
+    style = GRID + HEADER_ROW + [
+        ("ALIGN", (2, 1), (2, -1), "RIGHT"),
+        ("ALIGN", (3, 1), (3, -1), "CENTER"),
+        ("ALIGN", (4, 1), (5, -1), "RIGHT"),
+    ]
+    if footer:
+        style.append(("SPAN", (0, -len(footer)), (3, -1)))
+        style.append(("BACKGROUND", (4, -len(footer)), (4, -1), colors.HexColor("#F2F2F2")))
+    table.setStyle(TableStyle(style))
+    return table
+
+
+def _total_banner(label: str, amount) -> Table:
+    table = Table([[label, yen(amount)]], colWidths=[40 * mm, 60 * mm], hAlign="LEFT")
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, -1), FONT),
+        ("FONTSIZE", (0, 0), (-1, -1), 14),
+        ("LINEBELOW", (0, 0), (-1, 0), 1, colors.black),
+        ("ALIGN", (1, 0), (1, 0), "RIGHT"),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    ]))
+    return table
+
+
+def estimate_pdf(data: dict) -> bytes:
+    """見積明細1件の見積書（generate_estimate_pdf の JSON と同じ形）"""
+    _register_font()
+    project = data.get("project") or {}
+    estimate = data["estimate"]
+    story = _header("御 見 積 書", project.get("client"), data["company"], [
+        ("工事名", project.get("name")),
+        ("作成日", data.get("date")),
+    ])
+    story.append(_total_banner("御見積金額", estimate.get("amount")))
+    story.append(Spacer(1, 6 * mm))
+    story.append(_items_table(
+        [(estimate.get("work_type"), estimate.get("description"), estimate.get("quantity"),
+          estimate.get("unit"), estimate.get("unit_price"), estimate.get("amount"))],
+        [("合計", estimate.get("amount"))],
+    ))
+    return _build("見積書", story)
+
+
+def quote_pdf(data: dict) -> bytes:
+    """見積書（serialize_quote の明細付きの形 + company）"""
+    _register_font()
+    story = _header("御 見 積 書", data.get("client_name"), data["company"], [
+        ("見積番号", data.get("quote_no")),
+        ("発行日", data.get("issue_date")),
+        ("有効期限", data.get("valid_until")),
+    ])
+    story.append(_para(f"件名: {data.get('title') or ''}", CLIENT))
+    story.append(Spacer(1, 3 * mm))
+    story.append(_total_banner("御見積金額（税込）", data.get("total")))
+    story.append(Spacer(1, 6 * mm))
+    story.append(_items_table(
+        [(i["name"], i["specification"], i["quantity"], i["unit"], i["unit_price"], i["amount"])
+         for i in data.get("items", [])],
+        [("小計", data.get("subtotal")), ("消費税", data.get("tax_amount")), ("合計", data.get("total"))],
+    ))
+    if data.get("notes"):
+        story.append(Paragraph("備考", HEADING))
+        story.append(Paragraph(escape(data["notes"]).replace("\n", "<br/>"), NORMAL))
+    return _build("見積書", story)
+
+
+def _summary_table(rows: list) -> Table:
+    table = Table(rows, colWidths=[60 * mm, 50 * mm], hAlign="LEFT")
+    table.setStyle(TableStyle(GRID + [
+        ("BACKGROUND", (0, 0), (0, -1), colors.HexColor("#F2F2F2")),
+        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+    ]))
+    return table
+
+
+def ledger_pdf(data: dict) -> bytes:
+    """工事台帳（get_project_ledger の JSON と同じ形）"""
+    _register_font()
+    project, costs, billing, profit = data["project"], data["costs"], data["billing"], data["profit"]
+    story = [Paragraph("工 事 台 帳", TITLE)]
+    story.append(_summary_table([
+        ["工事番号", project.get("code") or ""],
+        ["工事名", _para(project.get("name"))],
+        ["発注者", _para(project.get("client"))],
+        ["受注金額（税抜）", yen(project.get("order_amount"))],
+        ["受注金額（税込）", yen(project.get("order_amount_with_tax"))],
+        ["実行予算", yen(project.get("budget_amount"))],
+    ]))
+
+    story.append(Paragraph("原価", HEADING))
+    categories = [k for k in costs if k not in ("labor_from_reports", "total")]
+    story.append(_summary_table(
+        [[k, yen(costs[k])] for k in categories]
+        + [["（参考）日報からの労務費", yen(costs.get("labor_from_reports"))], ["原価合計", yen(costs.get("total"))]]
+    ))
+
+    story.append(Paragraph("請求・出来高", HEADING))
+    story.append(_summary_table([
+        ["請求累計", yen(billing.get("total_billed"))],
+        ["出来高累計", yen(billing.get("total_progress"))],
+        ["出来高率", f"{profit.get('progress_rate', 0)}%"],
+    ]))
+
+    story.append(Paragraph("粗利", HEADING))
+    story.append(_summary_table([
+        ["粗利", yen(profit.get("gross_profit"))],
+        ["粗利率", f"{profit.get('gross_profit_rate', 0)}%"],
+    ]))
+    return _build("工事台帳", story)
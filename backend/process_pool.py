@@ -0,0 +1,54 @@
+"""
+CPU負荷の高い処理（Excelの解析・作成）を実行する共有プロセスプール
+
+サーバーのスレッドやDB接続を子プロセスに引き継がないよう spawn で起動する。
+プールは最初に使われたときに作成し、アプリ終了時に lifespan から shutdown() を呼ぶ。
+子プロセスが異常終了（メモリ不足・kill）するとプールは以後使えなくなるため、
+submit はプールを作り直して1回だけやり直す。
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 2))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def _discard(executor: ProcessPoolExecutor):
+    """壊れたプールを捨てる（同時に気づいた他の呼び出しが作り直したプールは残す）"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def submit(fn, *args):
+    """プロセスプールで fn(*args) を実行して結果を返す"""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        print("プロセスプールの子プロセスが異常終了したため、プールを作り直して再実行します")
+        _discard(executor)
+        return await loop.run_in_executor(get_executor(), fn, *args)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+主要クエリの実行計画チェック（SQLite）
+
+API で頻繁に使う絞り込みクエリに EXPLAIN QUERY PLAN をかけ、
+インデックスを使わない全件スキャン（SCAN <table>）になっていないか確認する。
+インデックスの付け忘れ・マイグレーション未適用の検出用。
+
+    python query_plans.py                 # 現在のDBで確認（全件スキャンがあれば終了コード1）
+    python query_plans.py --fresh         # models.py + マイグレーションから作った空のDBで確認
+"""
+import sys
+from datetime import date
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.exc import OperationalError
+from models import (
+    Cost, ProjectCostRollup, MonthlyProgress, Receivable, Payable, Assignment,
+    Attendance, DailyReport, Message, Notification, Approval, Expense,
+    ProjectWorkType, WorkTypeDetail, QuoteItem, Schedule, WorkerRegistration
+)
+
+_D1 = date(2024, 1, 1)
+_D2 = date(2024, 12, 31)
+
+# (名前, SELECT) - 対応するAPIの絞り込み条件と同じ形にしておく
+HOT_QUERIES = [
+    ("工事別原価（日付順）", select(Cost).where(Cost.project_id == 1).order_by(Cost.date.desc())),
+    ("期間指定の原価", select(Cost).where(Cost.date >= _D1, Cost.date <= _D2)),
+    ("工事別原価集計", select(func.sum(ProjectCostRollup.amount)).where(ProjectCostRollup.project_id == 1)),
+    ("工事別出来高", select(MonthlyProgress).where(
+        MonthlyProgress.project_id == 1, MonthlyProgress.year_month == "2024-01")),
+    ("月別出来高", select(MonthlyProgress).where(MonthlyProgress.year_month == "2024-01")),
+    ("入金予定（期間）", select(Receivable).where(
+        Receivable.expected_date >= _D1, Receivable.expected_date <= _D2)),
+    ("出来高別入金", select(Receivable).where(Receivable.progress_id == 1)),
+    ("支払予定（期間）", select(Payable).where(
+        Payable.expected_date >= _D1, Payable.expected_date <= _D2)),
+    ("日別配置", select(Assignment).where(Assignment.date == _D1)),
+    ("作業員の出勤", select(Attendance).where(Attendance.worker_id == 1, Attendance.date == _D1)),
+    ("期間の出勤", select(Attendance).where(Attendance.date >= _D1, Attendance.date <= _D2)),
+    ("工事別日報", select(DailyReport).where(DailyReport.project_id == 1)),
+    ("日付・作業員別日報", select(DailyReport).where(
+        DailyReport.date == _D1, DailyReport.worker_id == 1)),
+    ("工事別メッセージ", select(Message).where(Message.project_id == 1).order_by(Message.sent_at)),
+    ("未読メッセージ数", select(func.count(Message.id)).where(Message.is_read == False)),
+    ("ユーザーの未読通知", select(func.count(Notification.id)).where(
+        Notification.user_id == 1, Notification.is_read == False)),
+    ("未読通知数", select(func.count(Notification.id)).where(Notification.is_read == False)),
+    ("承認待ち", select(Approval).where(Approval.status == "pending").order_by(Approval.requested_at.desc())),
+    ("工事別経費", select(Expense).where(Expense.project_id == 1)),
+    ("経費の承認状態", select(Expense).where(Expense.status == "pending")),
+    ("案件工種", select(ProjectWorkType).where(ProjectWorkType.project_id == 1).order_by(ProjectWorkType.seq)),
+    ("工種明細", select(WorkTypeDetail).where(WorkTypeDetail.work_type_id == 1).order_by(WorkTypeDetail.seq)),
+    ("見積明細", select(QuoteItem).where(QuoteItem.quote_id == 1).order_by(QuoteItem.seq)),
+    ("工事別工程", select(Schedule).where(Schedule.project_id == 1)),
+    ("健康診断期限", select(WorkerRegistration).where(WorkerRegistration.health_check_date < _D1)),
+]
+
+
+def explain(conn, stmt) -> list:
+    """EXPLAIN QUERY PLAN の detail 列を返す"""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(details: list) -> list:
+    """インデックスを使わないテーブル全件スキャンを抽出（SCAN ... USING INDEX は対象外）"""
+    return [d for d in details if d.startswith("SCAN ") and "USING" not in d]
+
+
+def check(engine) -> list:
+    """各クエリの結果を [{name, plan, full_scans}] で返す（実行できないクエリも full_scans に入れる）"""
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("実行計画チェックは SQLite のみ対応しています")
+    results = []
+    with engine.connect() as conn:
+        for name, stmt in HOT_QUERIES:
+            try:
+                details = explain(conn, stmt)
+                scans = full_scans(details)
+            except OperationalError as e:
+                # テーブル未作成など
+                details = [f"エラー: {e.orig}"]
+                scans = details
+            results.append({"name": name, "plan": details, "full_scans": scans})
+    return results
+
+
+if __name__ == "__main__":
+    from database import Base
+    import migrations
+
+    if "--fresh" in sys.argv:
+        target = create_engine("sqlite://")
+        Base.metadata.create_all(bind=target)
+        migrations.upgrade(target)
+    else:
+        from database import engine as target
+
+    results = check(target)
+    failed = [r for r in results if r["full_scans"]]
+    for r in results:
+        mark = "NG" if r["full_scans"] else "OK"
+        print(f"[{mark}] {r['name']}: {' / '.join(r['plan'])}")
+    if failed:
+        print(f"全件スキャンのクエリが {len(failed)}件 あります（python migrations.py upgrade を確認）")
+        sys.exit(1)
+    print("すべてのクエリでインデックスが使われています")
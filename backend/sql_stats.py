@@ -0,0 +1,209 @@
+"""
+SQL実行状況の計測（リクエスト単位）
+
+SQL_STATS=1 で有効にすると、SQLAlchemy のイベントでリクエストごとに
+文の数・DB時間・取得行数・同じ形（パラメータ違い）の文の繰り返しを記録し、ルート別に集計する。
+同じ形の SELECT が N_PLUS_ONE_THRESHOLD 回以上あれば N+1 の疑いとして記録する。
+
+- SQL_STATS_HEADER=1 でレスポンスの X-SQL-Stats ヘッダーにも出す（開発用）。
+  ヘッダーは本文より先に送るため、本文を分割して送るレスポンス（StreamingResponse のCSV・zip出力など）
+  には付けない。それらの値は集計の方で確認する
+- 集計は GET /api/debug/sql-stats で確認、DELETE でリセット（ワーカープロセスごとの値）
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+ENABLED = os.getenv("SQL_STATS", "0") == "1"
+HEADER_ENABLED = os.getenv("SQL_STATS_HEADER", "0") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 3))
+
+# ルートごとに保持する N+1 の文の数
+MAX_SHAPES_PER_ROUTE = 5
+
+_current = ContextVar("sql_stats", default=None)
+
+
+class RequestStats:
+    """1リクエスト分の記録"""
+    __slots__ = ("statements", "db_time", "rows", "shapes")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.shapes = Counter()
+
+    def n_plus_one(self) -> list:
+        """同じ形の SELECT が閾値以上繰り返された文 [(文, 回数)]"""
+        return [
+            (shape, count) for shape, count in self.shapes.most_common()
+            if count >= N_PLUS_ONE_THRESHOLD and shape.startswith("SELECT")
+        ]
+
+    def header(self) -> str:
+        return (
+            f"statements={self.statements}; db_ms={self.db_time * 1000:.1f}; "
+            f"rows={self.rows}; n_plus_one={len(self.n_plus_one())}"
+        )
+
+
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%s|\$\d+)\s*,)+\s*(?:\?|%s|\$\d+)\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def shape_of(statement: str) -> str:
+    """文の形（IN (?, ?, ...) の個数と空白の違いをまとめる）"""
+    return _IN_LIST.sub("(?...)", _SPACES.sub(" ", statement).strip())
+
+
+# ---------- SQLAlchemy イベント ----------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("sql_stats_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("sql_stats_start")
+    if stats is None or not starts:
+        return
+    stats.db_time += time.perf_counter() - starts.pop()
+    stats.statements += 1
+    stats.shapes[shape_of(statement)] += 1
+
+
+def _count_rows(orm_execute_state):
+    """SELECT の結果をいったん取り出して行数を数える（yield_per などの逐次取得は対象外）"""
+    stats = _current.get()
+    if stats is None or not orm_execute_state.is_select:
+        return None
+    options = orm_execute_state.execution_options
+    if options.get("yield_per") or options.get("stream_results"):
+        return None
+    frozen = orm_execute_state.invoke_statement().freeze()
+    stats.rows += len(frozen.data)
+    return frozen()
+
+
+def instrument(*engines):
+    """計測するエンジンにイベントを登録（AsyncEngine は sync_engine を渡す）"""
+    for db_engine in engines:
+        event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Session, "do_orm_execute", _count_rows)
+
+
+# ---------- ルート別の集計 ----------
+
+_routes = {}
+_lock = threading.Lock()
+
+
+def _record(route: str, stats: RequestStats):
+    suspects = stats.n_plus_one()
+    with _lock:
+        entry = _routes.get(route)
+        if entry is None:
+            entry = _routes[route] = {
+                "requests": 0, "statements": 0, "max_statements": 0,
+                "db_time": 0.0, "rows": 0, "n_plus_one_requests": 0, "n_plus_one": {},
+            }
+        entry["requests"] += 1
+        entry["statements"] += stats.statements
+        entry["max_statements"] = max(entry["max_statements"], stats.statements)
+        entry["db_time"] += stats.db_time
+        entry["rows"] += stats.rows
+        if suspects:
+            entry["n_plus_one_requests"] += 1
+        for shape, count in suspects:
+            if shape not in entry["n_plus_one"]:
+                if len(entry["n_plus_one"]) >= MAX_SHAPES_PER_ROUTE:
+                    continue
+                print(f"N+1の可能性があります: {route} で同じSELECTが{count}回: {shape[:200]}")
+            entry["n_plus_one"][shape] = max(entry["n_plus_one"].get(shape, 0), count)
+
+
+def snapshot() -> list:
+    """ルート別の集計（DB時間の長い順）"""
+    with _lock:
+        routes = [(route, dict(entry, n_plus_one=dict(entry["n_plus_one"]))) for route, entry in _routes.items()]
+    result = []
+    for route, entry in routes:
+        requests = entry["requests"]
+        result.append({
+            "route": route,
+            "requests": requests,
+            "avg_statements": round(entry["statements"] / requests, 1),
+            "max_statements": entry["max_statements"],
+            "avg_db_ms": round(entry["db_time"] * 1000 / requests, 2),
+            "total_db_ms": round(entry["db_time"] * 1000, 1),
+            "avg_rows": round(entry["rows"] / requests, 1),
+            "n_plus_one_requests": entry["n_plus_one_requests"],
+            "n_plus_one": [
+                {"statement": shape, "max_repeats": count}
+                for shape, count in sorted(entry["n_plus_one"].items(), key=lambda x: -x[1])
+            ],
+        })
+    result.sort(key=lambda r: -r["total_db_ms"])
+    return result
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+# ---------- ミドルウェア ----------
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "(unmatched)"
+    return f"{scope.get('method', '')} {path}"
+
+
+class SQLStatsMiddleware:
+    """リクエストごとに RequestStats を用意し、終了時にルート別に集計する（ASGI）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        start = None
+
+        async def send_with_header(message):
+            # 開始メッセージは最初の本文まで保留し、本文が1回で終わる（SQLが実行済み）ときだけヘッダーを付ける
+            nonlocal start
+            if not HEADER_ENABLED:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+            elif start is not None:
+                if not message.get("more_body", False):
+                    headers = list(start.get("headers", []))
+                    headers.append((b"x-sql-stats", stats.header().encode("latin-1")))
+                    start = {**start, "headers": headers}
+                await send(start)
+                start = None
+                await send(message)
+            else:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _current.reset(token)
+            _record(_route_of(scope), stats)
@@ -0,0 +1,25 @@
+"""
+テスト共通の準備（backend を import できるようにし、一時DBを用意する）
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main を読み込むとテーブル作成などが走るため、手元の DB ではなくメモリ上の DB にする
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from database import Base, _set_sqlite_pragmas  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """全テーブルを作成した一時 SQLite のセッション（本番と同じ PRAGMA）"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
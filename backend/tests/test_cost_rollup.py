@@ -0,0 +1,71 @@
+"""
+原価集計（cost_rollup）のテスト
+
+main の create_cost / delete_cost と同じ手順で原価を登録・削除し、
+集計テーブルが costs から集計し直した値と一致する（verify が空）ことを確認する。
+"""
+from datetime import date
+
+import cost_rollup
+from models import Cost, ProjectCostRollup
+
+
+def add_cost(db, **values):
+    cost = Cost(**values)
+    db.add(cost)
+    cost_rollup.apply_cost(db, cost)
+    db.commit()
+    return cost
+
+
+def delete_cost(db, cost):
+    cost_rollup.apply_cost(db, cost, sign=-1)
+    db.delete(cost)
+    db.commit()
+
+
+def rollups(db) -> dict:
+    return {
+        (r.project_id, r.category, r.year_month): (r.amount, r.cost_count)
+        for r in db.query(ProjectCostRollup).all()
+    }
+
+
+def test_create_and_delete_keep_rollup_in_sync(session_factory):
+    with session_factory() as db:
+        a = add_cost(db, project_id=1, date=date(2025, 4, 1), category="材料費", amount=1000)
+        b = add_cost(db, project_id=1, date=date(2025, 4, 20), category="材料費", amount=2500)
+        c = add_cost(db, project_id=1, date=date(2025, 5, 1), category="外注費", amount=700)
+        add_cost(db, project_id=2, date=date(2025, 4, 1), category="材料費", amount=300)
+        assert cost_rollup.verify(db) == []
+        assert rollups(db)[(1, "材料費", "2025-04")] == (3500, 2)
+
+        delete_cost(db, a)
+        assert cost_rollup.verify(db) == []
+        assert rollups(db)[(1, "材料費", "2025-04")] == (2500, 1)
+
+        # 0件になった行は削除される
+        delete_cost(db, b)
+        delete_cost(db, c)
+        assert cost_rollup.verify(db) == []
+        assert set(rollups(db)) == {(2, "材料費", "2025-04")}
+
+
+def test_add_to_row_created_by_another_session(session_factory):
+    """別のセッションが先に同じキーの行を作っていても一意制約違反にならず加算される"""
+    with session_factory() as first, session_factory() as second:
+        add_cost(first, project_id=1, date=date(2025, 4, 1), category="材料費", amount=1000)
+        add_cost(second, project_id=1, date=date(2025, 4, 2), category="材料費", amount=500)
+
+    with session_factory() as db:
+        assert rollups(db) == {(1, "材料費", "2025-04"): (1500, 2)}
+        assert cost_rollup.verify(db) == []
+
+
+def test_rebuild_matches_incremental(session_factory):
+    with session_factory() as db:
+        for day in range(1, 6):
+            add_cost(db, project_id=day % 2, date=date(2025, 3, day), category="労務費", amount=100 * day)
+        before = rollups(db)
+        assert cost_rollup.rebuild(db) == len(before)
+        assert rollups(db) == before
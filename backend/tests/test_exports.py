@@ -0,0 +1,43 @@
+"""
+原価CSV出力（exports.stream_costs_csv）のテスト
+"""
+import csv
+from datetime import date
+from io import StringIO
+
+import pytest
+
+import exports
+from models import Cost
+
+
+@pytest.fixture
+def costs_db(session_factory, monkeypatch):
+    """原価7件を入れた一時DBを exports の専用セッションにする"""
+    with session_factory() as db:
+        for day in range(1, 8):
+            db.add(Cost(project_id=1, date=date(2025, 4, day), category="材料費",
+                        vendor="福岡建材", description=f"アスファルト{day}", amount=1000 * day))
+        db.commit()
+    monkeypatch.setattr(exports, "SessionLocal", session_factory)
+    # 7件を2行ずつに分けて返させる
+    monkeypatch.setattr(exports, "CHUNK_ROWS", 2)
+
+
+def test_utf8_sig_writes_single_bom(costs_db):
+    chunks = list(exports.stream_costs_csv("yayoi", date(2025, 4, 1), date(2025, 5, 1), "utf-8-sig"))
+    assert len(chunks) > 2
+    content = b"".join(chunks)
+    assert content.startswith(b"\xef\xbb\xbf")
+    assert content.count(b"\xef\xbb\xbf") == 1
+
+    rows = list(csv.reader(StringIO(content.decode("utf-8-sig"))))
+    assert rows[0] == exports.FORMATS["yayoi"][0]
+    assert len(rows) == 8
+
+
+def test_shift_jis_chunks_decode_together(costs_db):
+    content = b"".join(exports.stream_costs_csv("freee", date(2025, 4, 1), date(2025, 5, 1), "shift_jis"))
+    rows = list(csv.reader(StringIO(content.decode("cp932"))))
+    assert rows[1][4] == "福岡建材"
+    assert len(rows) == 8
@@ -0,0 +1,26 @@
+"""
+PDFキャッシュの削除（pdf_cache.prune）のテスト
+"""
+import os
+import time
+
+import pdf_cache
+
+
+def test_prune_removes_only_unused_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_cache, "PDF_CACHE_DIR", str(tmp_path))
+    old_key, used_key, new_key = (pdf_cache.cache_key("quote", n) for n in range(3))
+    for key in (old_key, used_key, new_key):
+        pdf_cache.put(key, b"%PDF")
+    long_ago = time.time() - 40 * 86400
+    for key in (old_key, used_key):
+        os.utime(pdf_cache.path_for(key), (long_ago, long_ago))
+
+    # 使ったファイルは消さない
+    assert pdf_cache.get(used_key) == b"%PDF"
+    assert pdf_cache.prune(30) == 1
+
+    assert pdf_cache.get(old_key) is None
+    assert pdf_cache.get(used_key) == b"%PDF"
+    assert pdf_cache.get(new_key) == b"%PDF"
+    assert pdf_cache.prune(0) == 0
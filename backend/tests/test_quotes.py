@@ -0,0 +1,90 @@
+"""
+見積明細の差分保存（save_quote_items / update_quote）のテスト
+"""
+import pytest
+
+from main import create_quote, update_quote
+from models import QuoteItem
+
+
+def item(name, amount, **extra):
+    return {"name": name, "quantity": 1, "unit": "式", "unit_price": amount, "amount": amount, **extra}
+
+
+@pytest.fixture
+def db(session_factory):
+    with session_factory() as session:
+        yield session
+
+
+@pytest.fixture
+def quote_id(db):
+    """明細3行（A, B, C）の見積"""
+    items = [item("A", 100), item("B", 200), item("C", 300)]
+    return create_quote({"title": "舗装工事", "items": items}, db)["id"]
+
+
+def stored(db, quote_id):
+    """保存された明細の (id, seq, name, amount) を表示順に"""
+    db.expire_all()
+    rows = db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).order_by(QuoteItem.seq)
+    return [(row.id, row.seq, row.name, row.amount) for row in rows]
+
+
+def test_unchanged_items_write_nothing(db, quote_id):
+    before = stored(db, quote_id)
+    items = [item(name, amount, id=row_id) for row_id, _, name, amount in before]
+
+    result = update_quote(quote_id, {"items": items}, db)
+
+    assert result["items"] == {"inserted": 0, "updated": 0, "deleted": 0}
+    assert result["total"] == 660
+    assert stored(db, quote_id) == before
+
+
+def test_reorder_keeps_ids(db, quote_id):
+    (a, _, _, _), (b, _, _, _), (c, _, _, _) = stored(db, quote_id)
+    items = [item("C", 300, id=c), item("A", 100, id=a), item("B", 200, id=b)]
+
+    result = update_quote(quote_id, {"items": items}, db)
+
+    assert result["items"] == {"inserted": 0, "updated": 3, "deleted": 0}
+    assert stored(db, quote_id) == [(c, 0, "C", 300), (a, 1, "A", 100), (b, 2, "B", 200)]
+
+
+def test_delete_middle_item(db, quote_id):
+    (a, _, _, _), (b, _, _, _), (c, _, _, _) = stored(db, quote_id)
+    items = [item("A", 100, id=a), item("C", 300, id=c)]
+
+    result = update_quote(quote_id, {"items": items}, db)
+
+    # C は表示順が詰まるだけ
+    assert result["items"] == {"inserted": 0, "updated": 1, "deleted": 1}
+    assert result["total"] == 440
+    assert stored(db, quote_id) == [(a, 0, "A", 100), (c, 1, "C", 300)]
+    assert db.get(QuoteItem, b) is None
+
+
+def test_new_items_without_id(db, quote_id):
+    (a, _, _, _), (b, _, _, _), (c, _, _, _) = stored(db, quote_id)
+    items = [item("A", 100, id=a), item("B", 200, id=b), item("C", 300, id=c), item("D", 400), item("E", 500)]
+
+    result = update_quote(quote_id, {"items": items}, db)
+
+    assert result["items"] == {"inserted": 2, "updated": 0, "deleted": 0}
+    rows = stored(db, quote_id)
+    assert rows[:3] == [(a, 0, "A", 100), (b, 1, "B", 200), (c, 2, "C", 300)]
+    assert [(seq, name, amount) for _, seq, name, amount in rows[3:]] == [(3, "D", 400), (4, "E", 500)]
+    assert not {a, b, c} & {row_id for row_id, _, _, _ in rows[3:]}
+
+
+def test_items_without_id_match_by_position(db, quote_id):
+    (a, _, _, _), (b, _, _, _), (c, _, _, _) = stored(db, quote_id)
+    # id を送らない画面からの保存は、同じ表示順の行を更新する
+    items = [item("A", 100), item("B2", 250)]
+
+    result = update_quote(quote_id, {"items": items}, db)
+
+    assert result["items"] == {"inserted": 0, "updated": 1, "deleted": 1}
+    assert stored(db, quote_id) == [(a, 0, "A", 100), (b, 1, "B2", 250)]
+    assert db.get(QuoteItem, c) is None
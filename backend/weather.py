@@ -0,0 +1,309 @@
+"""
+天気予報の取得（Open-Meteo API使用・無料・APIキー不要）
+
+複数現場の予報は同時実行数を制限して並行取得し、
+タイムアウト・エラーになった現場は None として残りの結果だけ返す。
+
+予報は緯度経度を GRID_DEGREES 単位のメッシュに丸めて共有し、
+APIの daily（列ごとの配列）を weather_forecast_cache テーブルに保存、
+日別リストへの変換は取得・読込時に1回だけ行ってメモリ（TTL + LRU）に保持する。
+稼働中の現場はバックグラウンドで期限切れ前に取り直す。
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import chain, repeat
+import httpx
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi.concurrency import run_in_threadpool
+from http_client import get_client
+from cache import TTLCache, response_cache
+from database import SessionLocal, upsert_insert
+from models import WeatherForecastCache
+
+# テスト時はローカルのスタブサーバーを指定できる
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+FORECAST_DAYS = 14
+
+# 複数現場をまとめて取得するときの同時実行数と1件あたりのタイムアウト（秒）
+FETCH_CONCURRENCY = 8
+FETCH_TIMEOUT = 5.0
+
+# 予報を共有するメッシュの大きさ（度。0.05度 ≒ 5km）
+GRID_DEGREES = 0.05
+# 予報の有効期間と、稼働中現場の再取得間隔（秒。0で再取得しない）
+FORECAST_TTL = int(os.getenv("WEATHER_CACHE_TTL", 3 * 60 * 60))
+REFRESH_INTERVAL = int(os.getenv("WEATHER_REFRESH_INTERVAL", 30 * 60))
+
+_forecasts = TTLCache(maxsize=2048, ttl=FORECAST_TTL)
+
+
+class WeatherError(Exception):
+    pass
+
+
+# 天気コード（WMO）→ 天気情報
+WEATHER_CODES = {
+    0: {"icon": "☀️", "text": "快晴"},
+    1: {"icon": "🌤️", "text": "晴れ"},
+    2: {"icon": "⛅", "text": "薄曇り"},
+    3: {"icon": "☁️", "text": "曇り"},
+    45: {"icon": "🌫️", "text": "霧"},
+    48: {"icon": "🌫️", "text": "霧氷"},
+    51: {"icon": "🌧️", "text": "小雨"},
+    53: {"icon": "🌧️", "text": "雨"},
+    55: {"icon": "🌧️", "text": "強い雨"},
+    61: {"icon": "🌧️", "text": "弱い雨"},
+    63: {"icon": "🌧️", "text": "雨"},
+    65: {"icon": "🌧️", "text": "強い雨"},
+    71: {"icon": "🌨️", "text": "小雪"},
+    73: {"icon": "🌨️", "text": "雪"},
+    75: {"icon": "🌨️", "text": "大雪"},
+    80: {"icon": "🌦️", "text": "にわか雨"},
+    81: {"icon": "🌦️", "text": "にわか雨"},
+    82: {"icon": "🌧️", "text": "激しいにわか雨"},
+    95: {"icon": "⛈️", "text": "雷雨"},
+    96: {"icon": "⛈️", "text": "雷雨・雹"},
+    99: {"icon": "⛈️", "text": "激しい雷雨"},
+}
+UNKNOWN_WEATHER = {"icon": "❓", "text": "不明"}
+
+# Open-Meteo に要求する日別項目（保存もこの列のまま行う）
+DAILY_FIELDS = ("weather_code", "temperature_2m_max", "temperature_2m_min", "precipitation_probability_max")
+
+
+def compact_daily(daily: dict) -> dict:
+    """APIレスポンスの daily から使う列だけ残す（DB保存用）"""
+    return {key: daily.get(key, []) for key in ("time",) + DAILY_FIELDS}
+
+
+def parse_daily(daily: dict) -> list:
+    """Open-Meteo の daily（列ごとの配列）から日別の予報リストを作る"""
+    # 日付の数に合わせ、足りない列は天気コード0・その他None で埋める
+    columns = zip(
+        daily.get("time", []),
+        chain(daily.get("weather_code", []), repeat(0)),
+        chain(daily.get("temperature_2m_max", []), repeat(None)),
+        chain(daily.get("temperature_2m_min", []), repeat(None)),
+        chain(daily.get("precipitation_probability_max", []), repeat(None)),
+    )
+    forecasts = []
+    for day, code, temp_max, temp_min, precip_prob in columns:
+        weather = WEATHER_CODES.get(code, UNKNOWN_WEATHER)
+        forecasts.append({
+            "date": day,
+            "weather_code": code,
+            "icon": weather["icon"],
+            "text": weather["text"],
+            "temp_max": temp_max,
+            "temp_min": temp_min,
+            "precipitation_probability": precip_prob
+        })
+    return forecasts
+
+
+async def fetch_daily(lat: float, lon: float, timeout: float = None) -> dict:
+    """緯度経度の14日間予報（daily の列）を取得。取得できなければ WeatherError / httpx の例外"""
+    response = await get_client().get(
+        OPEN_METEO_URL,
+        params={
+            "latitude": lat,
+            "longitude": lon,
+            "daily": ",".join(DAILY_FIELDS),
+            "timezone": "Asia/Tokyo",
+            "forecast_days": FORECAST_DAYS,
+        },
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+    )
+    if response.status_code != 200:
+        raise WeatherError(f"天気情報を取得できませんでした（HTTP {response.status_code}）")
+    return compact_daily(response.json().get("daily", {}))
+
+
+async def fetch_forecast(lat: float, lon: float, timeout: float = None) -> list:
+    """緯度経度の14日間予報を取得（キャッシュなし）"""
+    return parse_daily(await fetch_daily(lat, lon, timeout))
+
+
+async def fetch_uncached(points, concurrency: int = None, timeout: float = None) -> dict:
+    """
+    複数地点の予報（daily の列）を並行取得して {(lat, lon): daily or None} を返す
+
+    同じ座標は1回だけ取得する。失敗・タイムアウトした地点は None。
+    """
+    timeout = timeout or FETCH_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency or FETCH_CONCURRENCY)
+    unique_points = list(dict.fromkeys(points))
+
+    async def fetch_one(point):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(fetch_daily(*point, timeout=timeout), timeout)
+            except (asyncio.TimeoutError, httpx.HTTPError, WeatherError, ValueError):
+                return None
+
+    results = await asyncio.gather(*(fetch_one(p) for p in unique_points))
+    return dict(zip(unique_points, results))
+
+
+# ---------- キャッシュ ----------
+
+def cell_of(lat: float, lon: float) -> str:
+    """緯度経度をメッシュの中心に丸めたキー"""
+    return f"{round(lat / GRID_DEGREES) * GRID_DEGREES:.2f},{round(lon / GRID_DEGREES) * GRID_DEGREES:.2f}"
+
+
+def _cell_point(cell: str) -> tuple:
+    lat, lon = cell.split(",")
+    return float(lat), float(lon)
+
+
+def _load_cells(cells) -> dict:
+    """DBから有効期限内の予報を取得 {cell: (予報, 取得日時)}"""
+    since = datetime.now() - timedelta(seconds=FORECAST_TTL)
+    with SessionLocal() as db:
+        rows = db.query(WeatherForecastCache).filter(
+            WeatherForecastCache.cell.in_(list(cells)),
+            WeatherForecastCache.fetched_at > since
+        ).all()
+        return {r.cell: (parse_daily(json.loads(r.forecasts)), r.fetched_at) for r in rows}
+
+
+def _save_cells(forecasts: dict, fetched_at: datetime):
+    """
+    取得した予報をDBに保存 {cell: daily}
+
+    起動直後はバックグラウンド更新と画面からの取得が同じメッシュを同時に保存するため upsert にする。
+    保存に失敗しても取得済みの予報は返せるので、ログだけ出す。
+    """
+    rows = []
+    for cell, data in forecasts.items():
+        lat, lon = _cell_point(cell)
+        rows.append({
+            "cell": cell, "latitude": lat, "longitude": lon,
+            "forecasts": json.dumps(data, ensure_ascii=False), "fetched_at": fetched_at,
+        })
+    try:
+        with SessionLocal() as db:
+            stmt = upsert_insert(db.get_bind(), WeatherForecastCache).values(rows)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["cell"],
+                set_={"forecasts": stmt.excluded.forecasts, "fetched_at": stmt.excluded.fetched_at},
+            ))
+            db.commit()
+    except SQLAlchemyError as e:
+        print(f"天気予報キャッシュの保存に失敗しました: {e}")
+
+
+def _remember(cell: str, data: list, fetched_at: datetime):
+    remaining = FORECAST_TTL - (datetime.now() - fetched_at).total_seconds()
+    if remaining > 0:
+        _forecasts.set(("forecast", cell), data, ttl=remaining)
+
+
+async def _resolve_cells(cells, force: bool = False) -> dict:
+    """メッシュごとの予報を メモリ → DB → API の順に取得 {cell: 予報 or None}"""
+    result = {}
+    missing = []
+    for cell in dict.fromkeys(cells):
+        data = None if force else _forecasts.get(("forecast", cell))
+        if data is None:
+            missing.append(cell)
+        else:
+            result[cell] = data
+
+    if missing and not force:
+        for cell, (data, fetched_at) in (await run_in_threadpool(_load_cells, missing)).items():
+            _remember(cell, data, fetched_at)
+            result[cell] = data
+        missing = [c for c in missing if c not in result]
+
+    if missing:
+        fetched = await fetch_uncached([_cell_point(c) for c in missing])
+        fetched_at = datetime.now()
+        new = {}
+        for cell in missing:
+            daily = fetched.get(_cell_point(cell))
+            result[cell] = None
+            if daily is not None:
+                new[cell] = daily
+                result[cell] = parse_daily(daily)
+                _remember(cell, result[cell], fetched_at)
+        if new:
+            await run_in_threadpool(_save_cells, new, fetched_at)
+            response_cache.invalidate("projects_with_weather")
+    return result
+
+
+async def get_forecast(lat: float, lon: float) -> list:
+    """1地点の予報（キャッシュ優先）。取得できなければ例外"""
+    cell = cell_of(lat, lon)
+    data = _forecasts.get(("forecast", cell))
+    if data is not None:
+        return data
+    loaded = await run_in_threadpool(_load_cells, [cell])
+    if cell in loaded:
+        data, fetched_at = loaded[cell]
+        _remember(cell, data, fetched_at)
+        return data
+
+    daily = await fetch_daily(*_cell_point(cell))
+    fetched_at = datetime.now()
+    data = parse_daily(daily)
+    _remember(cell, data, fetched_at)
+    await run_in_threadpool(_save_cells, {cell: daily}, fetched_at)
+    response_cache.invalidate("projects_with_weather")
+    return data
+
+
+async def fetch_forecasts(points) -> dict:
+    """複数地点の予報（キャッシュ優先） {(lat, lon): 予報 or None}"""
+    cells = {p: cell_of(*p) for p in points}
+    by_cell = await _resolve_cells(cells.values())
+    return {p: by_cell.get(c) for p, c in cells.items()}
+
+
+# ---------- バックグラウンド更新 ----------
+
+def _expiring_cells(cells, within: float) -> list:
+    """within 秒以内に期限切れになる（またはDBにない）メッシュ"""
+    fresh_since = datetime.now() - timedelta(seconds=FORECAST_TTL - within)
+    with SessionLocal() as db:
+        fresh = {
+            c for (c,) in db.query(WeatherForecastCache.cell).filter(
+                WeatherForecastCache.cell.in_(list(cells)),
+                WeatherForecastCache.fetched_at > fresh_since
+            )
+        }
+    return [c for c in cells if c not in fresh]
+
+
+async def refresh(points):
+    """指定地点のうち次回の更新までに期限切れになるメッシュを取り直す"""
+    cells = list(dict.fromkeys(cell_of(*p) for p in points))
+    if not cells:
+        return []
+    expiring = await run_in_threadpool(_expiring_cells, cells, REFRESH_INTERVAL * 1.5)
+    if expiring:
+        await _resolve_cells(expiring, force=True)
+    return expiring
+
+
+async def _refresh_loop(load_points):
+    while True:
+        try:
+            points = await run_in_threadpool(load_points)
+            await refresh(points)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"天気予報の更新に失敗しました: {e}")
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def start_refresher(load_points):
+    """稼働中現場の予報を定期更新するタスクを開始（load_points は [(lat, lon)] を返す同期関数）"""
+    if REFRESH_INTERVAL <= 0:
+        return None
+    return asyncio.create_task(_refresh_loop(load_points))
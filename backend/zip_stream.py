@@ -0,0 +1,49 @@
+"""
+zipアーカイブを少しずつ作って送信する
+
+ファイルを追加するたびに、その分のバイト列（ローカルヘッダー＋データ）を返す。
+出力先をシークしないため、全体をメモリやディスクに溜めずに StreamingResponse で送れる。
+"""
+import zipfile
+from datetime import datetime
+
+
+class _Buffer:
+    """ZipFile の書き込み先。書かれた分を drain() で取り出す（シーク不可）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    def __init__(self):
+        self._buffer = _Buffer()
+        self._zip = zipfile.ZipFile(self._buffer, mode="w")
+
+    def add(self, name: str, data: bytes, compress: bool = False) -> bytes:
+        """
+        ファイルを追加して、送信するバイト列を返す
+
+        xlsx 等の圧縮済みの形式は compress=False（無圧縮で格納）でよい。
+        """
+        info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(info, data)
+        return self._buffer.drain()
+
+    def close(self) -> bytes:
+        """目次（セントラルディレクトリ）を書いて、最後に送信するバイト列を返す"""
+        self._zip.close()
+        return self._buffer.drain()